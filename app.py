@@ -1,118 +1,998 @@
 """Flask web app exposing posture dashboard APIs."""
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import json
 import os
-from typing import Any, Dict
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Tuple
 
-from flask import Flask, jsonify, render_template, request
+from flask import (
+    Flask,
+    Response,
+    g,
+    jsonify,
+    render_template,
+    request,
+    stream_with_context,
+)
 from pymongo import ASCENDING, DESCENDING
-from pymongo.errors import OperationFailure
 from dotenv import load_dotenv
 
+try:  # optional: much faster encoding of large series payloads
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib encoder
+    orjson = None
+
 import db
+from db import export
+from machine_learning_client import telemetry
+from machine_learning_client import segments
+from machine_learning_client.detector import SlouchDetector
 
 load_dotenv()
 
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
 MONGO_DB = os.getenv("MONGO_DB", "posture")
-SLOUCH_THRESHOLD = float(os.getenv("", "0.6"))
+SLOUCH_THRESHOLD = float(os.getenv("SLOUCH_THRESHOLD", "0.6"))
+# Upper bound on samples accepted by a single bulk ingest request.
+MAX_INGEST_BATCH = int(os.getenv("MAX_INGEST_BATCH", "1000"))
+# Upper bound on points returned by /api/metrics?max_points=.
+MAX_SERIES_POINTS = 5000
+# Seconds of ingestion re-read behind an /api/metrics cursor, so writes
+# committed a little out of ``ingested_at`` order are not skipped.
+SERIES_CURSOR_OVERLAP = float(os.getenv("SERIES_CURSOR_OVERLAP", "10"))
+_DURATION_UNITS_MS = {"ms": 1, "s": 1000, "m": 60_000, "h": 3_600_000}
+# Seconds a cached /api/latest may be served when other processes could be
+# writing samples that this one does not see (no change stream running).
+LATEST_CACHE_TTL = float(os.getenv("LATEST_CACHE_TTL", "1.0"))
+# Store samples as run-length segments instead of one document each.
+COMPRESS_SAMPLES = segments.COMPRESSION
+# Default pose estimations per second in the dashboard (?fps= overrides).
+INFERENCE_FPS = float(os.getenv("INFERENCE_FPS", "10"))
+# Seconds between SSE keep-alive comments on an idle /api/stream.
+STREAM_KEEPALIVE = float(os.getenv("STREAM_KEEPALIVE", "15"))
+# Concurrent /api/stream connections per process (0: no limit). Each holds a
+# request thread, so gunicorn.conf.py sets it below GUNICORN_THREADS; past it
+# the stream answers 503 and the dashboard polls instead.
+STREAM_MAX_SUBSCRIBERS = int(os.getenv("STREAM_MAX_SUBSCRIBERS", "0"))
+# Entries kept in each per-tenant map (latest caches, event detectors, open
+# segments, stream hubs). Tenants come from the client, so past this the
+# least recently used are dropped; hubs with open streams are kept.
+MAX_TENANT_ENTRIES = int(os.getenv("MAX_TENANT_ENTRIES", "10000"))
+# Request header naming the tenant (user or session) whose data a request
+# reads and writes; ?user= is accepted too, since EventSource cannot send
+# headers. Requests without either use the anonymous tenant. The value is
+# trusted as given: deployments with accounts set it in an auth proxy.
+TENANT_HEADER = os.getenv("TENANT_HEADER", "X-Posture-User")
+# Seconds between refreshes of the hourly/daily reports (0: no background job).
+HISTORY_REFRESH_SECONDS = float(os.getenv("HISTORY_REFRESH_SECONDS", "60"))
+# Reports only fold data older than this, so in-flight writes land first.
+HISTORY_LAG_SECONDS = float(os.getenv("HISTORY_LAG_SECONDS", "10"))
+# Upper bound on buckets returned by one /api/history request.
+MAX_HISTORY_BUCKETS = 10_000
+_GRAIN_SPANS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+# Rows per NDJSON/CSV chunk (and MongoDB cursor batch) and per Parquet row
+# group / Arrow record batch in /api/export.
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+EXPORT_ROW_GROUP = int(os.getenv("EXPORT_ROW_GROUP", "50000"))
 
 
 app = Flask(__name__)
 app.config["KEY"] = os.getenv("KEY", "change-me")
 
+REQUEST_SECONDS = telemetry.Histogram(
+    "posture_http_request_seconds",
+    "Time to produce a response (stream bodies excluded).",
+    ("route", "method", "status"),
+)
+
+
+# Endpoints that never wait for the first connection: probes must answer
+# even while MongoDB is unreachable (/api/ready pings on its own).
+_DB_FREE_ENDPOINTS = {"api_health", "api_ready", "prometheus_metrics", "static"}
+# Seconds before retrying a failed first connection; doubles up to the max.
+CONNECT_BACKOFF = (1.0, 60.0)
+connect_retry = {"at": 0.0, "delay": CONNECT_BACKOFF[0]}
+_connect_lock = threading.Lock()
+
+
+@app.before_request
+def _ensure_database():
+    """Connect and migrate on the first request, not at import.
+
+    One request at a time tries; after a failure the others skip the
+    attempt until the backoff expires, so an unreachable cluster does not
+    add a server-selection timeout to every request.
+    """
+    if db.schema["migrated"] or db.use_fake or request.endpoint in _DB_FREE_ENDPOINTS:
+        return
+    if time.monotonic() < connect_retry["at"]:
+        return
+    # pylint: disable-next=consider-using-with
+    if not _connect_lock.acquire(blocking=False):
+        return
+    try:
+        if db.ensure_ready():
+            connect_retry["delay"] = CONNECT_BACKOFF[0]
+        else:
+            connect_retry["at"] = time.monotonic() + connect_retry["delay"]
+            connect_retry["delay"] = min(connect_retry["delay"] * 2, CONNECT_BACKOFF[1])
+    finally:
+        _connect_lock.release()
+
+
+@app.before_request
+def _start_request_timer():
+    if telemetry.ENABLED:
+        g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _observe_request(response: Response) -> Response:
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            route,
+            request.method,
+            str(response.status_code),
+        )
+    return response
+
 
 # --- Helpers ---
 def _iso(dt: datetime) -> str:
     return dt.replace(microsecond=0).isoformat() + "Z"
 
 
-# Indexes (created once at startup). In test/CI environments without a
-# real MongoDB user, index creation may fail; ignore such errors so
-# tests can run against a stubbed or unauthenticated database.
-try:
-    db.samples.create_index([("ts", DESCENDING)])
-    db.events.create_index([("ts", DESCENDING)])
-except OperationFailure as exc:  # pragma: no cover
-    print(exc)
+def _parse_ts(value: Any, default: datetime | None) -> datetime | None:
+    """Parse an ISO-8601 string or epoch milliseconds into naive UTC."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return datetime.fromtimestamp(value / 1000.0, tz=timezone.utc).replace(
+                tzinfo=None
+            )
+        except (OverflowError, OSError, ValueError):
+            return default
+    if isinstance(value, str) and value:
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return default
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    return default
+
+
+def _int_arg(name: str, default: int) -> int:
+    try:
+        return int(request.args.get(name, default))
+    except ValueError:
+        return default
+
+
+def _parse_duration_ms(value: str) -> int | None:
+    """Parse ``500ms``/``5s``/``1m``/``1h`` (bare numbers are seconds)."""
+    value = value.strip().lower()
+    for unit in ("ms", "s", "m", "h"):
+        if value.endswith(unit):
+            number, scale = value[: -len(unit)], _DURATION_UNITS_MS[unit]
+            break
+    else:
+        number, scale = value, 1000
+    try:
+        ms = int(float(number) * scale)
+    except ValueError:
+        return None
+    return ms if ms > 0 else None
+
+
+def _triangle_area(a, b, c) -> float:
+    return abs((a[0] - c[0]) * (b[1] - a[1]) - (a[0] - b[0]) * (c[1] - a[1]))
+
+
+def _lttb(xs: List[int], ys: List[float], threshold: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets downsampling; returns the kept indices."""
+    n = len(xs)
+    if threshold >= n:
+        return list(range(n))
+    if threshold < 3:
+        # Too few points for a middle bucket: keep the ends (or the latest).
+        return [0, n - 1] if threshold == 2 else [n - 1]
+
+    xy = list(zip(xs, ys))
+    sampled = [0]
+    every = (n - 2) / (threshold - 2)
+    for i in range(threshold - 2):
+        nxt = xy[int((i + 1) * every) + 1 : min(int((i + 2) * every) + 1, n)]
+        avg = (sum(x for x, _ in nxt) / len(nxt), sum(y for _, y in nxt) / len(nxt))
+        prev = xy[sampled[-1]]
+        best, best_area = -1, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = _triangle_area(prev, xy[j], avg)
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(best)
+    sampled.append(n - 1)
+    return sampled
+
+
+def _json_response(body: Any, status: int = 200) -> Response:
+    """JSON response encoded with orjson when it is installed."""
+    if orjson is not None:
+        data = orjson.dumps(body)  # pylint: disable=no-member
+    else:
+        data = json.dumps(body, separators=(",", ":"))
+    return Response(data, status=status, mimetype="application/json")
+
+
+def _tenant() -> str | None:
+    """The request's tenant, or None for the anonymous one."""
+    user = request.headers.get(TENANT_HEADER) or request.args.get("user") or ""
+    return user.strip() or None
+
+
+def _scope() -> Dict[str, Any]:
+    """Mongo filter for the request's tenant and ``?source=``.
+
+    ``user: None`` also matches documents without a ``user`` field, so
+    anonymous requests see data written before tenants existed.
+    """
+    match: Dict[str, Any] = {"user": _tenant()}
+    source = request.args.get("source")
+    if source:
+        match["source_id"] = source
+    return match
+
+
+def _with_source(doc: Dict[str, Any], source_id: Any) -> Dict[str, Any]:
+    if source_id is not None:
+        doc["source_id"] = str(source_id)
+    return doc
+
+
+def _with_tenant(doc: Dict[str, Any], user: str | None) -> Dict[str, Any]:
+    if user is not None:
+        doc["user"] = user
+    return doc
+
+
+def _sample_doc(
+    payload: Dict[str, Any],
+    ts: datetime,
+    source_id: Any = None,
+    user: str | None = None,
+) -> Dict[str, Any]:
+    p = float(payload.get("slouch_prob", 0.0))
+    label = "slouch" if p >= SLOUCH_THRESHOLD else "good"
+    doc = _with_tenant({"ts": ts, "slouch_prob": p, "label": label}, user)
+    return _with_source(doc, payload.get("source_id", source_id))
+
+
+def _by_tenant(docs: List[Dict[str, Any]]) -> Dict[str | None, List[Dict[str, Any]]]:
+    groups: Dict[str | None, List[Dict[str, Any]]] = {}
+    for doc in docs:
+        groups.setdefault(doc.get("user"), []).append(doc)
+    return groups
+
+
+def _sample_json(doc: Dict[str, Any]) -> Dict[str, Any]:
+    p = float(doc.get("slouch_prob", 0))
+    out = {
+        "ts": _iso(doc["ts"]),
+        "slouch_prob": p,
+        "label": doc.get("label", "unknown"),
+        "is_slouch": p >= SLOUCH_THRESHOLD,
+    }
+    return _with_source(out, doc.get("source_id"))
+
+
+def _event_json(doc: Dict[str, Any]) -> Dict[str, Any]:
+    out = {
+        "ts": _iso(doc["ts"]),
+        "type": doc.get("type"),
+        "prob": float(doc.get("prob", 0)),
+    }
+    return _with_source(out, doc.get("source_id"))
+
+
+# --- Live stream ---
+# One broadcaster per tenant: frames are encoded once and shared by that
+# tenant's /api/stream subscribers only.
+broadcasters = db.LRUMap(MAX_TENANT_ENTRIES, lambda hub: hub.subscriber_count > 0)
+
+
+def _broadcaster(user: str | None) -> Any:
+    found = broadcasters.get(user)
+    if found is None:
+        found = broadcasters.setdefault(user, db.Broadcaster())
+    return found
+
+
+# The anonymous tenant's.
+broadcaster = _broadcaster(None)
+stream_slots = (
+    threading.BoundedSemaphore(STREAM_MAX_SUBSCRIBERS)
+    if STREAM_MAX_SUBSCRIBERS > 0
+    else None
+)
+
+
+def _sse(kind: str, payload: Any) -> str:
+    return f"event: {kind}\ndata: {json.dumps(payload)}\n\n"
+
+
+def _broadcast_samples(docs: List[Dict[str, Any]]) -> None:
+    for user, group in _by_tenant(docs).items():
+        hub = broadcasters.get(user)
+        if hub is None or not hub.subscriber_count:
+            continue
+        samples = [_sample_json(d) for d in group]
+        hub.publish(_sse("samples", samples))
+        hub.publish(_sse("latest", max(samples, key=lambda s: s["ts"])))
+
+
+def _broadcast_event(doc: Dict[str, Any]) -> None:
+    hub = broadcasters.get(doc.get("user"))
+    if hub is not None and hub.subscriber_count:
+        hub.publish(_sse("event", _event_json(doc)))
+
+
+def _render_latest(doc: Dict[str, Any] | None) -> bytes:
+    if not doc:
+        return json.dumps({"ok": True, "latest": None}).encode()
+    body = {"ok": True, "latest": _sample_json(doc), "threshold": SLOUCH_THRESHOLD}
+    return json.dumps(body).encode()
+
+
+# Write-through caches keyed by (user, source_id): per tenant, one for all
+# of its sources (source_id None) plus one per source.
+CacheKey = Tuple[str | None, str | None]
+latest_caches = db.LRUMap(MAX_TENANT_ENTRIES)
+
+
+def _latest_cache(key: CacheKey) -> Any:
+    cache = latest_caches.get(key)
+    if cache is None:
+        cache = latest_caches.setdefault(key, db.LatestCache(_render_latest))
+    return cache
+
+
+def _offer_latest(docs: List[Dict[str, Any]]) -> None:
+    newest: Dict[CacheKey, Dict[str, Any]] = {}
+    for doc in docs:
+        user = doc.get("user")
+        for key in ((user, None), (user, doc.get("source_id"))):
+            if key not in newest or doc["ts"] >= newest[key]["ts"]:
+                newest[key] = doc
+    for key, doc in newest.items():
+        cache = latest_caches.get(key)
+        if cache is not None:
+            cache.offer(doc)
+
+
+def _on_change(collection: str, doc: Dict[str, Any]) -> None:
+    if collection == "samples":
+        _offer_latest([doc])
+        _broadcast_samples([doc])
+    else:
+        _broadcast_event(doc)
+
+
+# Inserts into a time-series samples collection never reach change streams.
+change_feed = db.ChangeStreamFeed(db.db, ["samples", "events"], _on_change)
+
+
+def _streamed_tenants() -> List[str | None]:
+    return [user for user, hub in broadcasters.items() if hub.subscriber_count]
+
+
+# Polls for what the change stream misses: every sample once the samples
+# collection is time-series, everything when the server cannot open one. A
+# segment grows in place after it is stamped, so segments cannot be tailed;
+# /api/stream tells the dashboard to keep polling instead.
+insert_tail = db.InsertTailer(
+    db.db,
+    ["events"] if COMPRESS_SAMPLES else ["samples", "events"],
+    _on_change,
+    scope=_streamed_tenants,
+    skip=change_feed.covers,
+)
+
+
+def _start_change_feed() -> None:
+    if db.ensure_ready() and db.schema["timeseries"]:
+        change_feed.collections = ["events"]
+    change_feed.start()
+    insert_tail.start()
+
+
+def _relayed(collection: str) -> bool:
+    """True while ``collection`` inserts reach stream subscribers without
+    the ingest hooks publishing them."""
+    return change_feed.covers(collection) or insert_tail.covers(collection)
+
+
+def _publish_samples(docs: List[Dict[str, Any]]) -> None:
+    """Ingest hook: offer the samples to the latest caches and, unless a
+    change stream or the insert tail relays them, push them to stream
+    subscribers."""
+    _offer_latest(docs)
+    # Unlabelled (an empty label is no label to Prometheus): source_id comes
+    # from the request body, and each new value would add a series for good.
+    telemetry.SAMPLES_INGESTED.inc(None, amount=len(docs))
+    if not _relayed("samples"):
+        _broadcast_samples(docs)
+
+
+def _publish_event(doc: Dict[str, Any]) -> None:
+    if not _relayed("events"):
+        _broadcast_event(doc)
 
 
 # --- Web pages ---
 @app.get("/")
 def index():
     """Serve the dashboard page."""
-    return render_template("index.html", slouch_threshold=SLOUCH_THRESHOLD)
+    return render_template(
+        "index.html",
+        slouch_threshold=SLOUCH_THRESHOLD,
+        inference_fps=INFERENCE_FPS,
+    )
+
+
+# --- Health ---
+@app.get("/api/health")
+def api_health():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"ok": True})
+
+
+@app.get("/api/ready")
+def api_ready():
+    """Readiness: the database answers (503 until it does)."""
+    ready = db.ensure_ready()
+    body = {"ok": ready, "backend": "memory" if db.use_fake else "mongodb"}
+    return jsonify(body), 200 if ready else 503
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Request, MongoDB and ingest metrics in the Prometheus text format."""
+    return Response(telemetry.render(), content_type=telemetry.CONTENT_TYPE)
 
 
 # --- APIs for UI ---
 @app.get("/api/latest")
 def api_latest():
-    """Return the latest posture sample."""
-    doc = db.samples.find_one(sort=[("ts", DESCENDING)])
-    if not doc:
-        return jsonify({"ok": True, "latest": None})
-    latest = {
-        "ts": _iso(doc["ts"]),
-        "slouch_prob": float(doc.get("slouch_prob", 0)),
-        "label": doc.get("label", "unknown"),
-        "is_slouch": float(doc.get("slouch_prob", 0)) >= SLOUCH_THRESHOLD,
+    """Return the tenant's latest posture sample (of ?source= if given).
+
+    Served from a write-through cache with an ETag, so unchanged polls get a
+    bodiless 304 without touching the database.
+    """
+    match = _scope()
+    # Every sample passes through this process's ingest hooks in fake mode,
+    # and through the change stream when it is running; otherwise expire.
+    ttl = None if db.use_fake or change_feed.covers("samples") else LATEST_CACHE_TTL
+    etag, body = _latest_cache((match["user"], match.get("source_id"))).get(
+        lambda: _find_latest(match), ttl
+    )
+    if etag in request.if_none_match:
+        res = Response(status=304)
+    else:
+        res = Response(body, mimetype="application/json")
+    res.set_etag(etag)
+    res.headers["Cache-Control"] = "no-cache"
+    return res
+
+
+def _find_latest(match: Dict[str, Any]) -> Dict[str, Any] | None:
+    if COMPRESS_SAMPLES:
+        return db.latest_segment(db.segments, match)
+    return db.samples.find_one(match, sort=[("ts", DESCENDING)])
+
+
+def _parse_cursor(value: str | None) -> datetime | None:
+    """Decode an ``after`` cursor (as returned by /api/metrics or epoch ms)."""
+    if not value:
+        return None
+    if value.isdigit():
+        return _parse_ts(int(value), None)
+    return _parse_ts(value, None)
+
+
+def _cursor(dt: datetime) -> str:
+    # Full precision, like the ``ingested_at`` stamps it is compared with.
+    return dt.isoformat() + "Z"
+
+
+def _series_changes(
+    after: datetime | None, since: datetime, match: Dict[str, Any]
+) -> Tuple[datetime | None, datetime]:
+    """Where the series changed since the cursor ``after`` and the next cursor.
+
+    The change starts at the earliest ``ts`` (not before ``since``) of the
+    documents stamped within ``SERIES_CURSOR_OVERLAP`` seconds before the
+    cursor or later, wherever in the window a late write landed; None when
+    there are none. The cursor is the newest ``ingested_at`` seen. Open
+    segments keep growing after they are stamped, so they are re-read until
+    they close.
+    """
+    source, in_window = db.samples, {"ts": {"$gte": since}}
+    if COMPRESS_SAMPLES:
+        source, in_window = db.segments, {"end": {"$gte": since}}
+    if after is None:
+        newest = source.find_one(
+            {**match, **in_window, "ingested_at": {"$gt": db.EPOCH}},
+            sort=[("ingested_at", DESCENDING)],
+        )
+        return since, newest["ingested_at"] if newest else since
+    stamped = after - timedelta(seconds=SERIES_CURSOR_OVERLAP)
+    if COMPRESS_SAMPLES:
+        still_open = datetime.utcnow() - timedelta(seconds=segments.MAX_SECONDS)
+        stamped = min(stamped, still_open)
+    start, mark = None, after
+    query = {**match, **in_window, "ingested_at": {"$gt": stamped}}
+    for doc in source.find(query, {"ts": 1, "ingested_at": 1, "_id": 0}):
+        start = doc["ts"] if start is None else min(start, doc["ts"])
+        mark = max(mark, doc["ingested_at"])
+    return (max(start, since) if start else None), mark
+
+
+# Series are built as columns: "ts" (epoch ms) and "p" (slouch_prob), plus
+# "max", "count" and "slouch_frac" per bucket in bucket mode.
+_SERIES_ROW_KEYS = {
+    "p": "slouch_prob",
+    "max": "max",
+    "count": "count",
+    "slouch_frac": "slouch_frac",
+}
+
+
+def _bucketed_series(
+    since: datetime, bucket_ms: int, match: Dict[str, Any]
+) -> Dict[str, List[Any]]:
+    cols: Dict[str, List[Any]] = {
+        "ts": [],
+        "p": [],
+        "max": [],
+        "count": [],
+        "slouch_frac": [],
     }
-    return jsonify({"ok": True, "latest": latest, "threshold": SLOUCH_THRESHOLD})
+    if COMPRESS_SAMPLES:
+        buckets = db.bucket_segments(
+            db.segments, since, bucket_ms, SLOUCH_THRESHOLD, match
+        )
+    else:
+        buckets = db.bucket_samples(
+            db.samples, since, bucket_ms, SLOUCH_THRESHOLD, match
+        )
+    for b in buckets:
+        cols["ts"].append(b["_id"])
+        cols["p"].append(float(b["mean"]))
+        cols["max"].append(float(b["max"]))
+        cols["count"].append(int(b["count"]))
+        cols["slouch_frac"].append(b["slouch"] / b["count"])
+    return cols
+
+
+def _raw_series(
+    ts_query: Dict[str, datetime], match: Dict[str, Any]
+) -> Dict[str, List[Any]]:
+    """Raw samples as columns."""
+    if COMPRESS_SAMPLES:
+        cur = db.segment_points(db.segments, ts_query, match)
+    else:
+        cur = db.samples.find(
+            {**match, "ts": ts_query}, {"ts": 1, "slouch_prob": 1, "_id": 0}
+        ).sort("ts", ASCENDING)
+    ts: List[int] = []
+    probs: List[float] = []
+    epoch, one_ms = db.EPOCH, timedelta(milliseconds=1)
+    for doc in cur:
+        ts.append((doc["ts"] - epoch) // one_ms)
+        probs.append(float(doc.get("slouch_prob", 0)))
+    return {"ts": ts, "p": probs}
+
+
+def _series_rows(cols: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    keys = [(k, _SERIES_ROW_KEYS[k]) for k in cols if k != "ts"]
+    return [
+        {"ts": _iso(db.from_epoch_ms(t)), **{name: cols[k][i] for k, name in keys}}
+        for i, t in enumerate(cols["ts"])
+    ]
 
 
 @app.get("/api/metrics")
 def api_metrics():
-    """Return time-series samples since ?minutes= (default 30)."""
-    try:
-        minutes = int(request.args.get("minutes", 30))
-    except ValueError:
-        minutes = 30
+    """Return time-series samples since ?minutes= (default 30), optionally
+    only for ?source=.
+
+    ``?bucket=5s`` aggregates samples into fixed windows (mean, max and
+    slouch fraction per bucket). ``?max_points=N`` downsamples the raw or
+    bucketed series with LTTB so the payload stays bounded.
+    ``?format=columnar`` returns parallel arrays (``ts`` in epoch ms, ``p``
+    and in bucket mode ``max``/``count``/``slouch_frac``) instead of a list
+    of ``series`` rows.
+
+    Every response carries a ``cursor`` (an ``ingested_at`` stamp); passing
+    it back as ``?after=`` returns the series from the earliest sample
+    written since, even one with an older ``ts`` (a batched or replayed
+    write), and in bucket mode from the start of its bucket. Rows from the
+    last ``SERIES_CURSOR_OVERLAP`` seconds of writes are re-sent too, so
+    clients replace the rows (or buckets) they have with the same ``ts``.
+    """
+    minutes = _int_arg("minutes", 30)
+    max_points = min(max(_int_arg("max_points", 0), 0), MAX_SERIES_POINTS)
 
     since = datetime.utcnow() - timedelta(minutes=minutes)
+    after = _parse_cursor(request.args.get("after"))
+    if after is not None and after < since:
+        after = None
+    bucket_ms = _parse_duration_ms(request.args.get("bucket", ""))
+    match = _scope()
 
-    cur = db.samples.find({"ts": {"$gte": since}}).sort("ts", ASCENDING)
-    series = [
-        {"ts": _iso(d["ts"]), "slouch_prob": float(d.get("slouch_prob", 0))}
-        for d in cur
-    ]
-    return jsonify({"ok": True, "series": series, "since": _iso(since)})
+    start, mark = _series_changes(after, since, match)
+    if start is None:
+        cols: Dict[str, List[Any]] = {"ts": [], "p": []}
+        if bucket_ms:
+            cols.update(max=[], count=[], slouch_frac=[])
+    elif bucket_ms:
+        if after is not None:
+            start_ms = db.epoch_ms(start)
+            start = db.from_epoch_ms(start_ms - start_ms % bucket_ms)
+        cols = _bucketed_series(start, bucket_ms, match)
+    else:
+        cols = _raw_series({"$gte": start}, match)
+
+    if max_points and len(cols["ts"]) > max_points:
+        keep = _lttb(cols["ts"], cols["p"], max_points)
+        cols = {k: [v[i] for i in keep] for k, v in cols.items()}
+
+    body: Dict[str, Any] = {
+        "ok": True,
+        "since": _iso(since),
+        "cursor": _cursor(mark),
+    }
+    if request.args.get("format") == "columnar":
+        body["format"] = "columnar"
+        body.update(cols)
+    else:
+        body["series"] = _series_rows(cols)
+    if bucket_ms:
+        body["bucket_ms"] = bucket_ms
+    return _json_response(body)
 
 
 @app.get("/api/events")
 def api_events():
-    """Return recent posture events."""
+    """Return the tenant's recent posture events (of ?source= if given)."""
     limit = min(int(request.args.get("limit", 25)), 200)
-    cur = db.events.find().sort("ts", DESCENDING).limit(limit)
-    events = [
-        {"ts": _iso(d["ts"]), "type": d.get("type"), "prob": float(d.get("prob", 0))}
-        for d in cur
+    cur = db.events.find(_scope(), {"_id": 0}).sort("ts", DESCENDING).limit(limit)
+    events = [_event_json(d) for d in cur]
+    return _json_response({"ok": True, "events": events})
+
+
+@app.get("/api/summary")
+def api_summary():
+    """Return slouch/good split and streaks over ?minutes= from the history
+    reports' minute buckets and the samples ingested since their last
+    refresh, whichever process wrote them."""
+    history_job.start()
+    minutes = max(_int_arg("minutes", 30), 1)
+    now = datetime.utcnow()
+    since = now - timedelta(minutes=minutes)
+    source = db.segments if COMPRESS_SAMPLES else db.samples
+    summary = db.history.summary(source, _tenant(), since, now, SLOUCH_THRESHOLD)
+    return jsonify({"ok": True, "minutes": minutes, **summary})
+
+
+def refresh_history(now: datetime | None = None) -> int:
+    """Fold samples and events ingested since the last refresh (whatever
+    their ``ts``) into the hourly/daily reports; returns the number of
+    samples folded."""
+    until = (now or datetime.utcnow()) - timedelta(seconds=HISTORY_LAG_SECONDS)
+    if not COMPRESS_SAMPLES:
+        return db.history.refresh(db.samples, db.events, until, SLOUCH_THRESHOLD)
+    # Segments are stamped when they open; one opened max_seconds ago can
+    # no longer grow.
+    span = timedelta(seconds=segments.MAX_SECONDS)
+    return db.history.refresh(
+        db.segments, db.events, until - span, SLOUCH_THRESHOLD, span
+    )
+
+
+history_job = db.PeriodicJob(refresh_history, HISTORY_REFRESH_SECONDS, "history")
+
+
+def _time_arg(name: str, default: datetime) -> datetime | None:
+    """``?name=`` as ISO-8601 or epoch ms; None when it does not parse."""
+    value = request.args.get(name)
+    if not value:
+        return default
+    return _parse_ts(int(value) if value.isdigit() else value, None)
+
+
+@app.get("/api/history")
+def api_history():
+    """Return the tenant's hourly or daily posture reports.
+
+    ``?from=``/``?to=`` are ISO-8601 or epoch ms (default: the 7 days up to
+    now) and ``?granularity=`` is ``hour`` (default) or ``day``. Buckets
+    overlapping the range are returned whole, with slouch and good seconds,
+    sample and event counts and the longest streak, plus their ``totals``.
+    Reports are precomputed by a background job and cover data up to
+    ``watermark`` (null until its first run).
+    """
+    history_job.start()
+    grain = request.args.get("granularity", "hour")
+    if grain not in _GRAIN_SPANS:
+        return jsonify({"ok": False, "error": "granularity must be hour or day"}), 400
+    end = _time_arg("to", datetime.utcnow())
+    start = _time_arg("from", end - timedelta(days=7)) if end else None
+    if start is None or end is None or start > end:
+        return jsonify({"ok": False, "error": "invalid from/to"}), 400
+    if (end - start) / _GRAIN_SPANS[grain] > MAX_HISTORY_BUCKETS:
+        return jsonify({"ok": False, "error": "range too long"}), 400
+
+    watermark = db.history.watermark()
+    buckets = db.history.buckets(_tenant(), grain, start, end)
+    body = {
+        "ok": True,
+        "granularity": grain,
+        "from": _iso(start),
+        "to": _iso(end),
+        "watermark": _iso(watermark) if watermark else None,
+        "buckets": [{"ts": _iso(b["ts"]), **db.totals([b])} for b in buckets],
+        "totals": db.totals(buckets),
+    }
+    return _json_response(body)
+
+
+@app.get("/api/export")
+def api_export():
+    """Stream the tenant's samples, events or segments as a file download.
+
+    ``?kind=`` is ``samples`` (default), ``events`` or ``segments``,
+    ``?format=`` is ``ndjson`` (default), ``csv``, ``parquet`` or ``arrow``
+    (IPC stream), and ``?from=``/``?to=`` are ISO-8601 or epoch ms (default:
+    everything). Rows are read from a ts-sorted cursor and encoded chunk by
+    chunk as the response is sent, so memory does not grow with the range.
+    """
+    kind = request.args.get("kind", "samples")
+    fmt = request.args.get("format", "ndjson")
+    if kind not in export.FIELDS:
+        return (
+            jsonify({"ok": False, "error": "kind must be samples, events or segments"}),
+            400,
+        )
+    if fmt not in export.FORMATS:
+        return (
+            jsonify(
+                {"ok": False, "error": "format must be ndjson, csv, parquet or arrow"}
+            ),
+            400,
+        )
+    if fmt in export.ARROW_FORMATS and not export.arrow_available():
+        return jsonify({"ok": False, "error": f"{fmt} export needs pyarrow"}), 501
+    if kind == "samples" and COMPRESS_SAMPLES:
+        return (
+            jsonify(
+                {
+                    "ok": False,
+                    "error": "samples are stored as segments; use kind=segments",
+                }
+            ),
+            400,
+        )
+    end = _time_arg("to", datetime.utcnow())
+    start = _time_arg("from", db.EPOCH)
+    if start is None or end is None or start > end:
+        return jsonify({"ok": False, "error": "invalid from/to"}), 400
+
+    collection = {"samples": db.samples, "events": db.events, "segments": db.segments}[
+        kind
     ]
-    return jsonify({"ok": True, "events": events})
+    projection = {"_id": 0, **{name: 1 for name, _ in export.FIELDS[kind]}}
+    cursor = (
+        collection.find({**_scope(), "ts": {"$gte": start, "$lt": end}}, projection)
+        .sort("ts", ASCENDING)
+        .batch_size(EXPORT_CHUNK_ROWS)
+    )
+    data = export.rows(cursor, kind)
+    if fmt == "ndjson":
+        chunks = export.ndjson_chunks(data, kind, EXPORT_CHUNK_ROWS)
+    elif fmt == "csv":
+        chunks = export.csv_chunks(data, kind, EXPORT_CHUNK_ROWS)
+    else:
+        chunks = export.arrow_chunks(data, kind, fmt, EXPORT_ROW_GROUP)
+
+    def generate():
+        try:
+            yield from chunks
+        finally:
+            cursor.close()
+
+    mimetype, ext = export.FORMATS[fmt]
+    name = f"{kind}-{start:%Y%m%dT%H%M%S}-{end:%Y%m%dT%H%M%S}.{ext}"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{name}"',
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@app.get("/api/stream")
+def api_stream():
+    """Server-Sent Events feed of the tenant's new ``samples``, ``latest``
+    and ``event``s; 503 once ``STREAM_MAX_SUBSCRIBERS`` streams are open.
+
+    A first ``config`` frame says whether the dashboard must keep polling
+    the series: segments written by another process are never pushed.
+    """
+    # Released when the response closes (see below), not in this scope.
+    # pylint: disable-next=consider-using-with
+    if stream_slots is not None and not stream_slots.acquire(blocking=False):
+        return jsonify({"ok": False, "error": "too many open streams"}), 503
+    _start_change_feed()
+    hub = _broadcaster(_tenant())
+    sub = hub.subscribe()
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            yield _sse("config", {"poll": COMPRESS_SAMPLES and not db.use_fake})
+            while True:
+                try:
+                    yield sub.get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            hub.unsubscribe(sub)
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    if stream_slots is not None:
+        # Runs when the server closes the response, even if never iterated.
+        response.call_on_close(stream_slots.release)
+    return response
+
+
+def _stamped(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Set ``ingested_at``, the insertion order the history reports fold in."""
+    now = datetime.utcnow()
+    for doc in docs:
+        doc["ingested_at"] = now
+    return docs
+
+
+# Open run-length segment per (user, source_id) when COMPRESS_SAMPLES is set.
+# Each is saved as it grows, so a dropped encoder just starts a new segment.
+segment_encoders = db.LRUMap(MAX_TENANT_ENTRIES)
+segment_writer = segments.SegmentWriter(db.segments)
+
+
+def _store_samples(docs: List[Dict[str, Any]]) -> None:
+    """Write ingested samples (in ts order): one document each, or folded
+    into their source's open segment (stamped when it opens), one bulk write
+    per source. Single samples wait up to ``SEGMENT_FLUSH_SECONDS`` to share one."""
+    if not COMPRESS_SAMPLES:
+        _stamped(docs)
+        if len(docs) == 1:
+            db.samples.insert_one(docs[0])
+        else:
+            db.samples.insert_many(docs)
+        return
+    by_source: Dict[CacheKey, List[Dict[str, Any]]] = {}
+    for doc in docs:
+        by_source.setdefault((doc.get("user"), doc.get("source_id")), []).append(doc)
+    for key, group in by_source.items():
+        encoder = segment_encoders.get(key)
+        if encoder is None:
+            encoder = segment_encoders.setdefault(
+                key, segments.SegmentEncoder(user=key[0], source_id=key[1])
+            )
+        # Held across the submit so a stale copy never overwrites a newer one.
+        with encoder.lock:
+            segment_writer.submit(encoder.extend(group), flush=len(docs) > 1)
+
+
+# Event detectors per (user, source_id); None for untagged samples. Their
+# state is kept in memory, so ingest never reads back the previous label; a
+# dropped detector starts over unlabelled.
+detectors = db.LRUMap(MAX_TENANT_ENTRIES)
+
+
+def _record_events(docs: List[Dict[str, Any]]) -> None:
+    """Run ingested samples (in ts order) through their source's detector and
+    store and publish any enter/exit events."""
+    events = []
+    for doc in docs:
+        key = (doc.get("user"), doc.get("source_id"))
+        detector = detectors.get(key)
+        if detector is None:
+            detector = detectors.setdefault(
+                key, SlouchDetector.from_env(SLOUCH_THRESHOLD)
+            )
+        event = detector.update(doc["slouch_prob"], doc["ts"])
+        if event:
+            events.append(_with_source(_with_tenant(event, key[0]), key[1]))
+    if events:
+        db.events.insert_many(_stamped(events))
+        for event in events:
+            _publish_event(event)
 
 
 @app.post("/api/dev/ingest-sample")
 def ingest_sample():
     """Dev-only endpoint to ingest a sample."""
     payload: Dict[str, Any] = request.get_json(force=True, silent=True) or {}
-    ts = datetime.utcnow()
-    p = float(payload.get("slouch_prob", 0.0))
-    label = "slouch" if p >= SLOUCH_THRESHOLD else "good"
-    db.samples.insert_one({"ts": ts, "slouch_prob": p, "label": label})
+    doc = _sample_doc(payload, datetime.utcnow(), user=_tenant())
+    _store_samples([doc])
+    _publish_samples([doc])
+    _record_events([doc])
     return jsonify({"ok": True})
 
 
+@app.post("/api/dev/ingest-samples")
+def ingest_samples():
+    """Dev-only endpoint to ingest a batch of timestamped samples.
+
+    Accepts either a JSON list or ``{"samples": [...], "source_id": ...}``
+    where each item has ``slouch_prob`` and an optional ``ts`` (ISO-8601 or
+    epoch milliseconds) and ``source_id``. All samples are written with a
+    single ``insert_many`` and belong to the request's tenant.
+    """
+    payload = request.get_json(force=True, silent=True)
+    source_id = payload.get("source_id") if isinstance(payload, dict) else None
+    items = payload.get("samples") if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        return jsonify({"ok": False, "error": "expected a list of samples"}), 400
+    if len(items) > MAX_INGEST_BATCH:
+        return (
+            jsonify({"ok": False, "error": f"batch exceeds {MAX_INGEST_BATCH}"}),
+            413,
+        )
+
+    now, user = datetime.utcnow(), _tenant()
+    try:
+        docs = [
+            _sample_doc(item, _parse_ts(item.get("ts"), now), source_id, user)
+            for item in items
+            if isinstance(item, dict)
+        ]
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "invalid slouch_prob"}), 400
+    if docs:
+        docs.sort(key=lambda d: d["ts"])
+        _store_samples(docs)
+        _publish_samples(docs)
+        _record_events(docs)
+    return jsonify({"ok": True, "inserted": len(docs)})
+
+
 @app.post("/api/dev/ingest-event")
 def ingest_event():
     """Dev-only endpoint to ingest an event."""
     payload = request.get_json(force=True, silent=True) or {}
-    ts = datetime.utcnow()
-    db.events.insert_one(
-        {
-            "ts": ts,
-            "type": payload.get("type", "event"),
-            "prob": float(payload.get("prob", 0)),
-        }
-    )
+    doc = {
+        "ts": datetime.utcnow(),
+        "type": payload.get("type", "event"),
+        "prob": float(payload.get("prob", 0)),
+    }
+    _with_source(_with_tenant(doc, _tenant()), payload.get("source_id"))
+    db.events.insert_one(_stamped([doc])[0])
+    _publish_event(doc)
     return jsonify({"ok": True})
 
 
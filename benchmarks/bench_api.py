@@ -0,0 +1,343 @@
+"""Latency/throughput benchmark for the web app's read and ingest endpoints.
+
+Seeds the in-memory backend (or, with ``--mongo-url``, a local mongod) with
+``--samples`` realistic samples and events, then drives each endpoint from
+``--concurrency`` client threads and reports latency percentiles and
+requests per second. Results are written as JSON (``--output``) together
+with the commit they were measured on, and ``--compare`` diffs them against
+an earlier run::
+
+    python -m benchmarks.bench_api --samples 1M --concurrency 1,8,32 \\
+        --output bench-main.json
+    python -m benchmarks.bench_api --samples 1M --compare bench-main.json
+
+With ``--url`` the requests go over HTTP to an already running server
+instead of through the in-process Flask test client (seeding is skipped).
+"""
+
+# pylint: disable=import-outside-toplevel,too-few-public-methods
+
+import argparse
+import json
+import math
+import platform
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+import numpy as np
+
+_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+# Samples arrive at 5 Hz per source, like the ML client on a webcam.
+SAMPLE_INTERVAL = timedelta(milliseconds=200)
+SEED_CHUNK = 50_000
+
+
+def parse_count(value):
+    """``10k``/``1M``/``250000`` -> int."""
+    value = value.strip().lower()
+    scale = _SUFFIXES.get(value[-1:], 1)
+    return int(float(value[:-1] if scale > 1 else value) * scale)
+
+
+def _synthetic_samples(start, count, rng, sources=("desk", "hall")):
+    """``count`` samples from ``start`` on, round-robin over ``sources``."""
+    i = np.arange(count)
+    prob = np.clip(0.55 + 0.35 * np.sin(i / 900) + rng.normal(0, 0.08, count), 0, 1)
+    return [
+        {
+            "ts": start + SAMPLE_INTERVAL * int(k),
+            "slouch_prob": float(p),
+            "label": "slouch" if p >= 0.6 else "good",
+            "source_id": sources[k % len(sources)],
+        }
+        for k, p in zip(i, prob)
+    ]
+
+
+def seed(samples_coll, events_coll, count, seed_value=0):
+    """Insert ``count`` samples ending now (plus ~1 event per 500 samples)."""
+    rng = np.random.default_rng(seed_value)
+    start = datetime.utcnow() - SAMPLE_INTERVAL * count
+    for offset in range(0, count, SEED_CHUNK):
+        docs = _synthetic_samples(
+            start + SAMPLE_INTERVAL * offset, min(SEED_CHUNK, count - offset), rng
+        )
+        samples_coll.insert_many(docs)
+        events_coll.insert_many(
+            [
+                {
+                    "ts": d["ts"],
+                    "type": "enter_slouch" if d["label"] == "slouch" else "exit_slouch",
+                    "prob": d["slouch_prob"],
+                    "source_id": d["source_id"],
+                }
+                for d in docs[::500]
+            ]
+        )
+
+
+def _sample_batch(size=100):
+    now_ms = int(time.time() * 1000)
+    return json.dumps(
+        {
+            "source_id": "bench",
+            "samples": [
+                {"ts": now_ms - 200 * (size - k), "slouch_prob": (k % 10) / 10}
+                for k in range(size)
+            ],
+        }
+    )
+
+
+# name -> (method, path, body factory)
+ENDPOINTS = {
+    "latest": ("GET", "/api/latest", None),
+    "latest_source": ("GET", "/api/latest?source=desk", None),
+    "metrics_raw_5m": ("GET", "/api/metrics?minutes=5", None),
+    "metrics_bucket_30m": ("GET", "/api/metrics?minutes=30&bucket=5s", None),
+    "metrics_lttb_60m": ("GET", "/api/metrics?minutes=60&max_points=500", None),
+    "metrics_raw_5m_columnar": (
+        "GET",
+        "/api/metrics?minutes=5&format=columnar",
+        None,
+    ),
+    "events": ("GET", "/api/events?limit=25", None),
+    "summary": ("GET", "/api/summary?minutes=30", None),
+    "history_week_hourly": ("GET", "/api/history?granularity=hour", None),
+    "ingest_sample": (
+        "POST",
+        "/api/dev/ingest-sample",
+        lambda: json.dumps({"slouch_prob": 0.7, "source_id": "bench"}),
+    ),
+    "ingest_samples_100": ("POST", "/api/dev/ingest-samples", _sample_batch),
+}
+
+
+class _InProcess:
+    """Flask test client per thread."""
+
+    def __init__(self):
+        from app import app
+
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body):
+        """Issue one request; return the HTTP status."""
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        res = client.open(
+            path, method=method, data=body, content_type="application/json"
+        )
+        return res.status_code
+
+
+class _Http:
+    """urllib requests against a running server."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method, path, body):
+        """Issue one request; return the HTTP status."""
+        req = urllib.request.Request(
+            self.base_url + path,
+            data=body.encode() if body else None,
+            method=method,
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=30) as res:
+                res.read()
+                return res.status
+        except urllib.error.HTTPError as exc:
+            return exc.code
+
+
+def percentile(sorted_ms, q):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_ms:
+        return 0.0
+    return sorted_ms[min(len(sorted_ms) - 1, math.ceil(q / 100 * len(sorted_ms)) - 1)]
+
+
+def run_endpoint(target, name, concurrency, requests):
+    """Send ``requests`` requests to endpoint ``name`` from ``concurrency``
+    threads; return its latency/throughput record."""
+    # pylint: disable=too-many-locals
+    method, path, body = ENDPOINTS[name]
+    per_thread = max(1, requests // concurrency)
+    latencies, errors, lock = [], [0], threading.Lock()
+
+    def worker():
+        mine, failed = [], 0
+        for _ in range(per_thread):
+            payload = body() if body else None
+            t0 = time.perf_counter()
+            status = target.request(method, path, payload)
+            mine.append((time.perf_counter() - t0) * 1000)
+            failed += status >= 400
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "endpoint": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": len(latencies) / elapsed,
+        "mean_ms": sum(latencies) / len(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "p90_ms": percentile(latencies, 90),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": latencies[-1],
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _prepare_in_process(count, mongo_url):
+    """Seed the app's backend; return a description of it."""
+    import app as app_module
+    import db
+
+    if mongo_url:
+        from pymongo import MongoClient
+
+        database = MongoClient(mongo_url)["posture_bench"]
+        database.samples.drop()
+        database.events.drop()
+        database.samples_rollup.drop()
+        database.history.drop()
+        db.ensure_schema(database, samples_ttl=0, events_ttl=0, rollup_ttl=0)
+        # Point the app's collections at the local mongod.
+        db.samples, db.events, db.use_fake = database.samples, database.events, False
+        backend = "mongod"
+    elif not db.use_fake:
+        sys.exit("Refusing to seed a remote database; use --url or --mongo-url.")
+    else:
+        backend = "fake"
+    db.samples.delete_many({})
+    db.events.delete_many({})
+    db.history.clear()
+    app_module.latest_caches.clear()
+    seed(db.samples, db.events, count)
+    app_module.refresh_history()
+    return backend
+
+
+def compare(current, baseline, tolerance):
+    """Lines describing p50/rps changes; second value is True on regression."""
+    old = {(r["endpoint"], r["concurrency"]): r for r in baseline["results"]}
+    lines, regressed = [], False
+    for r in current["results"]:
+        base = old.get((r["endpoint"], r["concurrency"]))
+        if not base:
+            continue
+        p50 = r["p50_ms"] / base["p50_ms"] - 1 if base["p50_ms"] else 0.0
+        rps = r["rps"] / base["rps"] - 1 if base["rps"] else 0.0
+        flag = p50 > tolerance
+        regressed |= flag
+        lines.append(
+            f"{r['endpoint']:<20} c={r['concurrency']:<3} p50 {p50:+7.1%} "
+            f"rps {rps:+7.1%}{'  REGRESSION' if flag else ''}"
+        )
+    return lines, regressed
+
+
+def write_report(report, path=None):
+    """Write ``report`` as JSON to ``path``, or to stdout."""
+    if path:
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    # pylint: disable=too-many-locals
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", default="10k", help="e.g. 10k, 1M, 10M")
+    parser.add_argument("--concurrency", default="1,8")
+    parser.add_argument("--requests", type=int, default=400, help="per run")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--url", help="benchmark a running server over HTTP")
+    parser.add_argument("--mongo-url", help="seed and use a local mongod")
+    parser.add_argument("--output", help="write JSON results here")
+    parser.add_argument("--compare", help="baseline JSON to diff against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    count = parse_count(args.samples)
+    if args.url:
+        target, backend = _Http(args.url), "http"
+    else:
+        started = time.perf_counter()
+        backend = _prepare_in_process(count, args.mongo_url)
+        print(
+            f"seeded {count:,} samples in {time.perf_counter() - started:.1f}s",
+            file=sys.stderr,
+        )
+        target = _InProcess()
+
+    results = []
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        for name in args.endpoints.split(","):
+            record = run_endpoint(target, name, concurrency, args.requests)
+            results.append(record)
+            errors = f"  errors={record['errors']}" if record["errors"] else ""
+            print(
+                f"{name:<20} c={concurrency:<3} {record['rps']:8.1f} req/s  "
+                f"p50 {record['p50_ms']:7.2f}  p99 {record['p99_ms']:7.2f} ms{errors}",
+                file=sys.stderr,
+            )
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "backend": backend,
+            "samples": count,
+            "requests": args.requests,
+        },
+        "results": results,
+    }
+    write_report(report, args.output)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            lines, regressed = compare(report, json.load(fh), args.tolerance)
+        print("\n".join(lines), file=sys.stderr)
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
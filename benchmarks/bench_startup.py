@@ -0,0 +1,96 @@
+"""Cold-start benchmark: import time of the web app and ML client.
+
+Each target is imported ``--runs`` times in a fresh interpreter (so nothing
+is cached in ``sys.modules``), recording the import time measured inside
+the child, the child's total wall time, and which heavy modules (OpenCV,
+NumPy) the import pulled in::
+
+    python -m benchmarks.bench_startup --runs 10 --output startup.json
+
+The children inherit the environment, so leave ``MONGO_LAZY`` unset (or 1)
+to measure the lazy path, and set ``MONGO_LAZY=0`` to include the
+import-time ping.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_api import write_report
+
+# name -> module imported in the child
+TARGETS = {
+    "db": "db",
+    "app": "app",
+    "ml_client": "machine_learning_client.client",
+    "ml_capture": "machine_learning_client.capture",
+}
+HEAVY_MODULES = ("cv2", "numpy")
+
+_CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{"import_ms": elapsed * 1000,
+    "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module, runs=5, root=None):
+    """Import ``module`` in ``runs`` fresh interpreters; return a record."""
+    code = _CHILD.format(module=module, heavy=HEAVY_MODULES)
+    imports, walls, heavy = [], [], set()
+    for _ in range(runs):
+        started = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=root,
+        ).stdout
+        walls.append((time.perf_counter() - started) * 1000)
+        result = json.loads(out.strip().splitlines()[-1])
+        imports.append(result["import_ms"])
+        heavy.update(result["heavy"])
+    return {
+        "module": module,
+        "runs": runs,
+        "import_ms_median": statistics.median(imports),
+        "import_ms_min": min(imports),
+        "wall_ms_median": statistics.median(walls),
+        "heavy_modules": sorted(heavy),
+    }
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--output", help="write JSON results here")
+    args = parser.parse_args(argv)
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for name in args.targets.split(","):
+        record = {"target": name, **measure(TARGETS[name], args.runs, root)}
+        results.append(record)
+        heavy = ",".join(record["heavy_modules"]) or "-"
+        print(
+            f"{name:<12} import {record['import_ms_median']:7.1f} ms  "
+            f"process {record['wall_ms_median']:7.1f} ms  heavy: {heavy}",
+            file=sys.stderr,
+        )
+    report = {"meta": {"python": sys.version.split()[0]}, "results": results}
+    write_report(report, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
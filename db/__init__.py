@@ -1,5 +1,48 @@
 """Database helpers exported at package level."""
 
-from .db import db, samples, events
+from .db import (
+    db,
+    use_fake,
+    schema,
+    ensure_ready,
+    samples,
+    events,
+    segments,
+    history,
+    bucket_samples,
+    EPOCH,
+    epoch_ms,
+    from_epoch_ms,
+    ensure_schema,
+)
+from .history import GRAINS, PeriodicJob, totals
+from .compression import bucket_segments, latest_segment, segment_points
+from .stream import Broadcaster, ChangeStreamFeed, InsertTailer
+from .cache import LatestCache, LRUMap
 
-__all__ = ["db", "samples", "events"]
+__all__ = [
+    "db",
+    "use_fake",
+    "schema",
+    "ensure_ready",
+    "samples",
+    "events",
+    "segments",
+    "history",
+    "bucket_samples",
+    "EPOCH",
+    "epoch_ms",
+    "from_epoch_ms",
+    "ensure_schema",
+    "bucket_segments",
+    "latest_segment",
+    "segment_points",
+    "GRAINS",
+    "PeriodicJob",
+    "totals",
+    "Broadcaster",
+    "ChangeStreamFeed",
+    "InsertTailer",
+    "LatestCache",
+    "LRUMap",
+]
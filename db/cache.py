@@ -0,0 +1,122 @@
+"""Write-through cache for the most recent posture sample.
+
+Ingest paths :meth:`LatestCache.offer` every document they write, so reads of
+the latest sample are served from memory. When another process may also be
+writing (a real MongoDB without a change stream feeding us), entries expire
+after ``ttl`` seconds and the next read refills from the database.
+
+:class:`LRUMap` bounds the web app's per-tenant state (these caches, event
+detectors, open segments, stream hubs), whose keys come from the client.
+"""
+
+# pylint: disable=missing-function-docstring
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+from .db import epoch_ms
+
+
+class LatestCache:
+    """Latest sample plus its pre-rendered response body and ETag."""
+
+    def __init__(self, render: Callable[[Dict[str, Any] | None], bytes]) -> None:
+        self.render = render
+        self._lock = threading.Lock()
+        self._doc: Dict[str, Any] | None = None
+        self._entry: Tuple[str, bytes] | None = None
+        self._filled_at = 0.0
+
+    def offer(self, doc: Dict[str, Any]) -> None:
+        """Write-through: keep ``doc`` if it is at least as new as the cache."""
+        with self._lock:
+            if self._entry is not None and (
+                self._doc is None or doc["ts"] >= self._doc["ts"]
+            ):
+                self._set(doc, refilled=False)
+
+    def get(
+        self, load: Callable[[], Dict[str, Any] | None], ttl: float | None
+    ) -> Tuple[str, bytes]:
+        """Return ``(etag, body)``, calling ``load`` on a miss or expiry."""
+        with self._lock:
+            fresh = ttl is None or time.monotonic() - self._filled_at < ttl
+            if self._entry is not None and fresh:
+                return self._entry
+        doc = load()
+        with self._lock:
+            self._set(doc)
+            return self._entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._doc = None
+            self._entry = None
+
+    def _set(self, doc: Dict[str, Any] | None, refilled: bool = True) -> None:
+        # Write-through offers do not extend the TTL: writes made by other
+        # processes still become visible within ``ttl`` seconds.
+        self._doc = doc
+        etag = "none"
+        if doc:
+            etag = f"{epoch_ms(doc['ts'])}-{float(doc.get('slouch_prob', 0))}"
+        self._entry = (etag, self.render(doc))
+        if refilled:
+            self._filled_at = time.monotonic()
+
+
+class LRUMap:
+    """Thread-safe mapping of at most ``max_entries`` items that drops the
+    least recently used first. Items for which ``pinned`` returns true are
+    never dropped, and may take it past the bound."""
+
+    def __init__(
+        self, max_entries: int, pinned: Callable[[Any], bool] = lambda _value: False
+    ) -> None:
+        self.max_entries = max_entries
+        self.pinned = pinned
+        self._lock = threading.Lock()
+        self._items: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def setdefault(self, key: Hashable, value: Any) -> Any:
+        """The item at ``key``, storing ``value`` there first if missing."""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+            self._items[key] = value
+            excess = len(self._items) - self.max_entries
+            stale = []
+            for old, item in self._items.items():
+                if len(stale) >= excess or old == key:
+                    break
+                if not self.pinned(item):
+                    stale.append(old)
+            for old in stale:
+                del self._items[old]
+            return value
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        with self._lock:
+            return list(self._items.items())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
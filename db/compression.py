@@ -0,0 +1,80 @@
+"""Read side of run-length encoded samples (``SAMPLE_COMPRESSION=segments``).
+
+Segments are written by :class:`machine_learning_client.segments.SegmentEncoder`.
+Readers turn each one back into sample-like points so the metrics and latest
+endpoints work unchanged: a point at the segment start and, if it holds
+more than one sample, one at its end. Both carry the segment mean as
+``slouch_prob``, its ``max``, and half of its ``count``.
+"""
+
+# pylint: disable=missing-function-docstring
+
+from __future__ import annotations
+
+import operator
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List
+
+from pymongo import ASCENDING, DESCENDING
+
+from machine_learning_client.segments import MAX_SECONDS
+
+from .db import bucket_docs
+
+
+def find_segments(collection: Any, match: Dict[str, Any], start: datetime) -> Any:
+    """Segments that end at or after ``start``, in start order."""
+    # ts is the segment start; bounding it keeps the query on the ts index.
+    query = {
+        **match,
+        "ts": {"$gte": start - timedelta(seconds=MAX_SECONDS)},
+        "end": {"$gte": start},
+    }
+    return collection.find(query).sort("ts", ASCENDING)
+
+
+def expand_segments(segments: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Start/end points for ``segments``, sorted by ``ts``."""
+    points = []
+    for seg in segments:
+        base = {"slouch_prob": seg["mean"], "max": seg["max"], "label": seg["label"]}
+        if "source_id" in seg:
+            base["source_id"] = seg["source_id"]
+        points.append({"ts": seg["ts"], "count": (seg["count"] + 1) // 2, **base})
+        if seg["count"] > 1:
+            points.append({"ts": seg["end"], "count": seg["count"] // 2, **base})
+    points.sort(key=lambda p: p["ts"])
+    return points
+
+
+def segment_points(
+    collection: Any, ts_query: Dict[str, datetime], match: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Expanded points matching ``ts_query`` (``$gt`` or ``$gte`` a time)."""
+    ((op_name, bound),) = ts_query.items()
+    compare = operator.gt if op_name == "$gt" else operator.ge
+    points = expand_segments(find_segments(collection, match, bound))
+    return [p for p in points if compare(p["ts"], bound)]
+
+
+def bucket_segments(
+    collection: Any,
+    since: datetime,
+    bucket_ms: int,
+    threshold: float,
+    match: Dict[str, Any] | None = None,
+) -> List[Dict[str, Any]]:
+    """:func:`~db.db.bucket_samples` over segments instead of samples."""
+    points = segment_points(collection, {"$gte": since}, match or {})
+    return bucket_docs(points, bucket_ms, threshold)
+
+
+def latest_segment(collection: Any, match: Dict[str, Any]) -> Dict[str, Any] | None:
+    """The most recent sample, as held by the newest segment."""
+    seg = collection.find_one(match, sort=[("ts", DESCENDING)])
+    if seg is None:
+        return None
+    doc = {"ts": seg["end"], "slouch_prob": seg["last"], "label": seg["label"]}
+    if "source_id" in seg:
+        doc["source_id"] = seg["source_id"]
+    return doc
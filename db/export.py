@@ -0,0 +1,188 @@
+"""Streaming encoders for bulk exports (``/api/export``).
+
+Rows come straight from a MongoDB cursor and leave as byte chunks: NDJSON
+and CSV every ``chunk_rows`` rows, Parquet one row group and Arrow (IPC
+stream format) one record batch every ``row_group`` rows. Nothing else is
+buffered, so memory stays bounded by one chunk however long the range is.
+
+Parquet and Arrow need ``pyarrow``, which is optional and imported on the
+first such export; :func:`arrow_available` tells whether it is installed.
+"""
+
+# pylint: disable=missing-function-docstring
+
+from __future__ import annotations
+
+import csv
+import importlib.util
+import io
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+try:  # optional: much faster NDJSON encoding
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib encoder
+    orjson = None
+
+# kind -> (field, type) columns, in order; ts is always first.
+FIELDS: Dict[str, List[Tuple[str, str]]] = {
+    "samples": [
+        ("ts", "time"),
+        ("source_id", "str"),
+        ("slouch_prob", "float"),
+        ("label", "str"),
+    ],
+    "events": [
+        ("ts", "time"),
+        ("source_id", "str"),
+        ("type", "str"),
+        ("prob", "float"),
+    ],
+    "segments": [
+        ("ts", "time"),
+        ("end", "time"),
+        ("source_id", "str"),
+        ("count", "int"),
+        ("min", "float"),
+        ("max", "float"),
+        ("mean", "float"),
+        ("last", "float"),
+        ("label", "str"),
+    ],
+}
+# format -> (mimetype, file extension)
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+ARROW_FORMATS = ("parquet", "arrow")
+
+
+def arrow_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _utc(dt: datetime) -> datetime:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def iso_ms(dt: datetime | None) -> str | None:
+    """ISO-8601 UTC with millisecond precision, as stored by MongoDB."""
+    if dt is None:
+        return None
+    return _utc(dt).isoformat(timespec="milliseconds") + "Z"
+
+
+def rows(docs: Iterable[Dict[str, Any]], kind: str) -> Iterator[List[Any]]:
+    """``FIELDS[kind]`` values of each document, missing ones as None."""
+    names = [name for name, _ in FIELDS[kind]]
+    for doc in docs:
+        yield [doc.get(name) for name in names]
+
+
+def _text_row(row: List[Any], kinds: List[str]) -> List[Any]:
+    return [iso_ms(v) if k == "time" else v for v, k in zip(row, kinds)]
+
+
+def _dumps(obj: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)  # pylint: disable=no-member
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def ndjson_chunks(
+    data: Iterable[List[Any]], kind: str, chunk_rows: int = 1000
+) -> Iterator[bytes]:
+    names = [name for name, _ in FIELDS[kind]]
+    kinds = [k for _, k in FIELDS[kind]]
+    lines: List[bytes] = []
+    for row in data:
+        lines.append(_dumps(dict(zip(names, _text_row(row, kinds)))))
+        if len(lines) >= chunk_rows:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+def csv_chunks(
+    data: Iterable[List[Any]], kind: str, chunk_rows: int = 1000
+) -> Iterator[bytes]:
+    kinds = [k for _, k in FIELDS[kind]]
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow([name for name, _ in FIELDS[kind]])
+    pending = 0
+    for row in data:
+        writer.writerow(_text_row(row, kinds))
+        pending += 1
+        if pending >= chunk_rows:
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+            pending = 0
+    yield buf.getvalue().encode()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file handing back what was written since the last drain."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:  # type: ignore[override]
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+def arrow_chunks(
+    data: Iterable[List[Any]], kind: str, fmt: str, row_group: int = 50_000
+) -> Iterator[bytes]:
+    """Parquet (``fmt="parquet"``) or Arrow IPC stream bytes for ``data``."""
+    # pylint: disable=import-outside-toplevel
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        "time": pa.timestamp("ms", tz="UTC"),
+        "str": pa.string(),
+        "float": pa.float64(),
+        "int": pa.int64(),
+    }
+    schema = pa.schema([(name, types[k]) for name, k in FIELDS[kind]])
+    sink = _Sink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    columns: List[List[Any]] = [[] for _ in schema]
+    for row in data:
+        for column, value in zip(columns, row):
+            column.append(value)
+        if len(columns[0]) >= row_group:
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            columns = [[] for _ in schema]
+            yield sink.drain()
+    if columns[0]:
+        writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+    writer.close()
+    yield sink.drain()
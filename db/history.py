@@ -0,0 +1,669 @@
+"""Per-minute, hourly and daily posture reports, materialized incrementally.
+
+Each report bucket covers one tenant (``user``) and one minute, hour or day
+and holds the number of samples, how many were slouching, the sum of their
+slouch probabilities, the seconds spent slouching and sitting well, the
+number of events (and of ``enter_slouch`` events) and the longest slouch
+streak seen in it. Long-range reads are therefore a handful of bucket
+documents, whatever the raw sample count.
+:meth:`summary` serves ``/api/summary`` from the minute buckets plus the
+samples ingested since the last refresh.
+
+The watermark is on insertion order, not on ``ts``: every writer stamps
+documents with ``ingested_at``, and :meth:`refresh` folds only those stamped
+after the watermark (up to an ``until`` that the caller keeps a little
+behind real time), whatever their ``ts``. Late writes (spool replays,
+retried batches) are therefore counted in the buckets they belong to. Each
+refresh reads ``overlap`` before the watermark again, for writes still in
+flight during the previous one, and skips the ids that one folded. The
+first refresh folds everything, including documents written before the
+stamp existed.
+
+Time is attributed per source: each sample accounts for the gap since the
+previous sample of the same ``(user, source_id)``, unless that gap exceeds
+``max_gap`` (the camera was off). Run-length segments (see
+:mod:`db.compression`) are folded the same way, as one unit spanning
+``ts``..``end``. A late sample takes over the share of the following
+sample's gap that it now covers. A streak is credited to the bucket of its
+latest sample, so an ongoing streak shows up before it ends; late samples
+do not change streaks.
+
+:class:`MemoryHistory` keeps buckets in process (fake mode), minute buckets
+for a bounded time; :class:`MongoHistory` upserts hourly and daily ones into
+the ``history`` collection and minute ones into ``samples_rollup``, and keeps
+the watermark, recently folded ids, streak state and a lease in
+``history_state``, so only one process refreshes at a time. A refresh that
+dies between its two writes re-counts its window on the next run.
+"""
+
+# pylint: disable=missing-function-docstring
+
+from __future__ import annotations
+
+import abc
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from .rollup import StreakTracker, minute_of
+
+GRAINS = ("minute", "hour", "day")
+_FIELDS = (
+    "samples",
+    "slouch_samples",
+    "prob_sum",
+    "slouch_seconds",
+    "good_seconds",
+    "events",
+    "slouch_events",
+)
+_PROJECTION = {
+    "ts": 1,
+    "end": 1,
+    "count": 1,
+    "label": 1,
+    "slouch_prob": 1,
+    "sum": 1,
+    "user": 1,
+    "source_id": 1,
+    "ingested_at": 1,
+}
+_EVENT_PROJECTION = {"ts": 1, "type": 1, "user": 1, "ingested_at": 1}
+
+BucketKey = Tuple[Any, str, datetime]
+Increments = Dict[BucketKey, Dict[str, float]]
+
+
+def bucket_start(ts: datetime, grain: str) -> datetime:
+    start = minute_of(ts)
+    if grain == "minute":
+        return start
+    start = start.replace(minute=0)
+    return start.replace(hour=0) if grain == "day" else start
+
+
+def _empty() -> Dict[str, float]:
+    return {**{name: 0 for name in _FIELDS}, "longest_streak_s": 0.0}
+
+
+def _credit(
+    inc: Increments,
+    user: Any,
+    ts: datetime,
+    values: Dict[str, float],
+    streak: float = 0.0,
+) -> None:
+    """Add ``values`` to ``user``'s buckets holding ``ts``, in every grain."""
+    for grain in GRAINS:
+        bucket = inc.setdefault((user, grain, bucket_start(ts, grain)), _empty())
+        for name, value in values.items():
+            bucket[name] += value
+        bucket["longest_streak_s"] = max(bucket["longest_streak_s"], streak)
+
+
+def _seconds_field(doc: Dict[str, Any], threshold: float) -> str:
+    slouch = doc.get("label") == "slouch" or (
+        "label" not in doc and doc.get("slouch_prob", 0) >= threshold
+    )
+    return "slouch_seconds" if slouch else "good_seconds"
+
+
+def _count_event(inc: Increments, doc: Dict[str, Any]) -> None:
+    values = {"events": 1, "slouch_events": int(doc.get("type") == "enter_slouch")}
+    _credit(inc, doc.get("user"), doc["ts"], values)
+
+
+class _History(abc.ABC):
+    """Shared refresh logic; subclasses store buckets and the job state."""
+
+    def __init__(
+        self,
+        max_gap: timedelta = timedelta(seconds=30),
+        overlap: timedelta = timedelta(seconds=30),
+        step: timedelta = timedelta(hours=1),
+    ) -> None:
+        self.max_gap = max_gap
+        self.overlap = overlap
+        self.step = step
+
+    def refresh(
+        self,
+        samples: Any,
+        events: Any,
+        until: datetime,
+        threshold: float,
+        span: timedelta = timedelta(0),
+    ) -> int:
+        """Fold samples (or segments) and events ingested in ``(watermark, until]``.
+
+        ``span`` is the longest a document lasts (``end - ts`` of segments).
+        Returns how many samples were folded; 0 as well when another
+        process holds the lease.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        state = self._claim()
+        if state is None:
+            return 0
+        watermark = state.get("watermark")
+        try:
+            if watermark is not None and until <= watermark:
+                return 0
+            inc: Increments = {}
+            streaks = {
+                (s["user"], s["source_id"]): _tracker(s, self.max_gap)
+                for s in state.get("streaks") or []
+            }
+            seen = state.get("recent") or {"samples": [], "events": []}
+            if watermark is None:
+                folded, seen = self._build(
+                    inc, streaks, samples, events, until, threshold
+                )
+            else:
+                # Catch up a long backlog in bounded steps.
+                folded = 0
+                while watermark < until:
+                    window = (watermark, min(until, watermark + self.step))
+                    count, seen["samples"] = self._fold_samples(
+                        inc, streaks, samples, window, seen["samples"], threshold, span
+                    )
+                    seen["events"] = self._fold_events(
+                        inc, events, window, seen["events"]
+                    )
+                    folded += count
+                    watermark = window[1]
+            if inc:
+                self._apply(inc)
+            state["watermark"] = until
+            state["recent"] = seen
+            state["streaks"] = [
+                {"user": u, "source_id": s, "start": t.start, "last": t.last}
+                for (u, s), t in streaks.items()
+                if t.start is not None
+            ]
+            return folded
+        finally:
+            self._release(state)
+
+    def _build(
+        self,
+        inc: Increments,
+        streaks: Dict[Tuple[Any, Any], StreakTracker],
+        samples: Any,
+        events: Any,
+        until: datetime,
+        threshold: float,
+    ) -> Tuple[int, Dict[str, List[Any]]]:
+        """First run: fold everything stamped up to ``until`` (or never
+        stamped) in one ``ts``-ordered pass."""
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        seen: Dict[str, List[Any]] = {"samples": [], "events": []}
+        last: Dict[Tuple[Any, Any], datetime] = {}
+        folded = 0
+        cur = samples.find({}, _PROJECTION).sort("ts", ASCENDING).batch_size(10_000)
+        for doc in cur:
+            if not self._due(doc, until, seen["samples"]):
+                continue
+            key = (doc.get("user"), doc.get("source_id"))
+            folded += self._fold_one(inc, streaks, key, doc, last.get(key), threshold)
+            last[key] = doc.get("end", doc["ts"])
+        for doc in events.find({}, _EVENT_PROJECTION).batch_size(10_000):
+            if self._due(doc, until, seen["events"]):
+                _count_event(inc, doc)
+        return folded, seen
+
+    def _due(self, doc: Dict[str, Any], until: datetime, seen: List[Any]) -> bool:
+        # Remembers ids stamped within ``overlap`` of ``until``, which the
+        # next refresh reads again.
+        stamp = doc.get("ingested_at")
+        if stamp is None:
+            return True
+        if stamp > until:
+            return False
+        if stamp > until - self.overlap:
+            seen.append(doc["_id"])
+        return True
+
+    def _stamped(
+        self,
+        collection: Any,
+        window: Tuple[datetime, datetime],
+        seen: List[Any],
+        projection: Dict[str, int],
+    ) -> Tuple[Dict[Any, Dict[str, Any]], List[Any]]:
+        """Documents stamped in the window and not folded yet, by ``_id``,
+        and the ids to remember for the next window.
+
+        The window is read from ``overlap`` before its start, so writes that
+        were in flight when the previous window was read are still counted;
+        ``seen`` holds the ids that window already folded.
+        """
+        start, until = window
+        query = {"ingested_at": {"$gt": start - self.overlap, "$lte": until}}
+        folded = set(seen)
+        new: Dict[Any, Dict[str, Any]] = {}
+        recent: List[Any] = []
+        for doc in collection.find(query, projection).batch_size(10_000):
+            if doc["ingested_at"] > until - self.overlap:
+                recent.append(doc["_id"])
+            if doc["_id"] not in folded:
+                new[doc["_id"]] = doc
+        return new, recent
+
+    def _fold_samples(
+        self,
+        inc: Increments,
+        streaks: Dict[Tuple[Any, Any], StreakTracker],
+        collection: Any,
+        window: Tuple[datetime, datetime],
+        seen: List[Any],
+        threshold: float,
+        span: timedelta,
+    ) -> Tuple[int, List[Any]]:
+        """Fold the samples stamped in ``window``, whatever their ``ts``.
+
+        Each is read back with its neighbours (up to ``max_gap`` away) of
+        every source, so a late sample is timed against the samples around
+        it, and the already-folded sample after it gives up the gap it now
+        no longer spans.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+        new, recent = self._stamped(collection, window, seen, _PROJECTION)
+        folded_before = set(seen)
+        oldest = window[0] - self.overlap
+        folded = 0
+        for lo, hi in self._ranges(new.values(), span):
+            cur = collection.find({"ts": {"$gte": lo, "$lte": hi}}, _PROJECTION).sort(
+                "ts", ASCENDING
+            )
+            by_source: Dict[Tuple[Any, Any], List[Dict[str, Any]]] = {}
+            for doc in cur:
+                stamp = doc.get("ingested_at")
+                # Neither new nor folded yet: a later refresh folds it.
+                if not (
+                    doc["_id"] in new
+                    or stamp is None
+                    or stamp <= oldest
+                    or doc["_id"] in folded_before
+                ):
+                    continue
+                key = (doc.get("user"), doc.get("source_id"))
+                by_source.setdefault(key, []).append(doc)
+            for key, docs in by_source.items():
+                folded += self._refold(inc, streaks, key, docs, new, threshold)
+        return folded, recent
+
+    def _ranges(
+        self, docs: Iterable[Dict[str, Any]], span: timedelta
+    ) -> List[Tuple[datetime, datetime]]:
+        """Merged ``ts`` ranges holding ``docs`` and every neighbour whose
+        timing they can change."""
+        ranges: List[Tuple[datetime, datetime]] = []
+        for lo, hi in sorted(
+            (d["ts"] - self.max_gap - span, d.get("end", d["ts"]) + self.max_gap)
+            for d in docs
+        ):
+            if ranges and lo <= ranges[-1][1]:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], hi))
+            else:
+                ranges.append((lo, hi))
+        return ranges
+
+    def _refold(
+        self,
+        inc: Increments,
+        streaks: Dict[Tuple[Any, Any], StreakTracker],
+        key: Tuple[Any, Any],
+        docs: List[Dict[str, Any]],
+        new: Dict[Any, Dict[str, Any]],
+        threshold: float,
+    ) -> int:
+        """Fold one source's new documents among its folded ones (all in
+        ``ts`` order), correcting the gap of each folded document that a
+        new one now precedes."""
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        folded = 0
+        prev_folded = prev = None
+        for doc in docs:
+            ts = doc["ts"]
+            if doc["_id"] in new:
+                folded += self._fold_one(inc, streaks, key, doc, prev, threshold)
+            else:
+                if prev != prev_folded:
+                    delta = self._gap(ts, prev) - self._gap(ts, prev_folded)
+                    if delta:
+                        field = _seconds_field(doc, threshold)
+                        _credit(inc, key[0], ts, {field: delta})
+                prev_folded = doc.get("end", ts)
+            prev = doc.get("end", ts)
+        return folded
+
+    def _gap(self, ts: datetime, prev: datetime | None) -> float:
+        """Seconds since the previous document's end, if within ``max_gap``."""
+        if prev is None or not timedelta(0) <= ts - prev <= self.max_gap:
+            return 0.0
+        return (ts - prev).total_seconds()
+
+    def _fold_one(
+        self,
+        inc: Increments,
+        streaks: Dict[Tuple[Any, Any], StreakTracker],
+        key: Tuple[Any, Any],
+        doc: Dict[str, Any],
+        prev: datetime | None,
+        threshold: float,
+    ) -> int:
+        # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+        ts = doc["ts"]
+        end = doc.get("end", ts)
+        count = doc.get("count", 1)
+        field = _seconds_field(doc, threshold)
+        slouch = field == "slouch_seconds"
+        tracker = streaks.get(key)
+        if tracker is None:
+            tracker = streaks[key] = StreakTracker(self.max_gap)
+        streak = 0.0
+        if tracker.last is None or ts >= tracker.last:  # late samples end no streak
+            ended = tracker.update(ts, slouch) or 0.0
+            if end != ts:
+                ended = max(ended, tracker.update(end, slouch) or 0.0)
+            streak = max(ended, tracker.current())
+        values = {
+            "samples": count,
+            "slouch_samples": count if slouch else 0,
+            # Segments carry the sum of their samples' probabilities.
+            "prob_sum": doc.get("sum", doc.get("slouch_prob", 0.0)),
+            field: (end - ts).total_seconds() + self._gap(ts, prev),
+        }
+        _credit(inc, key[0], ts, values, streak)
+        return count
+
+    def _fold_events(
+        self,
+        inc: Increments,
+        collection: Any,
+        window: Tuple[datetime, datetime],
+        seen: List[Any],
+    ) -> List[Any]:
+        new, recent = self._stamped(collection, window, seen, _EVENT_PROJECTION)
+        for doc in new.values():
+            _count_event(inc, doc)
+        return recent
+
+    def summary(
+        self,
+        samples: Any,
+        user: str | None,
+        since: datetime,
+        now: datetime,
+        threshold: float,
+    ) -> Dict[str, Any]:
+        """Counts, slouch share and streaks of ``user``'s samples (or
+        segments) from ``since``'s minute on.
+
+        Minute buckets cover what is folded; the samples ingested after the
+        watermark are read raw and run through the source's streak state as
+        of the watermark. A current streak ends ``max_gap`` after its
+        latest sample, when the source has stopped sending.
+        """
+        # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+        state = self._peek()
+        start = bucket_start(since, "minute")
+        buckets = self.buckets(user, "minute", start, now + timedelta(minutes=1))
+        out = totals(buckets)
+        minutes = {b["ts"] for b in buckets}
+        streaks = {
+            (s["user"], s["source_id"]): _tracker(s, self.max_gap)
+            for s in state.get("streaks") or []
+            if s["user"] == user
+        }
+        query: Dict[str, Any] = {"user": user, "ts": {"$gte": start}}
+        if state.get("watermark") is not None:
+            query["ingested_at"] = {"$gt": state["watermark"]}
+        for doc in samples.find(query, _PROJECTION).sort("ts", ASCENDING):
+            ts, count = doc["ts"], doc.get("count", 1)
+            slouch = _seconds_field(doc, threshold) == "slouch_seconds"
+            out["samples"] += count
+            out["slouch_samples"] += count if slouch else 0
+            out["prob_sum"] += doc.get("sum", doc.get("slouch_prob", 0.0))
+            minutes.add(bucket_start(ts, "minute"))
+            key = (user, doc.get("source_id"))
+            tracker = streaks.get(key)
+            if tracker is None:
+                tracker = streaks[key] = StreakTracker(self.max_gap)
+            ended = tracker.update(ts, slouch) or 0.0
+            if doc.get("end", ts) != ts:
+                ended = max(ended, tracker.update(doc["end"], slouch) or 0.0)
+            out["longest_streak_s"] = max(out["longest_streak_s"], ended)
+        count, slouch = out["samples"], out["slouch_samples"]
+        current = max((t.current(now) for t in streaks.values()), default=0.0)
+        # A streak that stopped with its source still happened (if lately).
+        ongoing = max(
+            (t.current() for t in streaks.values() if t.last and t.last >= start),
+            default=0.0,
+        )
+        out["longest_streak_s"] = max(out["longest_streak_s"], ongoing)
+        return {
+            "count": count,
+            "buckets": len(minutes),
+            "mean_prob": out["prob_sum"] / count if count else None,
+            "slouch_pct": 100.0 * slouch / count if count else 0.0,
+            "good_pct": 100.0 * (count - slouch) / count if count else 0.0,
+            "current_streak_s": current,
+            "longest_streak_s": out["longest_streak_s"],
+        }
+
+    def watermark(self) -> datetime | None:
+        return self._peek().get("watermark")
+
+    @abc.abstractmethod
+    def _peek(self) -> Dict[str, Any]:
+        """The job state, without claiming the lease."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def buckets(
+        self, user: str | None, grain: str, start: datetime, end: datetime
+    ) -> List[Dict[str, Any]]:
+        """``user``'s ``grain`` buckets overlapping ``[start, end)``, in order."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _claim(self) -> Dict[str, Any] | None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _release(self, state: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _apply(self, inc: Increments) -> None:
+        raise NotImplementedError
+
+
+def _tracker(saved: Dict[str, Any], max_gap: timedelta) -> StreakTracker:
+    tracker = StreakTracker(max_gap)
+    tracker.start, tracker.last = saved["start"], saved["last"]
+    return tracker
+
+
+class MemoryHistory(_History):
+    """In-process report buckets (fake mode); unbounded, like the raw data's
+    default in-memory retention."""
+
+    def __init__(self, minute_retention: int = 24 * 60, **options: Any) -> None:
+        super().__init__(**options)
+        self.minute_retention = timedelta(minutes=minute_retention)
+        # (user, grain) -> bucket start -> bucket, so reads stay per tenant.
+        self._buckets: Dict[Tuple[Any, str], Dict[datetime, Dict[str, float]]] = {}
+        self._state: Dict[str, Any] = {"watermark": None}
+        self._lock = threading.Lock()
+
+    def _claim(self) -> Dict[str, Any] | None:
+        # Held until _release, like the Mongo lease.
+        # pylint: disable-next=consider-using-with
+        if not self._lock.acquire(blocking=False):
+            return None
+        return dict(self._state)
+
+    def _release(self, state: Dict[str, Any]) -> None:
+        self._state = state
+        self._lock.release()
+
+    def _apply(self, inc: Increments) -> None:
+        for (user, grain, ts), delta in inc.items():
+            bucket = self._buckets.setdefault((user, grain), {}).setdefault(
+                ts, _empty()
+            )
+            for name in _FIELDS:
+                bucket[name] += delta[name]
+            bucket["longest_streak_s"] = max(
+                bucket["longest_streak_s"], delta["longest_streak_s"]
+            )
+        for user in {user for user, grain, _ in inc if grain == "minute"}:
+            minutes = self._buckets[(user, "minute")]
+            if len(minutes) > self.minute_retention // timedelta(minutes=1):
+                cutoff = max(minutes) - self.minute_retention
+                for ts in [ts for ts in minutes if ts <= cutoff]:
+                    del minutes[ts]
+
+    def _peek(self) -> Dict[str, Any]:
+        return self._state
+
+    def buckets(
+        self, user: str | None, grain: str, start: datetime, end: datetime
+    ) -> List[Dict[str, Any]]:
+        start = bucket_start(start, grain)
+        found = self._buckets.get((user, grain), {})
+        return [dict(found[ts], ts=ts) for ts in sorted(found) if start <= ts < end]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+            self._state = {"watermark": None}
+
+
+class MongoHistory(_History):
+    """Hourly and daily buckets in ``collection``, one document per tenant,
+    grain and bucket start; minute buckets in ``minutes``, one per tenant
+    and minute (so they can expire sooner); job state in the single
+    ``_id: "history"`` document of ``state``."""
+
+    def __init__(
+        self,
+        collection: Any,
+        state: Any,
+        minutes: Any,
+        lease: timedelta = timedelta(minutes=5),
+        **options: Any,
+    ) -> None:
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        super().__init__(**options)
+        self.collection = collection
+        self.state = state
+        self.minutes = minutes
+        self.lease = lease
+
+    def _claim(self) -> Dict[str, Any] | None:
+        now = datetime.utcnow()
+        try:
+            # Upserting a held lease collides with the existing _id.
+            return self.state.find_one_and_update(
+                {"_id": "history", "lease": {"$not": {"$gt": now}}},
+                {"$set": {"lease": now + self.lease}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return None
+
+    def _release(self, state: Dict[str, Any]) -> None:
+        fields = {name: state.get(name) for name in ("watermark", "recent", "streaks")}
+        self.state.update_one({"_id": "history"}, {"$set": {**fields, "lease": None}})
+
+    def _apply(self, inc: Increments) -> None:
+        ops: Dict[str, List[UpdateOne]] = {"minute": [], "report": []}
+        for (user, grain, ts), delta in inc.items():
+            update = {
+                "$inc": {name: delta[name] for name in _FIELDS},
+                "$max": {"longest_streak_s": delta["longest_streak_s"]},
+            }
+            if grain == "minute":
+                ops["minute"].append(
+                    UpdateOne({"user": user, "ts": ts}, update, upsert=True)
+                )
+            else:
+                key = {"user": user, "grain": grain, "ts": ts}
+                ops["report"].append(UpdateOne(key, update, upsert=True))
+        if ops["minute"]:
+            self.minutes.bulk_write(ops["minute"], ordered=False)
+        if ops["report"]:
+            self.collection.bulk_write(ops["report"], ordered=False)
+
+    def _peek(self) -> Dict[str, Any]:
+        projection = {"watermark": 1, "streaks": 1}
+        return self.state.find_one({"_id": "history"}, projection) or {}
+
+    def buckets(
+        self, user: str | None, grain: str, start: datetime, end: datetime
+    ) -> List[Dict[str, Any]]:
+        start = bucket_start(start, grain)
+        query: Dict[str, Any] = {"user": user, "ts": {"$gte": start, "$lt": end}}
+        collection = self.minutes
+        if grain != "minute":
+            query["grain"] = grain
+            collection = self.collection
+        cur = collection.find(query, {"_id": 0, "grain": 0}).sort("ts", ASCENDING)
+        return list(cur)
+
+    def clear(self) -> None:
+        self.collection.delete_many({})
+        self.minutes.delete_many({})
+        self.state.delete_many({})
+
+
+class PeriodicJob:
+    """Daemon thread calling ``run`` every ``interval`` seconds."""
+
+    def __init__(self, run: Callable[[], Any], interval: float, name: str) -> None:
+        self.run = run
+        self.interval = interval
+        self.name = name
+        self._started = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Start the thread once; later calls are no-ops."""
+        with self._lock:
+            if self._started or self.interval <= 0:
+                return
+            self._started = True
+        threading.Thread(target=self._loop, name=self.name, daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run()
+            except PyMongoError as exc:  # pragma: no cover - retried next tick
+                print(f"{self.name} job failed: {exc}")
+            self._stop.wait(self.interval)
+
+
+def totals(buckets: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sums over ``buckets``, with the overall longest streak and slouch share."""
+    out: Dict[str, Any] = _empty()
+    for bucket in buckets:
+        for name in _FIELDS:
+            out[name] += bucket.get(name, 0)
+        out["longest_streak_s"] = max(
+            out["longest_streak_s"], bucket.get("longest_streak_s", 0.0)
+        )
+    tracked = out["slouch_seconds"] + out["good_seconds"]
+    out["slouch_pct"] = 100.0 * out["slouch_seconds"] / tracked if tracked else 0.0
+    return out
@@ -0,0 +1,52 @@
+"""Slouch streak tracking for the history reports and ``/api/summary``.
+
+The per-minute rollups themselves are the ``minute`` grain of
+:mod:`db.history`, folded from stored data, so samples from every writer
+(the ML client included) are counted.
+"""
+
+# pylint: disable=missing-function-docstring
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+
+def minute_of(ts: datetime) -> datetime:
+    return ts.replace(second=0, microsecond=0)
+
+
+class StreakTracker:
+    """O(1)-per-sample tracker of consecutive slouching samples.
+
+    A streak is broken by a good sample or by a gap longer than ``max_gap``
+    between samples (e.g. the camera was stopped).
+    """
+
+    def __init__(self, max_gap: timedelta = timedelta(seconds=30)) -> None:
+        self.max_gap = max_gap
+        self.start: datetime | None = None
+        self.last: datetime | None = None
+
+    def update(self, ts: datetime, is_slouch: bool) -> float | None:
+        """Feed one sample; return the length in seconds of a streak it ended."""
+        if self.last is not None and ts < self.last:
+            return None  # late sample; counted in buckets but not in streaks
+        ended = None
+        if self.start is not None and (not is_slouch or ts - self.last > self.max_gap):
+            ended = (self.last - self.start).total_seconds()
+            self.start = None
+        if is_slouch and self.start is None:
+            self.start = ts
+        self.last = ts
+        return ended
+
+    def current(self, now: datetime | None = None) -> float:
+        """Length of the ongoing streak; 0 when there is none, or when
+        ``now`` is given and the last sample is more than ``max_gap`` old
+        (the source stopped sending)."""
+        if self.start is None:
+            return 0.0
+        if now is not None and now - self.last > self.max_gap:
+            return 0.0
+        return (self.last - self.start).total_seconds()
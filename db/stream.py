@@ -0,0 +1,217 @@
+"""In-process fan-out of newly ingested samples and events.
+
+A single :class:`Broadcaster` is shared by every streaming viewer. Messages
+are serialized once by the publisher and handed to each subscriber queue as
+is, so adding viewers does not add database reads or JSON encoding work.
+On a real MongoDB deployment :class:`ChangeStreamFeed` relays inserts from a
+change stream (so writes by the ML client are seen too), and
+:class:`InsertTailer` polls for the ones a change stream cannot see (a
+time-series collection, a server that is not a replica set); in
+fake/in-memory mode the web app's ingest routes publish directly.
+"""
+
+# pylint: disable=missing-function-docstring,too-few-public-methods
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+
+from pymongo.errors import PyMongoError
+
+
+class Broadcaster:
+    """Thread-safe publish/subscribe hub with bounded per-subscriber queues."""
+
+    def __init__(self, max_queue: int = 256) -> None:
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers: List[queue.Queue] = []
+
+    def subscribe(self) -> queue.Queue:
+        sub: queue.Queue = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: queue.Queue) -> None:
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, message: Any) -> None:
+        """Deliver ``message`` to every subscriber, dropping their oldest
+        queued message when a slow viewer has fallen ``max_queue`` behind."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            while True:
+                try:
+                    sub.put_nowait(message)
+                    break
+                except queue.Full:
+                    try:
+                        sub.get_nowait()
+                    except queue.Empty:
+                        pass
+
+
+class ChangeStreamFeed:
+    """Background thread relaying inserts on ``collections`` to ``on_insert``.
+
+    ``on_insert`` is called with the collection name and the inserted
+    document. :attr:`active` is true while the change stream is open; callers
+    use it to decide whether they still need to publish on their own.
+    """
+
+    def __init__(
+        self,
+        database: Any,
+        collections: List[str],
+        on_insert: Callable[[str, Dict[str, Any]], None],
+    ) -> None:
+        self.database = database
+        self.collections = collections
+        self.on_insert = on_insert
+        self.active = False
+        self._started = False
+        self._lock = threading.Lock()
+
+    def covers(self, collection: str) -> bool:
+        """True while inserts into ``collection`` arrive through the stream."""
+        return self.active and collection in self.collections
+
+    def start(self) -> None:
+        """Start the watcher thread once; later calls are no-ops."""
+        if self.database is None:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="change-stream", daemon=True).start()
+
+    def _run(self) -> None:
+        pipeline = [
+            {
+                "$match": {
+                    "operationType": "insert",
+                    "ns.coll": {"$in": self.collections},
+                }
+            }
+        ]
+        try:
+            with self.database.watch(pipeline) as stream:
+                self.active = True
+                for change in stream:
+                    self.on_insert(change["ns"]["coll"], change["fullDocument"])
+        except PyMongoError as exc:  # pragma: no cover - needs a replica set
+            print(f"Change stream unavailable, using ingest hooks: {exc}")
+        finally:
+            self.active = False
+
+
+class InsertTailer:
+    """Background thread polling ``collections`` for new documents by their
+    ``ingested_at`` stamp and relaying them to ``on_insert``.
+
+    Only tenants returned by ``scope`` (those with open streams) are read,
+    and nothing at all while it is empty. Collections for which ``skip``
+    returns true (a running change stream covers them) are left alone. Each
+    poll re-reads ``overlap`` seconds before the newest stamp seen, so a
+    write committed a little out of stamp order is still relayed, and drops
+    the documents it already relayed or that were stamped before it last
+    had nothing to do (viewers resync those when they connect).
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+    # pylint: disable=too-many-positional-arguments
+
+    def __init__(
+        self,
+        database: Any,
+        collections: List[str],
+        on_insert: Callable[[str, Dict[str, Any]], None],
+        scope: Callable[[], List[Any]],
+        skip: Callable[[str], bool] = lambda _name: False,
+        interval: float = 1.0,
+        overlap: float = 5.0,
+    ) -> None:
+        self.database = database
+        self.collections = collections
+        self.on_insert = on_insert
+        self.scope = scope
+        self.skip = skip
+        self.interval = interval
+        self.overlap = timedelta(seconds=overlap)
+        self.active = False
+        self._marks: Dict[str, datetime] = {}
+        self._floors: Dict[str, datetime] = {}
+        self._seen: Dict[str, Dict[Any, datetime]] = {}
+        self._started = False
+        self._lock = threading.Lock()
+
+    def covers(self, collection: str) -> bool:
+        """True while inserts into ``collection`` arrive through the tail."""
+        return (
+            self.active and collection in self.collections and not self.skip(collection)
+        )
+
+    def start(self) -> None:
+        """Start the polling thread once; later calls are no-ops."""
+        if self.database is None:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="insert-tail", daemon=True).start()
+
+    def poll(self, now: datetime | None = None) -> int:
+        """Relay documents stamped since the last poll; returns how many."""
+        now = now or datetime.utcnow()
+        users = self.scope()
+        relayed = 0
+        for name in self.collections:
+            if not users or self.skip(name):
+                # Start from here once there is something to relay again.
+                self._marks[name] = self._floors[name] = now
+                self._seen[name] = {}
+                continue
+            mark = self._marks.setdefault(name, now)
+            floor = self._floors.setdefault(name, now)
+            seen = self._seen.setdefault(name, {})
+            query = {
+                "ingested_at": {"$gt": mark - self.overlap},
+                "user": {"$in": users},
+            }
+            docs = self.database[name].find(query).sort("ingested_at", 1)
+            for doc in docs:
+                if doc["_id"] in seen or doc["ingested_at"] <= floor:
+                    continue
+                seen[doc["_id"]] = doc["ingested_at"]
+                mark = max(mark, doc["ingested_at"])
+                self.on_insert(name, doc)
+                relayed += 1
+            self._marks[name] = mark
+            for key in [k for k, at in seen.items() if at <= mark - self.overlap]:
+                del seen[key]
+        return relayed
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.poll()
+                self.active = True
+            except PyMongoError as exc:  # pragma: no cover - needs a server
+                if self.active:
+                    print(f"Insert tail failed, using ingest hooks: {exc}")
+                self.active = False
+            time.sleep(self.interval)
@@ -0,0 +1,57 @@
+"""Production serving config: ``gunicorn -c gunicorn.conf.py app:app``.
+
+One threaded worker (``gthread``) by default. The app keeps per-process
+state that MongoDB does not share: slouch detectors, open segments, stream
+broadcasters and telemetry counters. Several workers would each hold a
+different part of it, so ``WEB_CONCURRENCY`` above 1 is unsupported; scale
+with threads, or with more single-worker replicas behind a load balancer
+that pins each tenant to one of them.
+
+Each ``/api/stream`` subscriber holds a thread for as long as it is
+connected. ``STREAM_MAX_SUBSCRIBERS`` defaults to four threads short of
+``GUNICORN_THREADS``, so open streams never starve ordinary requests; past it
+the dashboard falls back to polling.
+
+``MONGO_LAZY`` (on by default) defers the first MongoDB round trip until the
+worker handles a request, so the client is created after the fork.
+"""
+
+# pylint: disable=invalid-name
+
+import os
+
+os.environ.setdefault("MONGO_LAZY", "1")
+
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+# Keep MongoDB's pool no smaller than the number of request threads.
+os.environ.setdefault("MONGO_MAX_POOL_SIZE", str(max(threads, 4)))
+os.environ.setdefault("STREAM_MAX_SUBSCRIBERS", str(max(threads - 4, 1)))
+preload_app = False
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 10
+keepalive = 5
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    """Warn when started with more than one worker (see the module docstring)."""
+    if workers > 1:
+        server.log.warning(
+            "WEB_CONCURRENCY=%d: detectors, streams and /metrics counters are "
+            "per worker and will disagree; run one worker per replica",
+            workers,
+        )
+
+
+def post_worker_init(_worker):
+    """Start the history report refresher; a lease in MongoDB lets only one
+    process at a time do the work."""
+    # pylint: disable=import-outside-toplevel
+    from app import history_job
+
+    history_job.start()
@@ -0,0 +1,302 @@
+"""Recompute stored labels and events after a threshold or rule change.
+
+:func:`reprocess` streams ``samples`` for one tenant and source at a time
+in ``ts`` order, in chunks of ``batch_size`` documents (projected to the
+fields it needs), so memory stays bounded however many samples there are.
+For each chunk it recomputes labels, the detector's EMA and its enter/exit
+transitions with NumPy over whole arrays, carrying the detector state into
+the next chunk. It then sends changed labels back as one unordered
+``bulk_write`` of two range ``UpdateMany`` operations (one per label) and the
+regenerated events as one unordered ``insert_many``.
+
+The transitions match :class:`~machine_learning_client.detector.SlouchDetector`
+fed the same samples one by one. Before a chunk's events are written, the
+enter/exit events stored within the time span of its samples are deleted, so
+re-running a backfill is safe. Events outside the samples still stored
+(older ones whose samples have expired) and other event types are kept.
+With ``since``, the detector starts in the state of the last enter/exit
+event before it, its EMA warmed up on the samples just before it.
+"""
+
+import math
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from pymongo import ASCENDING, DESCENDING, UpdateMany
+
+from machine_learning_client import segments
+from machine_learning_client.detector import GOOD, SLOUCH, SlouchDetector
+
+_EPOCH = datetime(1970, 1, 1)
+_MS = timedelta(milliseconds=1)
+_EVENT_TYPES = {SLOUCH: "enter_slouch", GOOD: "exit_slouch"}
+_STATES = {kind: state for state, kind in _EVENT_TYPES.items()}
+_DETECTOR_EVENTS = {"type": {"$in": list(_STATES)}}
+_PROJECTION = {"_id": 0, "ts": 1, "slouch_prob": 1, "label": 1}
+# Samples before ``since`` the EMA is warmed up on: their weight in it is
+# (1 - alpha) ** 200, well below float64 resolution at the default alpha.
+_WARMUP = 200
+
+
+def ema(values, alpha, prev=None):
+    """Exponential moving average of ``values`` continuing from ``prev``.
+
+    The recurrence ``e += alpha * (x - e)`` is evaluated in closed form
+    (scaled cumulative sums) over blocks short enough that the scale factors
+    stay well inside float64 range.
+    """
+    x = np.asarray(values, dtype=np.float64)
+    if alpha >= 1 or x.size == 0:
+        return x.copy()
+    decay = 1.0 - alpha
+    block = max(1, min(4096, int(250 / -math.log10(decay))))
+    powers = decay ** np.arange(1, min(block, len(x)) + 1)
+    out = np.empty_like(x)
+    last = x[0] if prev is None else prev
+    for start in range(0, len(x), block):
+        chunk = x[start : start + block]
+        p = powers[: len(chunk)]
+        out[start : start + len(chunk)] = p * (last + alpha * np.cumsum(chunk / p))
+        last = out[start + len(chunk) - 1]
+    return out
+
+
+def _runs(mask):
+    """Start and (exclusive) end indices of the runs of True in ``mask``."""
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], mask, [False]))))
+    return edges[::2], edges[1::2]
+
+
+def transitions(ts_ms, smoothed, detector, pending_ms=None):
+    """Indices and new states of the detector transitions in one chunk.
+
+    ``detector`` supplies the thresholds, dwell time and starting ``state``;
+    ``pending_ms`` is when an unfinished crossing at the end of the
+    previous chunk began. Returns ``(events, state, pending_ms)``, where
+    ``events`` is a list of ``(index, state)``. The loop runs once per
+    threshold crossing, not once per sample.
+    """
+    # pylint: disable=too-many-locals
+    n = len(ts_ms)
+    runs = {
+        SLOUCH: _runs(smoothed >= detector.enter),
+        GOOD: _runs(smoothed <= detector.exit),
+    }
+    dwell_ms = detector.min_dwell * 1000.0
+    state, events, pos = detector.state, [], 0
+    if state is None and n:
+        state = SLOUCH if smoothed[0] >= detector.enter else GOOD
+        events.append((0, state))
+        pos, pending_ms = 1, None
+    while pos < n:
+        target = GOOD if state == SLOUCH else SLOUCH
+        starts, ends = runs[target]
+        k = np.searchsorted(ends, pos, side="right")
+        if k == len(ends):
+            return events, state, None
+        start, end = max(int(starts[k]), pos), int(ends[k])
+        if start != 0 or pending_ms is None:
+            pending_ms = ts_ms[start]
+        # First sample of the run that is ``min_dwell`` past its start.
+        fire = start + int(np.searchsorted(ts_ms[start:end], pending_ms + dwell_ms))
+        if fire < end:
+            events.append((fire, target))
+            state, pending_ms, pos = target, None, fire + 1
+        elif end == n:
+            return events, state, pending_ms
+        else:
+            pos = end
+    return events, state, None
+
+
+class _Chunk:
+    """Column buffers for one batch of streamed samples."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, size):
+        self.ts = [None] * size
+        self.ts_ms = np.empty(size, dtype=np.int64)
+        self.prob = np.empty(size, dtype=np.float64)
+        self.slouch = np.empty(size, dtype=bool)
+        self.n = 0
+
+    def add(self, doc):
+        """Append one projected sample document."""
+        i = self.n
+        self.ts[i] = doc["ts"]
+        self.ts_ms[i] = (doc["ts"].replace(tzinfo=None) - _EPOCH) // _MS
+        self.prob[i] = doc.get("slouch_prob", 0.0)
+        self.slouch[i] = doc.get("label") == SLOUCH
+        self.n += 1
+
+
+class _SourceState:
+    """Detector state carried from one chunk of a source to the next."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.ema = None
+        self.pending_ms = None
+        self.last_ts = None
+
+
+def _relabel(database, chunk, threshold, match):
+    """Write back labels that differ under ``threshold``; return how many.
+
+    Each label is set with one ``UpdateMany`` over the ``ts`` span of the
+    samples changing to it. The filter also requires a probability that
+    calls for that label, so other samples in the span (``ts`` ties from the
+    next chunk included) only change when they need to as well.
+    """
+    slouch = chunk.prob[: chunk.n] >= threshold
+    changed = slouch != chunk.slouch[: chunk.n]
+    updates = []
+    for label, wanted, prob in (
+        (SLOUCH, slouch, {"$gte": threshold}),
+        (GOOD, ~slouch, {"$lt": threshold}),
+    ):
+        picked = np.flatnonzero(changed & wanted)
+        if len(picked):
+            span = {"$gte": chunk.ts[picked[0]], "$lte": chunk.ts[picked[-1]]}
+            query = {**match, "ts": span, "slouch_prob": prob, "label": {"$ne": label}}
+            updates.append(UpdateMany(query, {"$set": {"label": label}}))
+    if updates:
+        database.samples.bulk_write(updates, ordered=False)
+    return int(changed.sum())
+
+
+def _replace_events(database, chunk, carry, match, events):
+    """Swap the stored enter/exit events in the chunk's span for ``events``.
+
+    The span runs from the chunk's first sample (or just past the previous
+    chunk's last one) to its last, so the gaps between chunks are covered
+    and nothing the chunks did not read is deleted.
+    """
+    if carry.last_ts is None:
+        span = {"$gte": chunk.ts[0]}
+    else:
+        span = {"$gt": carry.last_ts}
+    carry.last_ts = span["$lte"] = chunk.ts[chunk.n - 1]
+    database.events.delete_many({**match, **_DETECTOR_EVENTS, "ts": span})
+    if events:
+        database.events.insert_many(events, ordered=False)
+
+
+def _process_chunk(database, chunk, threshold, carry, match):
+    tags = {k: v for k, v in match.items() if v is not None}
+    relabeled = _relabel(database, chunk, threshold, match)
+    prob = chunk.prob[: chunk.n]
+    smoothed = ema(prob, carry.detector.alpha, carry.ema)
+    found, carry.detector.state, carry.pending_ms = transitions(
+        chunk.ts_ms[: chunk.n], smoothed, carry.detector, carry.pending_ms
+    )
+    carry.ema = smoothed[-1]
+    events = []
+    now = datetime.now(timezone.utc)
+    for i, state in found:
+        event = {"ts": chunk.ts[i], "type": _EVENT_TYPES[state], "prob": float(prob[i])}
+        events.append({**event, **tags, "ingested_at": now})
+    _replace_events(database, chunk, carry, match, events)
+    return relabeled, len(events)
+
+
+def reprocess(database, threshold, *, since=None, batch_size=50_000, progress=None):
+    """Relabel samples and regenerate events from ``since`` (default: all).
+
+    ``progress`` is called with a stats dict after every chunk. Returns the
+    final stats: samples read, labels changed, events written, seconds and
+    samples per second. Raises ValueError with ``SAMPLE_COMPRESSION=segments``:
+    segments keep one label and a few statistics per run, not the samples the
+    labels and events would be recomputed from.
+    """
+    # pylint: disable=too-many-locals
+    if segments.COMPRESSION:
+        raise ValueError(
+            "SAMPLE_COMPRESSION=segments stores runs, not samples; "
+            "backfill can only reprocess uncompressed samples"
+        )
+    stats = {"samples": 0, "relabeled": 0, "events": 0, "seconds": 0.0, "rate": 0.0}
+    started = time.perf_counter()
+    for user, source_id in _partitions(database):
+        match = {"user": user, "source_id": source_id}
+        query = dict(match)
+        carry = _SourceState(SlouchDetector.from_env(threshold))
+        if since:
+            query["ts"] = {"$gte": since}
+            _seed(database, carry, match, since)
+        cursor = (
+            database.samples.find(query, _PROJECTION)
+            .sort("ts", ASCENDING)
+            .batch_size(batch_size)
+        )
+        chunk = _Chunk(batch_size)
+        for doc in cursor:
+            chunk.add(doc)
+            if chunk.n == batch_size:
+                _flush(database, chunk, threshold, carry, match, stats)
+                _report(stats, started, progress)
+                chunk.n = 0
+        if chunk.n:
+            _flush(database, chunk, threshold, carry, match, stats)
+            _report(stats, started, progress)
+    _report(stats, started, None)
+    return stats
+
+
+def _seed(database, carry, match, since):
+    """Start ``carry`` where the detector stood just before ``since``: the
+    state of the last enter/exit event, the EMA of the samples before it. A
+    crossing still within its dwell time at ``since`` starts over."""
+    last = database.events.find_one(
+        {**match, **_DETECTOR_EVENTS, "ts": {"$lt": since}},
+        sort=[("ts", DESCENDING)],
+    )
+    if last is not None:
+        carry.detector.state = _STATES[last["type"]]
+    recent = (
+        database.samples.find({**match, "ts": {"$lt": since}}, {"slouch_prob": 1})
+        .sort("ts", DESCENDING)
+        .limit(_WARMUP)
+    )
+    prob = [doc.get("slouch_prob", 0.0) for doc in recent][::-1]
+    if prob:
+        carry.ema = ema(prob, carry.detector.alpha)[-1]
+
+
+def _partitions(database):
+    """``(user, source_id)`` pairs whose samples are reprocessed separately;
+    None (untagged) comes first."""
+    users = [u for u in database.samples.distinct("user") if u is not None]
+    for user in [None, *users]:
+        sources = database.samples.distinct("source_id", {"user": user})
+        for source_id in [None, *(s for s in sources if s is not None)]:
+            yield user, source_id
+
+
+def _flush(database, chunk, threshold, carry, match, stats):
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    relabeled, events = _process_chunk(database, chunk, threshold, carry, match)
+    stats["samples"] += chunk.n
+    stats["relabeled"] += relabeled
+    stats["events"] += events
+
+
+def _report(stats, started, progress):
+    stats["seconds"] = time.perf_counter() - started
+    stats["rate"] = stats["samples"] / stats["seconds"] if stats["seconds"] else 0.0
+    if progress:
+        progress(dict(stats))
+
+
+def print_progress(stats):
+    """Default progress reporter: one overwritten line on stderr."""
+    sys.stderr.write(
+        f"\r{stats['samples']:,} samples, {stats['relabeled']:,} relabeled, "
+        f"{stats['events']:,} events, {stats['rate']:,.0f} samples/s"
+    )
+    sys.stderr.flush()
@@ -0,0 +1,228 @@
+"""Long-lived frame capture feeding a bounded, drop-oldest queue.
+
+A :class:`CaptureThread` keeps one capture device (or video file, or a
+synthetic generator) open for the whole session and pushes timestamped
+frames into a :class:`FrameQueue`. A consumer (see
+:class:`FramePipeline`) preprocesses, runs inference and writes results on
+its own schedule; when it falls behind, the oldest frames are dropped so
+the consumer always works on recent data.
+
+OpenCV and NumPy are imported where a source is opened, not at import time.
+"""
+
+# pylint: disable=no-member,import-outside-toplevel
+
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from machine_learning_client import telemetry
+
+FRAMES_CAPTURED = telemetry.Counter(
+    "posture_frames_captured_total", "Frames read from the capture source."
+)
+FRAMES_DROPPED = telemetry.Counter(
+    "posture_frames_dropped_total", "Frames superseded before they were processed."
+)
+FRAME_READ_SECONDS = telemetry.Histogram(
+    "posture_frame_read_seconds", "Time to read one frame from the source."
+)
+CAPTURE_FPS = telemetry.Gauge(
+    "posture_capture_fps", "Frames captured per second over the last interval."
+)
+
+
+class SyntheticSource:
+    """Camera-like source of generated BGR frames, for benchmarks and tests.
+
+    ``fps`` paces ``read()`` like a real device; ``None`` runs unthrottled.
+    ``frames`` limits the total, after which ``read()`` reports end of stream.
+    """
+
+    def __init__(self, width=640, height=480, fps=None, frames=None, seed=0):
+        import numpy as np
+
+        rng = np.random.default_rng(seed)
+        self._base = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        self.fps = fps
+        self.frames = frames
+        self.count = 0
+        self._next = time.perf_counter()
+
+    def isOpened(self):  # pylint: disable=invalid-name
+        """Always open, like a working camera."""
+        return True
+
+    def read(self):
+        """Return ``(ok, frame)`` like ``cv2.VideoCapture.read``."""
+        if self.frames is not None and self.count >= self.frames:
+            return False, None
+        if self.fps:
+            self._next += 1.0 / self.fps
+            delay = self._next - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        frame = self._base.copy()
+        frame[0, 0, 0] = self.count % 256
+        self.count += 1
+        return True, frame
+
+    def release(self):
+        """Nothing to free; present for ``cv2.VideoCapture`` compatibility."""
+
+
+def open_source(spec):
+    """Open a frame source from a device index, file/stream path or
+    ``synthetic[:WxH[@fps]]``."""
+    if isinstance(spec, str) and spec.startswith("synthetic"):
+        width, height, fps = 640, 480, None
+        _, _, params = spec.partition(":")
+        if params:
+            size, _, rate = params.partition("@")
+            width, height = (int(v) for v in size.lower().split("x"))
+            fps = float(rate) if rate else None
+        return SyntheticSource(width, height, fps)
+    if isinstance(spec, str) and spec.isdigit():
+        spec = int(spec)
+    import cv2
+
+    return cv2.VideoCapture(spec)
+
+
+class FrameQueue:
+    """Bounded queue of ``(ts, frame)`` that drops the oldest item when full."""
+
+    def __init__(self, maxsize=4):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, item):
+        """Enqueue without blocking, evicting the oldest item if full."""
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                    FRAMES_DROPPED.inc()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Dequeue the oldest item, raising ``queue.Empty`` after ``timeout``."""
+        return self._queue.get(timeout=timeout)
+
+
+class CaptureThread(threading.Thread):
+    """Reads frames from an open source until stopped or the stream ends."""
+
+    def __init__(self, source, frames, max_failures=30):
+        super().__init__(name="capture", daemon=True)
+        self.source = source
+        self.frames = frames
+        self.max_failures = max_failures
+        self.captured = 0
+        self.finished = threading.Event()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """Ask the thread to exit after the current read."""
+        self._stop_event.set()
+
+    def run(self):
+        failures = 0
+        try:
+            while not self._stop_event.is_set():
+                with FRAME_READ_SECONDS.time():
+                    ok, frame = self.source.read()
+                if not ok:
+                    failures += 1
+                    if failures >= self.max_failures or self.source_ended():
+                        break
+                    time.sleep(0.01)
+                    continue
+                failures = 0
+                self.captured += 1
+                FRAMES_CAPTURED.inc()
+                self.frames.put((datetime.now(timezone.utc), frame))
+        finally:
+            self.source.release()
+            self.finished.set()
+
+    def source_ended(self):
+        """True for finite sources (files, bounded synthetic) at their end."""
+        if isinstance(self.source, SyntheticSource):
+            return self.source.frames is not None
+        get = getattr(self.source, "get", None)
+        if get is None:
+            return False
+        import cv2
+
+        total = get(cv2.CAP_PROP_FRAME_COUNT)
+        return 0 < total <= get(cv2.CAP_PROP_POS_FRAMES)
+
+
+class FramePipeline:
+    """Capture thread plus an inference/writer stage on the calling thread.
+
+    ``handle(ts, frame)`` is called for every frame the consumer takes from
+    the queue, so capture never waits on preprocessing, inference or writes.
+    """
+
+    def __init__(self, source, handle, queue_size=4):
+        self.frames = FrameQueue(queue_size)
+        self.capture = CaptureThread(source, self.frames)
+        self.handle = handle
+        self.processed = 0
+        self.started_at = None
+        self.elapsed = 0.0
+
+    def run(self, duration=None, min_interval=0.0):
+        """Consume frames until the source ends, ``duration`` seconds pass or
+        KeyboardInterrupt. ``min_interval`` throttles how often frames are
+        handled; frames arriving in between are simply superseded."""
+        self.started_at = time.perf_counter()
+        self.capture.start()
+        last = 0.0
+        rate = (self.started_at, 0)
+        try:
+            while duration is None or self._elapsed() < duration:
+                try:
+                    ts, frame = self.frames.get(timeout=0.1)
+                except queue.Empty:
+                    if self.capture.finished.is_set():
+                        break
+                    continue
+                now = time.perf_counter()
+                if now - rate[0] >= 1.0:
+                    captured = self.capture.captured
+                    CAPTURE_FPS.set((captured - rate[1]) / (now - rate[0]))
+                    rate = (now, captured)
+                if min_interval and now - last < min_interval:
+                    continue
+                last = now
+                self.handle(ts, frame)
+                self.processed += 1
+        finally:
+            self.capture.stop()
+            self.capture.join(timeout=1.0)
+            self.elapsed = self._elapsed()
+        return self.stats()
+
+    def _elapsed(self):
+        return time.perf_counter() - self.started_at
+
+    def stats(self):
+        """Frame counts and sustained rates for the run so far."""
+        elapsed = self.elapsed or self._elapsed()
+        return {
+            "seconds": elapsed,
+            "captured": self.capture.captured,
+            "processed": self.processed,
+            "dropped": self.frames.dropped,
+            "capture_fps": self.capture.captured / elapsed if elapsed else 0.0,
+            "processed_fps": self.processed / elapsed if elapsed else 0.0,
+        }
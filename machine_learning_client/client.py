@@ -1,47 +1,112 @@
-"""ML client that writes posture samples and events to MongoDB"""
+"""ML client that writes posture samples and events to MongoDB
 
-# pylint: disable=no-member
+OpenCV, NumPy and the model/preprocessing modules that need them are
+imported by the functions that use them, and ``db`` connects on first use,
+so importing this module (tests, ``--test-camera``, dummy ingest) stays fast
+and makes no network round trip.
+"""
 
+# pylint: disable=no-member,import-outside-toplevel
+
+import multiprocessing
 import os
-import time
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
 
-import cv2
-import numpy as np
-from pymongo import MongoClient, DESCENDING
+from pymongo import MongoClient
 from pymongo.server_api import ServerApi
 
+from machine_learning_client.capture import FramePipeline, open_source
+from machine_learning_client.detector import SlouchDetector
+from machine_learning_client import segments, telemetry
+from machine_learning_client.writer import BufferedWriter
+
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "my-pose-model")
 
+PREPROCESS_SECONDS = telemetry.Histogram(
+    "posture_preprocess_seconds", "Time to preprocess one frame."
+)
+INFERENCE_SECONDS = telemetry.Histogram(
+    "posture_inference_seconds", "Time to run the classifier on one frame."
+)
+
 
 def _get_db():
     mongo_url = os.getenv("MONGO_URL")
     db_name = os.getenv("MONGO_DB", "posture")
 
     if mongo_url:
-        client = MongoClient(mongo_url)
+        client = MongoClient(mongo_url, event_listeners=[telemetry.CommandTimer()])
     else:
         user = os.getenv("MONGO_USERNAME")
         password = os.getenv("MONGO_PASSWORD")
         host = os.getenv("MONGO_HOST", "ribs.xo4actr.mongodb.net")
         app_name = os.getenv("APP_NAME", "RIBS")
         uri = f"mongodb+srv://{user}:{password}@{host}/?appName={app_name}"
-        client = MongoClient(uri, server_api=ServerApi("1"))
+        client = MongoClient(
+            uri,
+            server_api=ServerApi("1"),
+            event_listeners=[telemetry.CommandTimer()],
+        )
 
     return client[db_name]
 
 
-db = _get_db()
+class _LazyDatabase:
+    """Stands in for the database returned by ``factory`` and creates it on
+    first attribute or item access."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._database = None
+        self._lock = threading.Lock()
+
+    def _resolve(self):
+        if self._database is None:
+            with self._lock:
+                if self._database is None:
+                    self._database = self._factory()
+        return self._database
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __getitem__(self, name):
+        return self._resolve()[name]
+
+
+db = _LazyDatabase(_get_db)
 threshold = float(os.getenv("SLOUCH_THRESHOLD", "0.6"))
+# Local NDJSON file the live loop spools to while MongoDB is unreachable.
+SPOOL_PATH = os.getenv("ML_SPOOL_PATH", os.path.join(os.getcwd(), "ml-spool.ndjson"))
+# Tenant every sample and event is stored under (unset: the anonymous one);
+# the dashboard shows it with ?user= or the X-Posture-User header.
+USER = os.getenv("POSTURE_USER") or None
 
+# Event detector (and, when compressing, open segment) for samples this
+# process writes to ``db``; kept in memory and replaced if ``db`` changes.
+_detector_state = {"db": None, "detector": None, "encoder": None, "writer": None}
 
-def load_model():
-    """Load the posture estimation model."""
-    print("tensorflowjs import and related code removed.")
+
+def load_model(model_dir=MODEL_PATH):
+    """Load the Teachable Machine classifier head, or None if unavailable."""
+    from machine_learning_client.model import PoseClassifier
+
+    try:
+        return PoseClassifier.from_dir(model_dir)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Could not load model from {model_dir}: {e}")
+        return None
 
 
 def get_webcam_frame():
     """Capture a frame from the webcam."""
+    import cv2
+
     cap = cv2.VideoCapture(0)
     if not cap.isOpened():
         return None
@@ -49,6 +114,13 @@ def get_webcam_frame():
     cap.release()
     if not ret:
         return None
+    return preprocess_frame(frame)
+
+
+def preprocess_frame(frame):
+    """Resize a BGR frame to the model input and scale it to [0, 1] RGB."""
+    import cv2
+    import numpy as np
 
     frame = cv2.resize(frame, (257, 257))
     frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
@@ -61,45 +133,79 @@ def predict_posture(model, frame):
     """Predict the posture based on the frame."""
     try:
         predictions = model.predict(frame)
-        slouch_prob = predictions[0][0]
+        slouch_prob = predictions[0][getattr(model, "slouch_index", 0)]
         return float(slouch_prob)
     except (AttributeError, IndexError, ValueError) as e:
         print(f"Error during prediction: {e}")
         return None
 
 
+def predict_posture_batch(model, features):
+    """Slouch probabilities for a ``(n, features)`` batch in one forward pass."""
+    predictions = model.predict(features)
+    return predictions[:, getattr(model, "slouch_index", 0)]
+
+
 def log_event(event_type: str, prob: float):
     """Log an event to the database."""
-    event = {
-        "ts": datetime.now(timezone.utc),
-        "type": event_type,
-        "prob": float(prob),
-    }
+    now = datetime.now(timezone.utc)
+    event = {"ts": now, "type": event_type, "prob": float(prob), "ingested_at": now}
+    if USER is not None:
+        event["user"] = USER
     db.events.insert_one(event)
     return event
 
 
-def _latest_label():
-    """Get the latest label from the samples."""
-    doc = db.samples.find_one(sort=[("ts", DESCENDING)])
-    return doc.get("label") if doc else None
+def _detector():
+    """The event detector for the current ``db``."""
+    if _detector_state["db"] is not db:
+        _detector_state["db"] = db
+        _detector_state["detector"] = SlouchDetector.from_env(threshold)
+        _detector_state["encoder"] = (
+            segments.SegmentEncoder(user=USER) if segments.COMPRESSION else None
+        )
+        # One sample per call: hold the open segment instead of rewriting it.
+        _detector_state["writer"] = (
+            segments.SegmentWriter(db.segments) if segments.COMPRESSION else None
+        )
+    return _detector_state["detector"]
 
 
-def ingest_dummy_sample(prob=0.5):
-    """Ingest a dummy sample for testing."""
-    previous_label = _latest_label()
+def _encoder():
+    """The segment encoder for the current ``db`` (None unless compressing)."""
+    _detector()
+    return _detector_state.get("encoder")
+
+
+def _store_sample(slouch_prob, ts=None):
+    """Insert a sample and log the event it completes, if any."""
+    now = datetime.now(timezone.utc)
     doc = {
-        "ts": datetime.now(timezone.utc),
-        "slouch_prob": float(prob),
-        "label": "slouch" if prob >= threshold else "good",
+        "ts": ts or now,
+        "slouch_prob": float(slouch_prob),
+        "label": "slouch" if slouch_prob >= threshold else "good",
+        "ingested_at": now,
     }
-    db.samples.insert_one(doc)
-    if previous_label != doc["label"]:
-        event_type = "enter_slouch" if doc["label"] == "slouch" else "exit_slouch"
-        log_event(event_type, doc["slouch_prob"])
+    if USER is not None:
+        doc["user"] = USER
+    encoder = _encoder()
+    if encoder is None:
+        db.samples.insert_one(doc)
+    else:
+        with encoder.lock:
+            _detector_state["writer"].submit(encoder.add(doc))
+    telemetry.SAMPLES_INGESTED.inc(None)
+    event = _detector().update(doc["slouch_prob"], doc["ts"])
+    if event:
+        log_event(event["type"], event["prob"])
     return doc
 
 
+def ingest_dummy_sample(prob=0.5):
+    """Ingest a dummy sample for testing."""
+    return _store_sample(prob)
+
+
 def ingest_live_sample(model):
     """Ingest a live sample from the webcam."""
     frame = get_webcam_frame()
@@ -107,52 +213,202 @@ def ingest_live_sample(model):
         print("Failed to capture webcam frame")
         return None
 
+    return ingest_frame(model, frame)
+
+
+def ingest_frame(model, frame, ts=None):
+    """Predict on a preprocessed frame and store the sample (and event)."""
     slouch_prob = predict_posture(model, frame)
     if slouch_prob is None:
         print("Failed to get prediction")
         return None
 
-    previous_label = _latest_label()
-    doc = {
-        "ts": datetime.now(timezone.utc),
-        "slouch_prob": float(slouch_prob),
-        "label": "slouch" if slouch_prob >= threshold else "good",
-    }
-    db.samples.insert_one(doc)
+    return _store_sample(slouch_prob, ts)
 
-    if previous_label != doc["label"]:
-        event_type = "enter_slouch" if doc["label"] == "slouch" else "exit_slouch"
-        log_event(event_type, doc["slouch_prob"])
 
-    return doc
+def model_mismatch(model):
+    """Why ``model`` cannot take the capture pipeline's frames, or None.
+
+    The pipeline hands the model preprocessed 257x257 RGB images; a
+    :class:`~machine_learning_client.model.PoseClassifier` head takes PoseNet
+    feature vectors of ``input_size`` values instead. Models that do not
+    declare ``input_size`` are trusted.
+    """
+    from machine_learning_client import preprocess
+
+    expected = getattr(model, "input_size", None)
+    produced = preprocess.FEATURE_SIZE
+    if expected is None or expected == produced:
+        return None
+    return (
+        f"model expects {expected} input values per frame but the capture "
+        f"pipeline produces {produced} (a preprocessed image, not PoseNet features)"
+    )
+
+
+def _monitor(model, source, writer, interval=0, duration=None):
+    """Capture from ``source``, predict every frame and submit it to ``writer``."""
+    from machine_learning_client import preprocess
+
+    pre = preprocess.FramePreprocessor()
+    tag = f"[{writer.source_id}] " if writer.source_id is not None else ""
+
+    def handle(ts, frame):
+        with PREPROCESS_SECONDS.time():
+            features = pre.process(frame)
+        with INFERENCE_SECONDS.time():
+            slouch_prob = predict_posture(model, features)
+        if slouch_prob is None:
+            return
+        result = writer.submit(slouch_prob, ts)
+        print(
+            f"{tag}{result['ts']}: {result['label']} "
+            f"(prob: {result['slouch_prob']:.2f})"
+        )
+
+    try:
+        return FramePipeline(open_source(source), handle).run(
+            duration=duration, min_interval=interval
+        )
+    finally:
+        writer.close()
 
 
-def run_monitoring_loop(interval=5):
-    """Run the posture monitoring loop."""
-    load_model()
-    model = None
+def _serve_metrics(port):
+    if port is None:
+        return
+    telemetry.serve(port)
+    print(f"Serving metrics on :{port}/metrics")
+
+
+def run_monitoring_loop(interval=0, source=0, metrics_port=None):
+    """Run the posture monitoring loop.
+
+    A capture thread keeps ``source`` open and queues frames; this thread
+    preprocesses and predicts each one and hands the result to a
+    :class:`BufferedWriter`, which batches the Mongo writes in the
+    background. ``interval`` optionally spaces stored samples by at least
+    that many seconds. With ``metrics_port``, timing metrics are served on
+    ``http://host:metrics_port/metrics``.
+    """
+    model = load_model()
     if model is None:
         print("Failed to load model. Exiting.")
         return
+    mismatch = model_mismatch(model)
+    if mismatch:
+        print(f"Refusing to start: {mismatch}")
+        return
 
-    print(f"Starting posture monitoring (interval: {interval}s)")
+    print(f"Starting posture monitoring (source: {source}, interval: {interval}s)")
     print(f"Slouch threshold: {threshold}")
     print("Press Ctrl+C to stop")
-
+    _serve_metrics(metrics_port)
+
+    writer = BufferedWriter(
+        db,
+        threshold,
+        spool_path=SPOOL_PATH,
+        detector=_detector(),
+        encoder=_encoder(),
+        user=USER,
+    )
     try:
-        while True:
-            result = ingest_live_sample(model)
-            if result:
-                print(
-                    f"{result['ts']}: {result['label']} (prob: {result['slouch_prob']:.2f})"
-                )
-            time.sleep(interval)
+        stats = _monitor(model, source, writer, interval)
     except KeyboardInterrupt:
         print("\nStopped monitoring")
+        return
+    print(f"Source ended: {stats}, writer: {writer.stats}")
+
+
+def parse_sources(specs):
+    """Map ``id=spec`` entries (or bare specs, used as their own id) to
+    ``{source_id: spec}``."""
+    sources = {}
+    for entry in specs:
+        source_id, sep, spec = entry.partition("=")
+        if not sep:
+            source_id, spec = entry, entry
+        if source_id in sources:
+            raise ValueError(f"Duplicate source id: {source_id}")
+        sources[source_id] = spec
+    return sources
+
+
+def monitor_source(source_id, source, interval=0, duration=None, metrics_port=None):
+    """Process-pool worker: monitor one source with its own connection,
+    model and writer, tagging everything it stores with ``source_id``."""
+    _serve_metrics(metrics_port)
+    model = load_model()
+    if model is None:
+        return {"source_id": source_id, "error": "model unavailable"}
+    mismatch = model_mismatch(model)
+    if mismatch:
+        return {"source_id": source_id, "error": mismatch}
+    # MongoClient is not fork-safe and each process needs its own pool.
+    database = _get_db()
+    safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", source_id)
+    writer = BufferedWriter(
+        database,
+        threshold,
+        spool_path=f"{SPOOL_PATH}.{safe_id}",
+        source_id=source_id,
+        encoder=(
+            segments.SegmentEncoder(source_id=source_id, user=USER)
+            if segments.COMPRESSION
+            else None
+        ),
+        user=USER,
+    )
+    try:
+        stats = _monitor(model, source, writer, interval, duration)
+    except KeyboardInterrupt:
+        stats = {}
+    return {"source_id": source_id, **stats, "writer": writer.stats}
+
+
+def run_multi_monitoring(
+    sources, interval=0, duration=None, processes=None, metrics_port=None
+):
+    """Monitor several cameras/streams at once, one worker process each.
+
+    ``sources`` maps source ids to source specs (see :func:`parse_sources`).
+    Each worker runs its own capture thread, preprocessing and inference, so
+    sources do not contend for one interpreter. Returns each worker's stats.
+    With ``metrics_port``, worker ``i`` serves its metrics on
+    ``metrics_port + i``.
+    """
+    workers = processes or len(sources)
+    # "spawn" so workers never inherit a forked MongoClient or capture handle.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(
+                monitor_source,
+                source_id,
+                spec,
+                interval,
+                duration,
+                None if metrics_port is None else metrics_port + i,
+            )
+            for i, (source_id, spec) in enumerate(sources.items())
+        ]
+        return [future.result() for future in futures]
+
+
+def benchmark_capture(source="synthetic", seconds=5.0):
+    """Measure sustained capture + preprocessing throughput on ``source``."""
+    from machine_learning_client import preprocess
+
+    pre = preprocess.FramePreprocessor()
+    pipeline = FramePipeline(open_source(source), lambda _ts, f: pre.process(f))
+    return pipeline.run(duration=seconds)
 
 
 def test_camera():
     """Test the camera access."""
+    import cv2
+
     print("Testing camera access...")
     cap = cv2.VideoCapture(0)
 
@@ -166,15 +422,63 @@ def test_camera():
     return bool(ret)
 
 
+def _arg_value(argv, flag, default):
+    if flag in argv and argv.index(flag) + 1 < len(argv):
+        return argv[argv.index(flag) + 1]
+    return default
+
+
 if __name__ == "__main__":
     import sys
 
+    # e.g. --metrics-port 9100 to expose capture/inference timings
+    port_value = _arg_value(sys.argv, "--metrics-port", None)
+    metrics_port_arg = int(port_value) if port_value else None
     if "--test-camera" in sys.argv:
         test_camera()
     elif "--live" in sys.argv:
-        if not test_camera():
+        live_source = _arg_value(sys.argv, "--source", "0")
+        if live_source.isdigit() and not test_camera():
             print("\nCan't start monitoring without working camera.")
             sys.exit(1)
-        run_monitoring_loop()
+        run_monitoring_loop(source=live_source, metrics_port=metrics_port_arg)
+    elif "--sources" in sys.argv:
+        # e.g. --sources desk=0,hall=rtsp://cam/stream,synthetic:640x480@30
+        source_map = parse_sources(_arg_value(sys.argv, "--sources", "").split(","))
+        run_seconds = _arg_value(sys.argv, "--seconds", None)
+        for outcome in run_multi_monitoring(
+            source_map,
+            duration=float(run_seconds) if run_seconds else None,
+            metrics_port=metrics_port_arg,
+        ):
+            print(outcome)
+    elif "--backfill" in sys.argv:
+        # Relabel samples and rebuild events, e.g. after changing thresholds.
+        from machine_learning_client import backfill
+
+        since_arg = _arg_value(sys.argv, "--since", None)
+        try:
+            summary = backfill.reprocess(
+                db,
+                threshold,
+                since=datetime.fromisoformat(since_arg) if since_arg else None,
+                batch_size=int(_arg_value(sys.argv, "--batch", "50000")),
+                progress=backfill.print_progress,
+            )
+        except ValueError as e:
+            print(f"Can't backfill: {e}")
+            sys.exit(1)
+        print(f"\n{summary}")
+    elif "--bench-preprocess" in sys.argv:
+        from machine_learning_client.preprocess import compare
+
+        print(compare(preprocess_frame))
+    elif "--bench-capture" in sys.argv:
+        print(
+            benchmark_capture(
+                _arg_value(sys.argv, "--source", "synthetic"),
+                float(_arg_value(sys.argv, "--seconds", "5")),
+            )
+        )
     else:
         print(ingest_dummy_sample())
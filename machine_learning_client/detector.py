@@ -0,0 +1,96 @@
+"""Streaming slouch event detection shared by the web app and the ML client.
+
+A raw label flip on every crossing of one threshold turns a probability
+hovering around it into a storm of enter/exit events. :class:`SlouchDetector`
+instead smooths probabilities with an exponential moving average, uses
+separate enter/exit thresholds (hysteresis) and only switches state once the
+smoothed value has stayed past the opposite threshold for ``min_dwell``
+seconds. Each update is O(1) and the current state lives in the detector, so
+no database read is needed to know whether a sample starts a new event.
+
+This module has no third-party imports so the Flask app can use it without
+pulling in the ML client's dependencies.
+"""
+
+import os
+import threading
+
+SLOUCH = "slouch"
+GOOD = "good"
+_EVENT_TYPES = {SLOUCH: "enter_slouch", GOOD: "exit_slouch"}
+
+
+class SlouchDetector:
+    """EMA + hysteresis + dwell-time detector for one stream of samples.
+
+    ``update(prob, ts)`` returns an event document (``ts``, ``type``,
+    ``prob``) when the state changes, otherwise None. The first sample sets
+    the initial state right away, so a fresh detector reports where the
+    stream starts; later transitions need the smoothed probability to reach
+    ``enter`` (or drop to ``exit``) and stay there for ``min_dwell`` seconds.
+    Samples older than the last one seen are ignored.
+    """
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(self, enter=0.65, exit=0.55, min_dwell=2.0, alpha=0.3, state=None):
+        # pylint: disable=redefined-builtin
+        if exit > enter:
+            raise ValueError("exit threshold must not exceed enter threshold")
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in (0, 1]")
+        self.enter = enter
+        self.exit = exit
+        self.min_dwell = min_dwell
+        self.alpha = alpha
+        self.state = state
+        self.ema = None
+        self.last_ts = None
+        self._pending_since = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, threshold, state=None):
+        """Build a detector around ``threshold`` using ``SLOUCH_*`` overrides."""
+        return cls(
+            enter=float(os.getenv("SLOUCH_ENTER_THRESHOLD", str(threshold + 0.05))),
+            exit=float(os.getenv("SLOUCH_EXIT_THRESHOLD", str(threshold - 0.05))),
+            min_dwell=float(os.getenv("SLOUCH_MIN_DWELL_SECONDS", "2.0")),
+            alpha=float(os.getenv("SLOUCH_EMA_ALPHA", "0.3")),
+            state=state,
+        )
+
+    def update(self, prob, ts):
+        """Feed one sample; return the event it completes, if any."""
+        with self._lock:
+            if self.last_ts is not None and ts < self.last_ts:
+                return None
+            self.last_ts = ts
+            prob = float(prob)
+            if self.ema is None:
+                self.ema = prob
+            else:
+                self.ema += self.alpha * (prob - self.ema)
+
+            if self.state is None:
+                return self._switch(
+                    SLOUCH if self.ema >= self.enter else GOOD, ts, prob
+                )
+            if self.state == GOOD and self.ema >= self.enter:
+                target = SLOUCH
+            elif self.state == SLOUCH and self.ema <= self.exit:
+                target = GOOD
+            else:
+                self._pending_since = None
+                return None
+
+            if self._pending_since is None:
+                self._pending_since = ts
+            if (ts - self._pending_since).total_seconds() < self.min_dwell:
+                return None
+            return self._switch(target, ts, prob)
+
+    def _switch(self, state, ts, prob):
+        self.state = state
+        self._pending_since = None
+        return {"ts": ts, "type": _EVENT_TYPES[state], "prob": prob}
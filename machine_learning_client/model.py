@@ -0,0 +1,151 @@
+"""Pure-NumPy runtime for the Teachable Machine pose classifier head.
+
+The exported ``my-pose-model`` is a tfjs-layers ``Sequential`` of Dense and
+Dropout layers that classifies PoseNet feature vectors. This module parses
+``model.json``'s topology and ``weightsManifest``, reads the weight shards
+and runs batched float32 inference with plain matrix multiplies, so the
+client does not need TensorFlow in the container.
+"""
+
+# pylint: disable=too-few-public-methods
+
+import json
+import os
+
+import numpy as np
+
+_QUANTIZED = {"uint8": np.uint8, "uint16": np.uint16, "float16": np.float16}
+
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def _softmax(x):
+    x -= x.max(axis=1, keepdims=True)
+    np.exp(x, out=x)
+    x /= x.sum(axis=1, keepdims=True)
+    return x
+
+
+def _sigmoid(x):
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1
+    return np.reciprocal(x, out=x)
+
+
+_ACTIVATIONS = {
+    "linear": lambda x: x,
+    None: lambda x: x,
+    "relu": _relu,
+    "softmax": _softmax,
+    "sigmoid": _sigmoid,
+}
+
+
+def load_weights(model_dir, manifest):
+    """Read every weight in a tfjs ``weightsManifest`` into float32 arrays."""
+    weights = {}
+    for group in manifest:
+        buf = b"".join(
+            _read_bytes(os.path.join(model_dir, path)) for path in group["paths"]
+        )
+        offset = 0
+        for spec in group["weights"]:
+            shape = tuple(spec["shape"])
+            quant = spec.get("quantization")
+            dtype = _QUANTIZED[quant["dtype"]] if quant else np.dtype(spec["dtype"])
+            count = int(np.prod(shape))
+            arr = np.frombuffer(buf, dtype=dtype, count=count, offset=offset)
+            offset += count * np.dtype(dtype).itemsize
+            if quant and "scale" in quant:
+                arr = arr.astype(np.float32) * quant["scale"] + quant["min"]
+            weights[spec["name"]] = arr.astype(np.float32).reshape(shape)
+    return weights
+
+
+def _read_bytes(path):
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+class DenseLayer:
+    """Fully connected layer ``activation(x @ kernel + bias)``."""
+
+    def __init__(self, kernel, bias, activation):
+        self.kernel = np.ascontiguousarray(kernel, dtype=np.float32)
+        self.bias = None if bias is None else bias.astype(np.float32)
+        self.activation = _ACTIVATIONS[activation]
+
+    def __call__(self, x):
+        out = x @ self.kernel
+        if self.bias is not None:
+            out += self.bias
+        return self.activation(out)
+
+
+class PoseClassifier:
+    """Sequential Dense stack loaded from a Teachable Machine export.
+
+    ``predict`` takes a ``(n, features)`` batch (or a single vector) of
+    PoseNet outputs and returns ``(n, classes)`` float32 probabilities in the
+    order of :attr:`labels`.
+    """
+
+    def __init__(self, layers, labels=None):
+        self.layers = layers
+        self.labels = list(labels or [])
+        self.input_size = layers[0].kernel.shape[0]
+
+    @classmethod
+    def from_dir(cls, model_dir):
+        """Load ``model.json``, its weight shards and ``metadata.json``."""
+        with open(os.path.join(model_dir, "model.json"), encoding="utf-8") as fh:
+            spec = json.load(fh)
+        weights = load_weights(model_dir, spec["weightsManifest"])
+
+        layers = []
+        for layer in spec["modelTopology"]["config"]["layers"]:
+            config = layer["config"]
+            if layer["class_name"] == "Dense":
+                name = config["name"]
+                layers.append(
+                    DenseLayer(
+                        weights[f"{name}/kernel"],
+                        weights.get(f"{name}/bias") if config["use_bias"] else None,
+                        config.get("activation"),
+                    )
+                )
+            elif layer["class_name"] != "Dropout":  # dropout is a no-op here
+                raise ValueError(f"Unsupported layer: {layer['class_name']}")
+
+        labels = []
+        metadata_path = os.path.join(model_dir, "metadata.json")
+        if os.path.exists(metadata_path):
+            with open(metadata_path, encoding="utf-8") as fh:
+                labels = json.load(fh).get("labels", [])
+        return cls(layers, labels)
+
+    @property
+    def slouch_index(self):
+        """Column of the slouching class (first label containing "slouch"
+        that is not a negation), defaulting to 0."""
+        for i, label in enumerate(self.labels):
+            name = label.lower()
+            if "slouch" in name and "not" not in name:
+                return i
+        return 0
+
+    def predict(self, features):
+        """Batched forward pass over PoseNet feature vectors."""
+        x = np.asarray(features, dtype=np.float32)
+        if x.ndim == 1:
+            x = x[np.newaxis, :]
+        if x.ndim != 2 or x.shape[1] != self.input_size:
+            raise ValueError(
+                f"expected (n, {self.input_size}) features, got {np.shape(features)}"
+            )
+        for layer in self.layers:
+            x = layer(x)
+        return x
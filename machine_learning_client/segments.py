@@ -0,0 +1,165 @@
+"""Run-length encoding of posture samples into ``segments`` documents.
+
+With ``SAMPLE_COMPRESSION=segments`` consecutive samples of one source are
+stored as a single document per stable interval instead of one document
+each::
+
+    {"_id", "ts" (start), "end", "count", "min", "max", "sum", "mean",
+     "last", "label", "source_id", "user", "ingested_at"}
+
+A :class:`SegmentEncoder` keeps the open segment in memory and extends it
+while the label stays the same, every probability stays within
+``tolerance`` of the others and the segment is shorter than
+``max_seconds``, both in sample time and since it opened. Each call
+returns the segment documents it changed; :func:`save` upserts them by
+``_id``, so an open segment is rewritten in place and a repeated write is
+harmless. ``ingested_at`` is the UTC time the
+segment opened; it does not move when the segment is extended, and a
+segment stamped ``max_seconds`` ago is final (the history reports rely on
+this).
+
+Writers that get one sample at a time go through a :class:`SegmentWriter`,
+which holds the changed segments for up to ``SEGMENT_FLUSH_SECONDS`` and
+writes them together, instead of rewriting the open segment per sample.
+"""
+
+import os
+import threading
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+COMPRESSION = os.getenv("SAMPLE_COMPRESSION", "none") == "segments"
+# Upper bound on a segment's duration; readers widen range queries by it.
+MAX_SECONDS = float(os.getenv("SEGMENT_MAX_SECONDS", "30"))
+TOLERANCE = float(os.getenv("SEGMENT_TOLERANCE", "0.05"))
+# Seconds a SegmentWriter holds changes before writing them (0: at once).
+FLUSH_SECONDS = float(os.getenv("SEGMENT_FLUSH_SECONDS", "1.0"))
+
+
+class SegmentEncoder:
+    """Folds one source's samples (in ``ts`` order) into segments.
+
+    ``lock`` is held by callers that must also serialize the writes of the
+    segments they get back.
+    """
+
+    def __init__(
+        self, tolerance=TOLERANCE, max_seconds=MAX_SECONDS, source_id=None, user=None
+    ):
+        self.tolerance = tolerance
+        self.max_seconds = max_seconds
+        self.source_id = source_id
+        self.user = user
+        self.current = None
+        self.lock = threading.RLock()
+
+    def _fits(self, ts, prob, label, now):
+        seg = self.current
+        return (
+            seg is not None
+            and label == seg["label"]
+            and seg["end"] <= ts
+            and (ts - seg["ts"]).total_seconds() <= self.max_seconds
+            and (now - seg["ingested_at"]).total_seconds() <= self.max_seconds
+            and max(seg["max"], prob) - min(seg["min"], prob) <= self.tolerance
+        )
+
+    def _open(self, ts, prob, label, now):
+        self.current = {
+            "_id": ObjectId(),
+            "ts": ts,
+            "end": ts,
+            "count": 1,
+            "min": prob,
+            "max": prob,
+            "sum": prob,
+            "mean": prob,
+            "last": prob,
+            "label": label,
+            "ingested_at": now,
+        }
+        if self.source_id is not None:
+            self.current["source_id"] = self.source_id
+        if self.user is not None:
+            self.current["user"] = self.user
+
+    def add(self, sample):
+        """Fold one ``{ts, slouch_prob, label}`` sample; return the changed
+        segments (a closed one, if any, then the open one) as copies."""
+        return self.extend([sample])
+
+    def extend(self, samples):
+        """Fold samples in order; return each changed segment once, as copies."""
+        changed = {}
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        with self.lock:
+            for sample in samples:
+                ts, prob = sample["ts"], float(sample["slouch_prob"])
+                label = sample["label"]
+                if self._fits(ts, prob, label, now):
+                    seg = self.current
+                    seg["end"] = ts
+                    seg["count"] += 1
+                    seg["min"] = min(seg["min"], prob)
+                    seg["max"] = max(seg["max"], prob)
+                    seg["sum"] += prob
+                    seg["mean"] = seg["sum"] / seg["count"]
+                    seg["last"] = prob
+                else:
+                    self._open(ts, prob, label, now)
+                changed[self.current["_id"]] = dict(self.current)
+        return list(changed.values())
+
+
+def save(collection, segments):
+    """Upsert ``segments`` by ``_id`` with one unordered bulk write."""
+    if segments:
+        collection.bulk_write(
+            [ReplaceOne({"_id": s["_id"]}, s, upsert=True) for s in segments],
+            ordered=False,
+        )
+
+
+class SegmentWriter:
+    """Coalesces the segment upserts of a writer fed one sample at a time.
+
+    :meth:`submit` keeps the newest copy of each changed segment. They are
+    written together with one :func:`save` ``interval`` seconds after the
+    first was held, by a timer if no further sample comes, or at once with
+    ``flush=True``. Submitting with the encoder's ``lock`` held keeps the
+    copies in order, so a stale one never overwrites a newer one. A failed
+    write keeps the held copies for the next attempt.
+    """
+
+    def __init__(self, collection, interval=FLUSH_SECONDS):
+        self.collection = collection
+        self.interval = interval
+        self._pending = {}
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def submit(self, segments, flush=False):
+        """Hold ``segments`` (copies from the encoder) for the next write."""
+        with self._lock:
+            for seg in segments:
+                self._pending[seg["_id"]] = seg
+            if flush or self.interval <= 0:
+                self._write()
+            elif self._pending and self._timer is None:
+                # Not a daemon: held segments are written before exit.
+                self._timer = threading.Timer(self.interval, self.flush)
+                self._timer.start()
+
+    def flush(self):
+        """Write every held segment now."""
+        with self._lock:
+            self._write()
+
+    def _write(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        save(self.collection, list(self._pending.values()))
+        self._pending.clear()
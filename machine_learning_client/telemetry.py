@@ -0,0 +1,270 @@
+"""Prometheus-style counters, gauges and histograms for hot-path timing.
+
+Shared by the web app (served on ``/metrics``) and the ML client (served by
+:func:`serve` when started with ``--metrics-port``). Metrics register
+themselves when they are created, normally at import time; :func:`render`
+produces the Prometheus text exposition format. Only families with at least
+one observation are rendered.
+
+Values live in the process that records them and are never shared or summed
+across processes, which is why the web app runs a single gunicorn worker
+(see ``gunicorn.conf.py``): each replica or ML client worker is scraped as
+its own target and aggregated in Prometheus.
+
+With ``METRICS_ENABLED=0`` every ``inc``/``set``/``observe`` returns after a
+single flag check and ``time()`` hands out a shared no-op context manager.
+"""
+
+import bisect
+import os
+import threading
+import time
+
+from pymongo import monitoring
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; spans sub-millisecond cache hits up to slow Atlas round trips.
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _number(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _label_text(self, key, extra=None):
+        pairs = [f'{n}="{_escape(v)}"' for n, v in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _key(self, labels):
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {labels}")
+        return tuple("" if v is None else v for v in labels)
+
+    def lines(self):
+        """Exposition lines for this family (empty before any observation)."""
+        with self._lock:
+            samples = self._samples()
+        if not samples:
+            return []
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"] + [
+            f"{name}{labels} {value}" for name, labels, value in samples
+        ]
+
+    def _samples(self):
+        return [
+            (self.name, self._label_text(key), _number(value))
+            for key, value in sorted(self._values.items())
+        ]
+
+    def clear(self):
+        """Forget every recorded value."""
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """Monotonic total, e.g. samples ingested or frames captured."""
+
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        """Add ``amount`` to the series for ``labels``."""
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Last value set, e.g. the current capture rate."""
+
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        """Replace the series for ``labels`` with ``value``."""
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class _Timer:
+    """Context manager observing its elapsed seconds into a histogram."""
+
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Histogram(_Metric):
+    """Bucketed distribution with sum and count, e.g. latencies in seconds."""
+
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        """Record one observation for ``labels``."""
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][slot] += 1
+            state[1] += value
+
+    def time(self, *labels):
+        """``with histogram.time(...):`` observes the block's duration."""
+        return _Timer(self, labels) if ENABLED else _NULL_TIMER
+
+    def _samples(self):
+        out = []
+        for key, (counts, total) in sorted(self._values.items()):
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                out.append(
+                    (
+                        f"{self.name}_bucket",
+                        self._label_text(key, f'le="{le}"'),
+                        str(running),
+                    )
+                )
+            out.append((f"{self.name}_sum", self._label_text(key), repr(total)))
+            out.append((f"{self.name}_count", self._label_text(key), str(running)))
+        return out
+
+
+def render():
+    """Every registered family in the Prometheus text format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = [line for metric in metrics for line in metric.lines()]
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def reset():
+    """Clear all recorded values (tests and benchmarks)."""
+    with _registry_lock:
+        metrics = list(_registry)
+    for metric in metrics:
+        metric.clear()
+
+
+# Shared by both processes.
+DB_SECONDS = Histogram(
+    "posture_db_command_seconds", "MongoDB command round-trip time.", ("command",)
+)
+SAMPLES_INGESTED = Counter(
+    "posture_samples_ingested_total", "Posture samples written.", ("source",)
+)
+
+
+class CommandTimer(monitoring.CommandListener):
+    """pymongo listener feeding :data:`DB_SECONDS`; pass it to ``MongoClient``
+    as ``event_listeners=[CommandTimer()]``."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        DB_SECONDS.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        DB_SECONDS.observe(event.duration_micros / 1e6, event.command_name)
+
+
+def serve(port, host="0.0.0.0"):
+    """Serve ``/metrics`` on ``port`` from a daemon thread; return the server."""
+    # pylint: disable=import-outside-toplevel
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # pylint: disable=invalid-name
+            """Serve ``/metrics``; 404 for anything else."""
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
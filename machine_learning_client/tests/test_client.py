@@ -1,15 +1,69 @@
 """Unit tests for the ML client helpers."""
 
-# pylint: disable=missing-function-docstring,too-few-public-methods,invalid-name,unnecessary-lambda,unused-argument,mixed-line-endings
+# pylint: disable=missing-function-docstring,too-few-public-methods,invalid-name,unnecessary-lambda,unused-argument,mixed-line-endings,protected-access
 
+import json
 import types
-from datetime import datetime, timezone
+import urllib.request
+from datetime import datetime, timedelta, timezone
 
+import cv2
 import numpy as np
 import pytest
-from pymongo import DESCENDING
+from pymongo import DESCENDING, UpdateMany
+from pymongo.errors import ServerSelectionTimeoutError
+
+from machine_learning_client import (
+    backfill,
+    capture,
+    client,
+    preprocess,
+    segments,
+    telemetry,
+    writer,
+)
+from machine_learning_client.detector import SlouchDetector
+
+_OPS = {
+    "$gte": lambda value, arg: value is not None and value >= arg,
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$in": lambda value, arg: value in arg,
+    "$ne": lambda value, arg: value != arg,
+}
+
+
+def _matches(doc, query):
+    for key, cond in (query or {}).items():
+        value = doc.get(key)
+        if isinstance(cond, dict):
+            if not all(_OPS[op](value, arg) for op, arg in cond.items()):
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+class _FakeCursor:
+    """Sortable, limitable list of documents."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction=1):
+        self.docs = sorted(self.docs, key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
 
-from machine_learning_client import client
+    def batch_size(self, _size):
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
 
 
 class _FakeCollection:
@@ -18,18 +72,43 @@ class _FakeCollection:
     def __init__(self):
         self.docs = []
 
+    def find(self, query=None, projection=None):
+        return _FakeCursor([dict(d) for d in self.docs if _matches(d, query)])
+
+    def distinct(self, key, query=None):
+        found = [d[key] for d in self.docs if key in d and _matches(d, query)]
+        return list(dict.fromkeys(found))
+
+    def delete_many(self, query):
+        self.docs = [d for d in self.docs if not _matches(d, query)]
+
     def insert_one(self, doc):
         self.docs.append(doc)
         return doc
 
-    def find_one(self, sort=None):
-        if not self.docs:
+    def insert_many(self, docs, ordered=True):
+        self.docs.extend(docs)
+        return docs
+
+    def bulk_write(self, requests, ordered=True):
+        for op in requests:
+            if isinstance(op, UpdateMany):
+                for doc in self.docs:
+                    if _matches(doc, op._filter):
+                        doc.update(op._doc["$set"])
+                continue
+            self.docs = [d for d in self.docs if d["_id"] != op._filter["_id"]]
+            self.docs.append(op._doc)
+
+    def find_one(self, query=None, sort=None):
+        docs = [d for d in self.docs if _matches(d, query)]
+        if not docs:
             return None
         if sort:
             key, order = sort[0]
             reverse = order == DESCENDING
-            return sorted(self.docs, key=lambda d: d[key], reverse=reverse)[0]
-        return self.docs[0]
+            return sorted(docs, key=lambda d: d[key], reverse=reverse)[0]
+        return docs[0]
 
 
 class _FakeDB:
@@ -38,6 +117,15 @@ class _FakeDB:
     def __init__(self):
         self.samples = _FakeCollection()
         self.events = _FakeCollection()
+        self.segments = _FakeCollection()
+
+
+def _seed_state(monkeypatch, fake_db, state):
+    """Start the client's detector in ``state`` with immediate transitions."""
+    detector = SlouchDetector(enter=0.6, exit=0.6, min_dwell=0, alpha=1, state=state)
+    monkeypatch.setattr(
+        client, "_detector_state", {"db": fake_db, "detector": detector}
+    )
 
 
 def test_log_event_writes_event(monkeypatch):
@@ -62,8 +150,7 @@ def test_ingest_dummy_sample_creates_event_on_label_change(monkeypatch):
 
 def test_ingest_dummy_sample_no_event_when_same_label(monkeypatch):
     fake_db = _FakeDB()
-    # seed previous slouch sample
-    fake_db.samples.insert_one({"ts": datetime.now(timezone.utc), "label": "slouch"})
+    _seed_state(monkeypatch, fake_db, "slouch")
 
     monkeypatch.setattr(client, "db", fake_db)
     monkeypatch.setattr(client, "threshold", 0.6)
@@ -100,8 +187,7 @@ def test_predict_posture_success():
 
 def test_ingest_live_sample_records_exit_event(monkeypatch):
     fake_db = _FakeDB()
-    # start in slouch state
-    fake_db.samples.insert_one({"ts": datetime.now(timezone.utc), "label": "slouch"})
+    _seed_state(monkeypatch, fake_db, "slouch")
 
     monkeypatch.setattr(client, "db", fake_db)
     monkeypatch.setattr(client, "threshold", 0.6)
@@ -117,13 +203,14 @@ def test_ingest_live_sample_records_exit_event(monkeypatch):
     )
     assert doc is not None
     assert doc["label"] == "good"
+    assert len(fake_db.samples.docs) == 1
     assert len(fake_db.events.docs) == 1
     assert fake_db.events.docs[0]["type"] == "exit_slouch"
 
 
 def test_ingest_live_sample_records_enter_event(monkeypatch):
     fake_db = _FakeDB()
-    fake_db.samples.insert_one({"ts": datetime.now(timezone.utc), "label": "good"})
+    _seed_state(monkeypatch, fake_db, "good")
 
     monkeypatch.setattr(client, "db", fake_db)
     monkeypatch.setattr(client, "threshold", 0.6)
@@ -147,7 +234,7 @@ def test_get_webcam_frame_handles_closed_camera(monkeypatch):
         def isOpened(self):
             return False
 
-    monkeypatch.setattr(client.cv2, "VideoCapture", lambda *_: _Cap())
+    monkeypatch.setattr(cv2, "VideoCapture", lambda *_: _Cap())
     assert client.get_webcam_frame() is None
 
 
@@ -167,7 +254,7 @@ def test_get_webcam_frame_returns_frame(monkeypatch):
         def release(self):
             self.released = True
 
-    monkeypatch.setattr(client.cv2, "VideoCapture", lambda *_: _Cap())
+    monkeypatch.setattr(cv2, "VideoCapture", lambda *_: _Cap())
     frame = client.get_webcam_frame()
     assert frame is not None
     assert frame.shape == (1, 257, 257, 3)
@@ -206,7 +293,7 @@ def test_get_webcam_frame_handles_read_failure(monkeypatch):
         def release(self):
             pass
 
-    monkeypatch.setattr(client.cv2, "VideoCapture", lambda *_: _Cap())
+    monkeypatch.setattr(cv2, "VideoCapture", lambda *_: _Cap())
     assert client.get_webcam_frame() is None
 
 
@@ -229,7 +316,7 @@ def test_test_camera_success(monkeypatch):
         def release(self):
             pass
 
-    monkeypatch.setattr(client.cv2, "VideoCapture", lambda *_: _Cap())
+    monkeypatch.setattr(cv2, "VideoCapture", lambda *_: _Cap())
     assert client.test_camera() is True
 
 
@@ -241,5 +328,603 @@ def test_test_camera_failure(monkeypatch):
         def release(self):
             pass
 
-    monkeypatch.setattr(client.cv2, "VideoCapture", lambda *_: _Cap())
+    monkeypatch.setattr(cv2, "VideoCapture", lambda *_: _Cap())
     assert client.test_camera() is False
+
+
+def test_event_state_kept_in_memory_without_reads(monkeypatch):
+    fake_db = _FakeDB()
+
+    def _no_reads(*_args, **_kwargs):
+        raise AssertionError("detector state should not be read from the db")
+
+    monkeypatch.setattr(fake_db.samples, "find_one", _no_reads)
+    monkeypatch.setattr(client, "db", fake_db)
+    monkeypatch.setattr(client, "threshold", 0.6)
+
+    client.ingest_dummy_sample(prob=0.9)
+    client.ingest_dummy_sample(prob=0.95)
+    assert len(fake_db.events.docs) == 1
+    assert client._detector().state == "slouch"
+
+
+def test_detector_hysteresis_and_dwell_suppress_flapping():
+    t0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    detector = SlouchDetector(enter=0.65, exit=0.55, min_dwell=2.0, alpha=0.5)
+
+    def feed(probs, start=0):
+        return [
+            e
+            for i, p in enumerate(probs)
+            if (e := detector.update(p, t0 + timedelta(seconds=start + i)))
+        ]
+
+    assert [e["type"] for e in feed([0.2])] == ["exit_slouch"]  # initial state
+    # Raw labels would flip on every one of these samples.
+    assert not feed([0.58, 0.62, 0.59, 0.63, 0.57, 0.61], start=1)
+    events = feed([0.9, 0.9, 0.9, 0.9], start=7)
+    assert [e["type"] for e in events] == ["enter_slouch"]
+    assert events[0]["ts"] == t0 + timedelta(seconds=9)  # 2 s after crossing
+    assert detector.update(0.0, t0) is None  # stale samples are ignored
+
+
+def _write_tiny_model(model_dir, rng):
+    """Export a Dense(4->3, relu) -> Dropout -> Dense(3->2, softmax) head."""
+    w1 = rng.standard_normal((4, 3)).astype(np.float32)
+    b1 = rng.standard_normal(3).astype(np.float32)
+    w2 = rng.standard_normal((3, 2)).astype(np.float32)
+    layers = [
+        {
+            "class_name": "Dense",
+            "config": {"name": "d1", "activation": "relu", "use_bias": True},
+        },
+        {"class_name": "Dropout", "config": {"name": "drop", "rate": 0.5}},
+        {
+            "class_name": "Dense",
+            "config": {"name": "d2", "activation": "softmax", "use_bias": False},
+        },
+    ]
+    manifest = [
+        {
+            "paths": ["weights.bin"],
+            "weights": [
+                {"name": "d1/kernel", "shape": [4, 3], "dtype": "float32"},
+                {"name": "d1/bias", "shape": [3], "dtype": "float32"},
+                {"name": "d2/kernel", "shape": [3, 2], "dtype": "float32"},
+            ],
+        }
+    ]
+    (model_dir / "model.json").write_text(
+        json.dumps(
+            {
+                "modelTopology": {"config": {"layers": layers}},
+                "weightsManifest": manifest,
+            }
+        )
+    )
+    (model_dir / "metadata.json").write_text(
+        json.dumps({"labels": ["not-slouching", "slouching"]})
+    )
+    (model_dir / "weights.bin").write_bytes(w1.tobytes() + b1.tobytes() + w2.tobytes())
+    return w1, b1, w2
+
+
+def test_numpy_model_matches_reference_forward_pass(tmp_path):
+    rng = np.random.default_rng(0)
+    w1, b1, w2 = _write_tiny_model(tmp_path, rng)
+    model = client.load_model(str(tmp_path))
+
+    x = rng.standard_normal((5, 4)).astype(np.float32)
+    logits = np.maximum(x @ w1 + b1, 0) @ w2
+    expected = np.exp(logits) / np.exp(logits).sum(axis=1, keepdims=True)
+
+    out = model.predict(x)
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(out, expected, rtol=1e-5)
+    assert model.slouch_index == 1
+    np.testing.assert_allclose(
+        client.predict_posture_batch(model, x), expected[:, 1], rtol=1e-5
+    )
+    assert client.predict_posture(model, x[0]) == pytest.approx(expected[0, 1])
+
+
+def test_load_model_returns_none_without_weights(tmp_path):
+    (tmp_path / "model.json").write_text(
+        json.dumps({"modelTopology": {}, "weightsManifest": [{"paths": ["x.bin"]}]})
+    )
+    assert client.load_model(str(tmp_path)) is None
+
+
+def test_frame_pipeline_consumes_synthetic_source():
+    source = capture.SyntheticSource(width=32, height=24, frames=50)
+    seen = []
+    stats = capture.FramePipeline(source, lambda ts, f: seen.append(f.shape)).run()
+    assert stats["captured"] == 50
+    assert stats["processed"] + stats["dropped"] == 50
+    assert seen and seen[0] == (24, 32, 3)
+
+
+def test_frame_queue_drops_oldest():
+    frames = capture.FrameQueue(maxsize=2)
+    for i in range(5):
+        frames.put(i)
+    assert frames.dropped == 3
+    assert [frames.get(), frames.get()] == [3, 4]
+
+
+def test_run_monitoring_loop_stores_samples_from_source(monkeypatch):
+    class _Model:
+        def predict(self, frame):
+            assert frame.shape == (1, 257, 257, 3)
+            return [[0.9]]
+
+    fake_db = _FakeDB()
+    monkeypatch.setattr(client, "db", fake_db)
+    monkeypatch.setattr(client, "threshold", 0.6)
+    monkeypatch.setattr(client, "load_model", _Model)
+    monkeypatch.setattr(
+        client,
+        "open_source",
+        lambda _spec: capture.SyntheticSource(width=64, height=48, frames=5),
+    )
+    client.run_monitoring_loop(source="synthetic")
+    assert 1 <= len(fake_db.samples.docs) <= 5
+    assert fake_db.events.docs[0]["type"] == "enter_slouch"
+
+
+def test_frame_preprocessor_matches_legacy_and_reuses_buffers():
+    rng = np.random.default_rng(1)
+    pre = preprocess.FramePreprocessor(batch_size=2)
+    first = rng.integers(0, 256, size=(480, 640, 3), dtype=np.uint8)
+    second = rng.integers(0, 256, size=(480, 640, 3), dtype=np.uint8)
+
+    out = pre.process(first, slot=1)
+    np.testing.assert_allclose(out, client.preprocess_frame(first), atol=1e-6)
+    assert out.shape == (1, 257, 257, 3) and out.dtype == np.float32
+    assert np.shares_memory(out, pre.batch)
+
+    again = pre.process(second, slot=1)
+    assert np.shares_memory(again, out)
+    np.testing.assert_allclose(
+        pre.batch[1], client.preprocess_frame(second)[0], atol=1e-6
+    )
+
+
+def test_preprocess_benchmark_reports_per_frame_cost():
+    result = preprocess.compare(client.preprocess_frame, width=64, height=48, frames=5)
+    assert result["preallocated"]["frames"] == 5
+    assert (
+        result["preallocated"]["peak_traced_bytes"]
+        < result["legacy"]["peak_traced_bytes"]
+    )
+
+
+def test_buffered_writer_batches_samples_and_events():
+    fake_db = _FakeDB()
+    w = writer.BufferedWriter(
+        fake_db,
+        0.6,
+        batch_size=1000,
+        flush_interval=60,
+        detector=SlouchDetector(enter=0.6, exit=0.6, min_dwell=0, alpha=1),
+    )
+    for prob in [0.1, 0.2, 0.9, 0.95, 0.3]:
+        w.submit(prob)
+    assert not fake_db.samples.docs  # nothing written inline
+    assert w.flush(timeout=5)
+    assert [d["label"] for d in fake_db.samples.docs] == [
+        "good",
+        "good",
+        "slouch",
+        "slouch",
+        "good",
+    ]
+    assert [e["type"] for e in fake_db.events.docs] == [
+        "exit_slouch",
+        "enter_slouch",
+        "exit_slouch",
+    ]
+    w.close()
+
+
+def test_buffered_writer_spools_and_replays(tmp_path):
+    fake_db = _FakeDB()
+
+    def _down(docs, ordered=True):
+        raise ServerSelectionTimeoutError("no servers")
+
+    spool = tmp_path / "spool.ndjson"
+    w = writer.BufferedWriter(
+        fake_db,
+        0.6,
+        flush_interval=60,
+        spool_path=str(spool),
+        retry_interval=0,
+    )
+    original = fake_db.samples.insert_many
+    fake_db.samples.insert_many = _down
+    w.submit(0.2)
+    w.submit(0.4)
+    assert w.flush(timeout=5)
+    assert w.stats["spooled"] == 2
+    assert spool.exists()
+
+    fake_db.samples.insert_many = original
+    restored = datetime.now(timezone.utc)
+    w.submit(0.3)
+    assert w.flush(timeout=5)
+    assert [d["slouch_prob"] for d in fake_db.samples.docs] == [0.2, 0.4, 0.3]
+    # Stamped when they reached MongoDB, so the history reports count them.
+    assert all(d["ingested_at"] >= restored for d in fake_db.samples.docs)
+    assert not spool.exists()
+    w.close()
+
+
+def test_parse_sources_accepts_ids_and_bare_specs():
+    assert client.parse_sources(["desk=0", "synthetic:64x48"]) == {
+        "desk": "0",
+        "synthetic:64x48": "synthetic:64x48",
+    }
+    with pytest.raises(ValueError):
+        client.parse_sources(["a=0", "a=1"])
+
+
+def test_monitor_source_tags_samples_and_events(monkeypatch, tmp_path):
+    class _Model:
+        def predict(self, frame):
+            return [[0.9]]
+
+    fake_db = _FakeDB()
+    monkeypatch.setattr(client, "_get_db", lambda: fake_db)
+    monkeypatch.setattr(client, "load_model", _Model)
+    monkeypatch.setattr(client, "SPOOL_PATH", str(tmp_path / "spool"))
+    monkeypatch.setattr(
+        client,
+        "open_source",
+        lambda _spec: capture.SyntheticSource(width=64, height=48, frames=3),
+    )
+    result = client.monitor_source("desk/1", "synthetic")
+    assert result["source_id"] == "desk/1"
+    assert fake_db.samples.docs
+    assert {d["source_id"] for d in fake_db.samples.docs} == {"desk/1"}
+    assert fake_db.events.docs[0]["source_id"] == "desk/1"
+
+
+def test_buffered_writer_tags_tenant():
+    fake_db = _FakeDB()
+    w = writer.BufferedWriter(
+        fake_db,
+        0.6,
+        flush_interval=60,
+        detector=SlouchDetector(enter=0.6, exit=0.6, min_dwell=0, alpha=1),
+        user="alice",
+    )
+    w.submit(0.9)
+    assert w.flush(timeout=5)
+    w.close()
+    assert fake_db.samples.docs[0]["user"] == "alice"
+    assert fake_db.events.docs[0]["user"] == "alice"
+
+
+def test_backfill_ema_matches_recurrence():
+    x = np.random.default_rng(2).random(10_000)
+    for alpha in (0.05, 0.3, 1.0):
+        expected, e = [], 0.4
+        for v in x:
+            e += alpha * (v - e)
+            expected.append(e)
+        np.testing.assert_allclose(backfill.ema(x, alpha, 0.4), expected, rtol=1e-9)
+
+
+def test_backfill_transitions_match_streaming_detector_across_chunks():
+    rng = np.random.default_rng(3)
+    n = 5000
+    ts_ms = np.cumsum(rng.integers(100, 900, size=n)).astype(np.int64)
+    prob = np.clip(0.6 + 0.3 * np.sin(np.arange(n) / 150) + rng.normal(0, 0.1, n), 0, 1)
+
+    t0 = datetime(2025, 1, 1)
+    reference = SlouchDetector(enter=0.65, exit=0.55, min_dwell=2.0, alpha=0.3)
+    expected = [
+        (i, e["type"])
+        for i in range(n)
+        if (e := reference.update(prob[i], t0 + timedelta(milliseconds=int(ts_ms[i]))))
+    ]
+
+    detector = SlouchDetector(enter=0.65, exit=0.55, min_dwell=2.0, alpha=0.3)
+    found, last, pending = [], None, None
+    for start in range(0, n, 777):  # chunk edges fall inside crossings
+        smoothed = backfill.ema(prob[start : start + 777], detector.alpha, last)
+        events, detector.state, pending = backfill.transitions(
+            ts_ms[start : start + 777], smoothed, detector, pending
+        )
+        found += [(start + i, backfill._EVENT_TYPES[s]) for i, s in events]
+        last = smoothed[-1]
+    assert len(expected) > 4
+    assert found == expected
+
+
+def _backfill_db(probs, t0):
+    """Samples labelled under a 0.5 threshold for two sources (one of them
+    untagged), with stale detector events and one of another type."""
+    fake_db = _FakeDB()
+    for source_id in (None, "desk"):
+        tags = {"user": "alice", "source_id": source_id} if source_id else {}
+        for i, prob in enumerate(probs):
+            ts = t0 + timedelta(seconds=i)
+            label = "slouch" if prob >= 0.5 else "good"
+            fake_db.samples.insert_one(
+                {"ts": ts, "slouch_prob": prob, "label": label, **tags}
+            )
+        fake_db.events.insert_many(
+            [
+                {"ts": t0, "type": "exit_slouch", "prob": 0.0, **tags},
+                {"ts": t0, "type": "calibrated", **tags},
+            ]
+        )
+    return fake_db
+
+
+def _events(fake_db, source_id, kinds=("enter_slouch", "exit_slouch")):
+    return sorted(
+        (e["ts"], e["type"])
+        for e in fake_db.events.docs
+        if e.get("source_id") == source_id and e["type"] in kinds
+    )
+
+
+def test_backfill_reprocess_relabels_and_rebuilds_events_per_source():
+    t0 = datetime(2025, 1, 1)
+    probs = ([0.1] * 5 + [0.95] * 12 + [0.6] * 2 + [0.1] * 12) * 2
+    fake_db = _backfill_db(probs, t0)
+    stats = backfill.reprocess(fake_db, 0.7, batch_size=4)
+
+    reference = SlouchDetector.from_env(0.7)
+    expected = [
+        (e["ts"], e["type"])
+        for i, prob in enumerate(probs)
+        if (e := reference.update(prob, t0 + timedelta(seconds=i)))
+    ]
+    assert len(expected) > 2
+    for source_id in (None, "desk"):
+        assert _events(fake_db, source_id) == expected
+        assert _events(fake_db, source_id, ["calibrated"])
+    assert all(
+        d["label"] == ("slouch" if d["slouch_prob"] >= 0.7 else "good")
+        for d in fake_db.samples.docs
+    )
+    assert stats["samples"] == 2 * len(probs)
+    assert stats["relabeled"] == 2 * probs.count(0.6)
+    assert stats["events"] == 2 * len(expected)
+
+
+def test_backfill_since_continues_from_the_state_before_it():
+    t0 = datetime(2025, 1, 1)
+    probs = ([0.1] * 5 + [0.95] * 12 + [0.6] * 2 + [0.1] * 12) * 2
+    fake_db = _backfill_db(probs, t0)
+    backfill.reprocess(fake_db, 0.7, batch_size=4)
+    full = _events(fake_db, "desk")
+    # Mid-slouch: a fresh detector would report the state it starts in.
+    since = t0 + timedelta(seconds=45)
+    stats = backfill.reprocess(fake_db, 0.7, since=since, batch_size=4)
+    assert stats["samples"] == 2 * (len(probs) - 45)
+    assert _events(fake_db, "desk") == full
+    assert _events(fake_db, None) == full
+
+
+def test_backfill_keeps_events_it_cannot_rebuild():
+    t0 = datetime(2025, 1, 1)
+    probs = ([0.1] * 5 + [0.95] * 12 + [0.1] * 12) * 2
+    fake_db = _FakeDB()
+    for i, prob in enumerate(probs):
+        fake_db.samples.insert_one(
+            {
+                "ts": t0 + timedelta(seconds=i),
+                "slouch_prob": prob,
+                "user": "alice",
+                "source_id": "desk",
+            }
+        )
+    expired = t0 - timedelta(days=30)  # its samples are gone
+    fake_db.events.insert_many(
+        [
+            {
+                "ts": expired,
+                "type": "enter_slouch",
+                "user": "alice",
+                "source_id": "desk",
+            },
+            # The anonymous, untagged partition has no samples at all.
+            {"ts": t0, "type": "exit_slouch"},
+            {"ts": t0 + timedelta(seconds=20), "type": "enter_slouch"},
+        ]
+    )
+    stats = backfill.reprocess(fake_db, 0.7, batch_size=7)
+    assert stats["events"] == 5
+    assert _events(fake_db, "desk")[0] == (expired, "enter_slouch")
+    assert len(_events(fake_db, "desk")) == 1 + stats["events"]
+    assert _events(fake_db, None) == [
+        (t0, "exit_slouch"),
+        (t0 + timedelta(seconds=20), "enter_slouch"),
+    ]
+
+
+def test_backfill_refuses_compressed_samples(monkeypatch):
+    t0 = datetime(2025, 1, 1)
+    fake_db = _backfill_db([0.1, 0.9], t0)
+    before = list(fake_db.events.docs)
+    monkeypatch.setattr(segments, "COMPRESSION", True)
+    with pytest.raises(ValueError, match="segments"):
+        backfill.reprocess(fake_db, 0.7)
+    assert fake_db.events.docs == before
+
+
+def test_telemetry_histogram_renders_cumulative_buckets():
+    hist = telemetry.Histogram("t_latency_seconds", "Test.", ("op",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        hist.observe(value, "read")
+    with hist.time("write"):
+        pass
+    text = telemetry.render()
+    assert "# TYPE t_latency_seconds histogram" in text
+    assert 't_latency_seconds_bucket{op="read",le="0.1"} 2' in text
+    assert 't_latency_seconds_bucket{op="read",le="1"} 3' in text
+    assert 't_latency_seconds_bucket{op="read",le="+Inf"} 4' in text
+    assert 't_latency_seconds_count{op="read"} 4' in text
+    assert 't_latency_seconds_count{op="write"} 1' in text
+    with pytest.raises(ValueError):
+        hist.observe(1.0)
+
+
+def test_telemetry_disabled_records_nothing(monkeypatch):
+    monkeypatch.setattr(telemetry, "ENABLED", False)
+    counter = telemetry.Counter("t_disabled_total", "Test.")
+    hist = telemetry.Histogram("t_disabled_seconds", "Test.")
+    counter.inc()
+    with hist.time():
+        hist.observe(1.0)
+    assert "t_disabled" not in telemetry.render()
+
+
+def test_telemetry_serves_metrics_endpoint():
+    telemetry.Counter("t_served_total", "Test.").inc(amount=3)
+    server = telemetry.serve(0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as res:
+            body = res.read().decode()
+            assert res.headers["Content-Type"] == telemetry.CONTENT_TYPE
+    finally:
+        server.shutdown()
+    assert "t_served_total 3" in body
+
+
+def test_monitor_records_stage_timings(monkeypatch):
+    monkeypatch.setattr(client, "predict_posture", lambda model, features: 0.4)
+    monkeypatch.setattr(
+        client,
+        "open_source",
+        lambda _spec: capture.SyntheticSource(width=64, height=48, frames=3),
+    )
+    sink = types.SimpleNamespace(
+        source_id=None,
+        submit=lambda p, ts: {"ts": ts, "label": "good", "slouch_prob": p},
+        close=lambda: None,
+    )
+    telemetry.reset()
+    stats = client._monitor(None, "synthetic", sink)
+    text = telemetry.render()
+    assert f"posture_frames_captured_total {stats['captured']}" in text
+    assert f"posture_inference_seconds_count {stats['processed']}" in text
+    assert f"posture_preprocess_seconds_count {stats['processed']}" in text
+
+
+def test_segment_encoder_splits_on_label_tolerance_and_duration():
+    start = datetime(2025, 1, 1)
+    encoder = segments.SegmentEncoder(tolerance=0.05, max_seconds=10)
+
+    def sample(i, p):
+        label = "slouch" if p >= 0.6 else "good"
+        return {"ts": start + timedelta(seconds=i), "slouch_prob": p, "label": label}
+
+    probs = [0.2, 0.22, 0.24, 0.3, 0.3, 0.7, 0.7] + [0.7] * 12
+    changed = encoder.extend([sample(i, p) for i, p in enumerate(probs)])
+    assert [(s["count"], s["label"]) for s in changed] == [
+        (3, "good"),
+        (2, "good"),
+        (11, "slouch"),
+        (3, "slouch"),
+    ]
+    assert changed[0]["mean"] == pytest.approx(0.22)
+    assert changed[2]["end"] - changed[2]["ts"] == timedelta(seconds=10)
+    # Extending the open segment returns only that segment, updated.
+    updated = encoder.add(sample(19, 0.71))
+    assert len(updated) == 1
+    open_seg = updated[0]
+    assert open_seg["_id"] == changed[3]["_id"] and open_seg["count"] == 4
+    assert open_seg["last"] == 0.71
+
+
+def test_buffered_writer_stores_segments_with_encoder():
+    fake_db = _FakeDB()
+    w = writer.BufferedWriter(
+        fake_db,
+        0.6,
+        batch_size=1000,
+        flush_interval=60,
+        encoder=segments.SegmentEncoder(source_id="desk"),
+        source_id="desk",
+    )
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for i in range(20):
+        w.submit(0.2, start + timedelta(seconds=i))
+    w.flush(timeout=5)
+    for i in range(20, 25):
+        w.submit(0.21, start + timedelta(seconds=i))
+    w.close()
+    assert fake_db.samples.docs == []
+    (seg,) = fake_db.segments.docs
+    assert seg["count"] == 25 and seg["source_id"] == "desk"
+    assert w.stats["segments"] == 2
+
+
+def test_segment_writer_coalesces_single_sample_upserts():
+    fake_db = _FakeDB()
+    calls = []
+    bulk_write = fake_db.segments.bulk_write
+
+    def counted_bulk_write(ops, ordered=True):
+        calls.append(len(ops))
+        bulk_write(ops, ordered)
+
+    fake_db.segments.bulk_write = counted_bulk_write
+    encoder = segments.SegmentEncoder(source_id="desk")
+    seg_writer = segments.SegmentWriter(fake_db.segments, interval=60)
+    start = datetime(2025, 1, 1)
+    for i in range(10):
+        seg_writer.submit(
+            encoder.add(
+                {
+                    "ts": start + timedelta(seconds=i),
+                    "slouch_prob": 0.2,
+                    "label": "good",
+                }
+            )
+        )
+    assert not calls
+    seg_writer.flush()
+    assert calls == [1]
+    (seg,) = fake_db.segments.docs
+    assert seg["count"] == 10
+
+    # A batch is written before submit returns.
+    sample = {"ts": start + timedelta(seconds=10), "slouch_prob": 0.2, "label": "good"}
+    seg_writer.submit(encoder.add(sample), flush=True)
+    assert calls == [1, 1] and fake_db.segments.docs[0]["count"] == 11
+
+
+def test_monitoring_refuses_model_with_other_input_size(monkeypatch, capsys):
+    class _HeadOnly:
+        input_size = 14739  # PoseNet features, not preprocessed images
+
+        def predict(self, frame):
+            raise AssertionError("never fed frames")
+
+    assert client.model_mismatch(_HeadOnly()) is not None
+    _HeadOnly.input_size = preprocess.FEATURE_SIZE
+    assert client.model_mismatch(_HeadOnly()) is None
+    _HeadOnly.input_size = 14739
+
+    fake_db = _FakeDB()
+    monkeypatch.setattr(client, "db", fake_db)
+    monkeypatch.setattr(client, "_get_db", lambda: fake_db)
+    monkeypatch.setattr(client, "load_model", _HeadOnly)
+    monkeypatch.setattr(
+        client,
+        "open_source",
+        lambda _spec: capture.SyntheticSource(width=64, height=48, frames=3),
+    )
+    client.run_monitoring_loop(source="synthetic")
+    assert "Refusing to start" in capsys.readouterr().out
+    result = client.monitor_source("desk", "synthetic")
+    assert "14739" in result["error"]
+    assert fake_db.samples.docs == []
@@ -0,0 +1,240 @@
+"""Background, batched MongoDB writer for the ML client.
+
+:class:`BufferedWriter` takes samples from the inference loop without doing
+any database I/O on that thread. It labels each sample and feeds it to a
+:class:`~machine_learning_client.detector.SlouchDetector`, which keeps the
+posture state in memory, then queues the sample (and any event) for a
+writer thread. That thread flushes
+with ``insert_many`` whenever ``batch_size`` documents are waiting or
+``flush_interval`` seconds have passed. The queue is bounded: when it is
+full, ``submit`` blocks, which slows the producer down. A writer created
+with ``source_id`` tags every sample and event with it, so several cameras
+can share the collections and still track transitions independently;
+``user`` likewise tags them with the tenant they belong to.
+With an ``encoder`` (a :class:`~machine_learning_client.segments.SegmentEncoder`),
+each batch of samples is folded into run-length segments and upserted into
+``segments`` instead of inserted into ``samples``.
+
+If MongoDB is unreachable, a batch is appended to an NDJSON spool file
+instead. The spool is replayed ahead of new data once writes succeed
+again. Documents keep the ``_id`` assigned on the first attempt, so a
+replay that repeats a partially applied batch only hits duplicate-key
+errors, which are ignored. Samples and events are stamped with
+``ingested_at`` on every attempt, and spooled segments that never reached
+MongoDB when they are replayed, so the history reports count late writes
+(see :mod:`db.history`). A segment that was stored before keeps its stamp;
+the samples it gained while MongoDB was down are missing from reports
+already folded past it.
+"""
+
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from bson import json_util
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from machine_learning_client import segments, telemetry
+from machine_learning_client.detector import SlouchDetector
+
+_DUPLICATE_KEY = 11000
+_STOP = object()
+
+
+class BufferedWriter:
+    """Batches samples and transition events into bulk inserts off-thread."""
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    def __init__(
+        self,
+        db,
+        threshold,
+        *,
+        batch_size=200,
+        flush_interval=1.0,
+        max_queue=10_000,
+        spool_path=None,
+        detector=None,
+        retry_interval=5.0,
+        source_id=None,
+        encoder=None,
+        user=None,
+    ):
+        self.db = db
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self.detector = detector or SlouchDetector.from_env(threshold)
+        self.retry_interval = retry_interval
+        self.source_id = source_id
+        self.user = user
+        self.encoder = encoder
+        self._down_until = 0.0
+        # Ids of segments written at least once (the most recent ones).
+        self._stored = {}
+        self.stats = {
+            "samples": 0,
+            "events": 0,
+            "segments": 0,
+            "batches": 0,
+            "spooled": 0,
+        }
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, slouch_prob, ts=None):
+        """Label a sample, queue it (plus any detected event) and return it."""
+        doc = {
+            "ts": ts or datetime.now(timezone.utc),
+            "slouch_prob": float(slouch_prob),
+            "label": "slouch" if slouch_prob >= self.threshold else "good",
+        }
+        self._tag(doc)
+        self._queue.put(("samples", doc))
+        event = self.detector.update(doc["slouch_prob"], doc["ts"])
+        if event:
+            self._queue.put(("events", self._tag(event)))
+        return doc
+
+    def _tag(self, doc):
+        if self.source_id is not None:
+            doc["source_id"] = self.source_id
+        if self.user is not None:
+            doc["user"] = self.user
+        return doc
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far has been written or spooled."""
+        done = threading.Event()
+        self._queue.put((None, done))
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """Flush and stop the writer thread."""
+        self._queue.put((None, _STOP))
+        self._thread.join(timeout)
+
+    @property
+    def pending(self):
+        """Items waiting in the queue (not counting the batch being written)."""
+        return self._queue.qsize()
+
+    def _run(self):
+        batch = {"samples": [], "events": []}
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                kind, item = self._queue.get(
+                    timeout=max(0.0, deadline - time.monotonic())
+                )
+            except queue.Empty:
+                kind, item = None, None
+            if kind is not None:
+                batch[kind].append(item)
+                if len(batch["samples"]) + len(batch["events"]) < self.batch_size:
+                    continue
+            self._write(batch)
+            batch = {"samples": [], "events": []}
+            deadline = time.monotonic() + self.flush_interval
+            if item is _STOP:
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+
+    def _write(self, batch):
+        if (
+            self.spool_path
+            and os.path.exists(self.spool_path)
+            and time.monotonic() >= self._down_until
+        ):
+            self._replay_spool()
+        if batch["samples"]:
+            telemetry.SAMPLES_INGESTED.inc(self.source_id, amount=len(batch["samples"]))
+            if self.encoder is not None:
+                batch["segments"] = self.encoder.extend(batch.pop("samples"))
+        for name, docs in batch.items():
+            if not docs:
+                continue
+            try:
+                self._insert(name, docs)
+                self.stats[name] += len(docs)
+                self.stats["batches"] += 1
+            except PyMongoError as exc:
+                self._spool(name, docs, exc)
+
+    def _insert(self, name, docs):
+        # After a failure, go straight to the spool for ``retry_interval``
+        # seconds instead of waiting on server selection for every batch.
+        if time.monotonic() < self._down_until:
+            raise PyMongoError("MongoDB marked unreachable; retrying later")
+        try:
+            if name == "segments":
+                segments.save(self.db.segments, docs)
+                self._remember(docs)
+            else:
+                now = datetime.now(timezone.utc)
+                for doc in docs:
+                    doc["ingested_at"] = now
+                getattr(self.db, name).insert_many(docs, ordered=False)
+        except BulkWriteError as exc:
+            errors = exc.details.get("writeErrors", [])
+            if any(err.get("code") != _DUPLICATE_KEY for err in errors):
+                raise
+        except PyMongoError:
+            self._down_until = time.monotonic() + self.retry_interval
+            raise
+
+    def _spool(self, name, docs, exc):
+        if not self.spool_path:
+            print(f"Dropped {len(docs)} {name}: {exc}")
+            return
+        with open(self.spool_path, "a", encoding="utf-8") as fh:
+            for doc in docs:
+                fh.write(json_util.dumps({"c": name, "d": doc}) + "\n")
+        self.stats["spooled"] += len(docs)
+
+    def _remember(self, docs):
+        for doc in docs:
+            self._stored[doc["_id"]] = True
+        while len(self._stored) > 1000:
+            del self._stored[next(iter(self._stored))]
+
+    def _restamp(self, spooled):
+        # Segments that never reached MongoDB are ingested now; so is the
+        # open one among them, whose stamp also bounds how long it may grow.
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        for doc in spooled:
+            if doc["_id"] in self._stored:
+                continue
+            doc["ingested_at"] = now
+            if self.encoder is None:
+                continue
+            with self.encoder.lock:
+                current = self.encoder.current
+                if current is not None and current["_id"] == doc["_id"]:
+                    current["ingested_at"] = now
+
+    def _replay_spool(self):
+        replaying = self.spool_path + ".replay"
+        os.replace(self.spool_path, replaying)
+        pending = {"samples": [], "events": [], "segments": []}
+        with open(replaying, encoding="utf-8") as fh:
+            for line in fh:
+                entry = json_util.loads(line)
+                pending[entry["c"]].append(entry["d"])
+        os.remove(replaying)
+        self._restamp(pending["segments"])
+        for name, docs in pending.items():
+            for start in range(0, len(docs), self.batch_size):
+                chunk = docs[start : start + self.batch_size]
+                try:
+                    self._insert(name, chunk)
+                    self.stats[name] += len(chunk)
+                except PyMongoError as exc:
+                    self._spool(name, docs[start:], exc)
+                    break
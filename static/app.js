@@ -1,11 +1,30 @@
 let chart;
 let poseModel, webcam, ctx, labelContainer, maxPredictions;
 let isRunning = false;
+let lastPose = null;
 
 const MODEL_URL = "/static/my-pose-model/";
+// Open the dashboard with ?source=<id> to follow a single camera/stream.
+const SOURCE_ID = new URLSearchParams(window.location.search).get("source");
+// ?user=<id> reads and writes that tenant's data (the server also accepts
+// an X-Posture-User header, but EventSource cannot send one).
+const USER_ID = new URLSearchParams(window.location.search).get("user");
+
+function withParam(url, name, value) {
+    if (!value) return url;
+    return url + (url.includes("?") ? "&" : "?") + name + "=" + encodeURIComponent(value);
+}
+
+function forUser(url) {
+    return withParam(url, "user", USER_ID);
+}
+
+function forSource(items) {
+    return SOURCE_ID ? items.filter(i => i.source_id === SOURCE_ID) : items;
+}
 
 async function fetchJSON(url) {
-    const res = await fetch(url);
+    const res = await fetch(forUser(withParam(url, "source", SOURCE_ID)));
     return res.json();
 }
 
@@ -22,15 +41,151 @@ function setGauge(prob) {
     document.getElementById("slouchProb").textContent = prob.toFixed(2);
 }
 
-async function sendPrediction(slouchProb) {
+// Predictions are buffered and flushed in batches so the pose loop never
+// waits on the network and the backend sees one write per window.
+const SAMPLE_FLUSH_SIZE = 30;
+const SAMPLE_FLUSH_MS = 1000;
+const SAMPLE_BUFFER_MAX = 1000;
+let sampleBuffer = [];
+let flushInFlight = false;
+let flushTimer = null;
+
+// Pose estimation runs on its own schedule, not once per animation frame:
+// at most INFERENCE_FPS per second (?fps= overrides), never while the
+// previous estimate is still in flight, and slower when inference itself
+// takes longer than the frame budget. Rendering keeps the camera at full
+// rate and overlays the most recent pose.
+const PARAMS = new URLSearchParams(window.location.search);
+const INFERENCE_FPS = parseFloat(PARAMS.get("fps")) || window.INFERENCE_FPS || 10;
+// Leave the GPU this share of each interval for rendering.
+const INFERENCE_HEADROOM = 0.25;
+// A sample is sent when the probability moves this much, or at least this
+// often while it holds steady.
+const SAMPLE_MIN_DELTA = 0.05;
+const SAMPLE_MAX_GAP_MS = 1000;
+const STATS_INTERVAL_MS = 1000;
+
+const scheduler = {
+    timer: null,
+    inFlight: false,
+    latencyMs: 0,
+    runs: 0,
+    skipped: 0,
+    windowStart: 0,
+    lastSent: null,
+    lastSentAt: 0,
+    fps: 0
+};
+
+function inferenceIntervalMs() {
+    const target = 1000 / INFERENCE_FPS;
+    return Math.max(target, scheduler.latencyMs * (1 + INFERENCE_HEADROOM));
+}
+
+function scheduleInference(delayMs) {
+    clearTimeout(scheduler.timer);
+    scheduler.timer = isRunning ? setTimeout(runInference, delayMs) : null;
+}
+
+async function runInference() {
+    if (!isRunning) return;
+    if (scheduler.inFlight) {
+        scheduler.skipped++;
+        scheduleInference(inferenceIntervalMs());
+        return;
+    }
+    scheduler.inFlight = true;
+    const started = performance.now();
+    try {
+        // Animation frames stop in background tabs; keep the frame current.
+        if (document.hidden) webcam.update();
+        await predictPose();
+    } catch (err) {
+        console.error("Pose estimation failed:", err);
+    } finally {
+        scheduler.inFlight = false;
+    }
+    const elapsed = performance.now() - started;
+    scheduler.latencyMs = scheduler.runs
+        ? scheduler.latencyMs * 0.8 + elapsed * 0.2
+        : elapsed;
+    scheduler.runs++;
+    reportInferenceStats();
+    scheduleInference(Math.max(0, inferenceIntervalMs() - elapsed));
+}
+
+function reportInferenceStats() {
+    const now = performance.now();
+    if (!scheduler.windowStart) {
+        scheduler.windowStart = now;
+        return;
+    }
+    if (now - scheduler.windowStart < STATS_INTERVAL_MS) return;
+    scheduler.fps = (scheduler.runs * 1000) / (now - scheduler.windowStart);
+    document.getElementById("poseStats").textContent =
+        `${scheduler.fps.toFixed(1)} / ${INFERENCE_FPS} inferences/s · ` +
+        `${scheduler.latencyMs.toFixed(0)} ms each`;
+    window.poseStats = {
+        fps: scheduler.fps,
+        targetFps: INFERENCE_FPS,
+        latencyMs: scheduler.latencyMs,
+        skipped: scheduler.skipped
+    };
+    scheduler.runs = 0;
+    scheduler.windowStart = now;
+}
+
+function maybeSendPrediction(slouchProb) {
+    const now = Date.now();
+    const changed =
+        scheduler.lastSent === null ||
+        Math.abs(slouchProb - scheduler.lastSent) >= SAMPLE_MIN_DELTA;
+    if (!changed && now - scheduler.lastSentAt < SAMPLE_MAX_GAP_MS) return;
+    scheduler.lastSent = slouchProb;
+    scheduler.lastSentAt = now;
+    sendPrediction(slouchProb);
+}
+
+function sendPrediction(slouchProb) {
+    const sample = { ts: Date.now(), slouch_prob: slouchProb };
+    if (SOURCE_ID) sample.source_id = SOURCE_ID;
+    sampleBuffer.push(sample);
+    if (sampleBuffer.length > SAMPLE_BUFFER_MAX) {
+        sampleBuffer.splice(0, sampleBuffer.length - SAMPLE_BUFFER_MAX);
+    }
+    if (sampleBuffer.length >= SAMPLE_FLUSH_SIZE) {
+        flushSamples();
+    }
+}
+
+async function flushSamples() {
+    if (flushInFlight || sampleBuffer.length === 0) return;
+    const batch = sampleBuffer;
+    sampleBuffer = [];
+    flushInFlight = true;
     try {
-        await fetch("/api/dev/ingest-sample", {
+        const res = await fetch(forUser("/api/dev/ingest-samples"), {
             method: "POST",
             headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ slouch_prob: slouchProb })
+            body: JSON.stringify({ samples: batch })
         });
+        if (!res.ok) throw new Error("HTTP " + res.status);
     } catch (err) {
-        console.error("Failed to send prediction:", err);
+        console.error("Failed to send predictions:", err);
+        // Keep the failed batch for the next flush, oldest first.
+        sampleBuffer = batch.concat(sampleBuffer).slice(-SAMPLE_BUFFER_MAX);
+    } finally {
+        flushInFlight = false;
+    }
+}
+
+function flushSamplesOnUnload() {
+    if (sampleBuffer.length === 0 || !navigator.sendBeacon) return;
+    const body = new Blob([JSON.stringify({ samples: sampleBuffer })], {
+        type: "application/json"
+    });
+    if (navigator.sendBeacon(forUser("/api/dev/ingest-samples"), body)) {
+        sampleBuffer = [];
     }
 }
 
@@ -69,11 +224,17 @@ async function initPoseModel() {
         }
         
         isRunning = true;
+        lastPose = null;
+        Object.assign(scheduler, { runs: 0, skipped: 0, windowStart: 0, lastSent: null });
+        if (!flushTimer) {
+            flushTimer = setInterval(flushSamples, SAMPLE_FLUSH_MS);
+        }
         startBtn.style.display = "none";
         stopBtn.style.display = "inline-block";
         statusEl.textContent = "✓ Model running";
         
         window.requestAnimationFrame(poseLoop);
+        scheduleInference(0);
         
     } catch (err) {
         statusEl.textContent = "Error: " + err.message;
@@ -82,11 +243,10 @@ async function initPoseModel() {
     }
 }
 
-async function poseLoop(timestamp) {
+function poseLoop() {
     if (!isRunning) return;
-    
     webcam.update();
-    await predictPose();
+    drawPose(lastPose);
     window.requestAnimationFrame(poseLoop);
 }
 
@@ -128,9 +288,8 @@ async function predictPose() {
 
     slouchProb = Math.max(0, Math.min(1, slouchProb));
 
-    await sendPrediction(slouchProb);
-    
-    drawPose(pose);
+    maybeSendPrediction(slouchProb);
+    lastPose = pose;
 }
 
 function drawPose(pose) {
@@ -146,38 +305,109 @@ function drawPose(pose) {
 
 function stopPoseModel() {
     isRunning = false;
+    scheduleInference(0);
     if (webcam) {
         webcam.stop();
     }
+    if (flushTimer) {
+        clearInterval(flushTimer);
+        flushTimer = null;
+    }
+    flushSamples();
     document.getElementById("startButton").style.display = "inline-block";
     document.getElementById("stopButton").style.display = "none";
     document.getElementById("modelStatus").textContent = "Model stopped";
 }
 
+function applyLatest(latest) {
+    setStatus(latest.is_slouch);
+    setGauge(latest.slouch_prob);
+    document.getElementById("lastTs").textContent = latest.ts;
+}
+
 async function refreshLatest() {
     const data = await fetchJSON("/api/latest");
     if (!data.ok || !data.latest) return;
-    setStatus(data.latest.is_slouch);
-    setGauge(data.latest.slouch_prob);
-    document.getElementById("lastTs").textContent = data.latest.ts;
+    applyLatest(data.latest);
+}
+
+// Series state kept between polls, as parallel columns straight from
+// /api/metrics?format=columnar: bucket start (epoch ms), mean slouch
+// probability and sample count, in ts order. Only buckets changed since
+// `seriesCursor` are fetched; each replaces the bucket with its ts (or is
+// inserted in order), then buckets older than the window are trimmed.
+const SERIES_MINUTES = 30;
+let seriesTs = [];
+let seriesProb = [];
+let seriesCount = [];
+let seriesCursor = null;
+
+function resetSeries() {
+    seriesTs = [];
+    seriesProb = [];
+    seriesCount = [];
+    seriesCursor = null;
+}
+
+// Index of the bucket starting at `ts`, or where it would be inserted.
+function seriesIndex(ts) {
+    let lo = 0;
+    let hi = seriesTs.length;
+    while (lo < hi) {
+        const mid = (lo + hi) >> 1;
+        if (seriesTs[mid] < ts) lo = mid + 1;
+        else hi = mid;
+    }
+    return lo;
+}
+
+function mergeSeries(cols) {
+    for (let i = 0; i < cols.ts.length; i++) {
+        const at = seriesIndex(cols.ts[i]);
+        if (seriesTs[at] === cols.ts[i]) {
+            // Re-sent with more samples (or already filled from the stream).
+            seriesProb[at] = cols.p[i];
+            seriesCount[at] = cols.count[i];
+        } else {
+            seriesTs.splice(at, 0, cols.ts[i]);
+            seriesProb.splice(at, 0, cols.p[i]);
+            seriesCount.splice(at, 0, cols.count[i]);
+        }
+    }
+    const cutoff = Date.now() - SERIES_MINUTES * 60 * 1000;
+    let drop = 0;
+    while (drop < seriesTs.length && seriesTs[drop] < cutoff) drop++;
+    if (drop) {
+        seriesTs.splice(0, drop);
+        seriesProb.splice(0, drop);
+        seriesCount.splice(0, drop);
+    }
 }
 
 async function refreshSeries() {
-    const data = await fetchJSON("/api/metrics?minutes=30");
+    let url = `/api/metrics?minutes=${SERIES_MINUTES}&bucket=5s&format=columnar`;
+    if (seriesCursor) url += "&after=" + encodeURIComponent(seriesCursor);
+    const data = await fetchJSON(url);
     if (!data.ok) return;
-    const labels = data.series.map(p => p.ts);
-    const vals = data.series.map(p => p.slouch_prob);
-    const threshold = Number.isFinite(window.SLOUCH_THRESHOLD) ? window.SLOUCH_THRESHOLD : 0.6;
+    seriesCursor = data.cursor;
+    mergeSeries(data);
+    renderSeries();
+}
+
+function formatTick(ms) {
+    return new Date(ms).toISOString().slice(11, 19);
+}
 
+function renderSeries() {
     if (!chart) {
         const ctx = document.getElementById("tsChart");
         chart = new Chart(ctx, {
             type: "line",
             data: {
-                labels,
+                labels: seriesTs,
                 datasets: [{
                     label: "Slouch probability",
-                    data: vals,
+                    data: seriesProb,
                     tension: 0.2,
                     fill: false,
                     pointRadius: 0,
@@ -186,49 +416,178 @@ async function refreshSeries() {
             },
             options: {
                 responsive: true,
+                animation: false,
                 scales: {
                     y: { suggestedMin: 0, suggestedMax: 1 },
-                    x: { ticks: { maxTicksLimit: 6 } }
+                    x: {
+                        ticks: {
+                            maxTicksLimit: 6,
+                            callback: (_value, index) => formatTick(seriesTs[index])
+                        }
+                    }
                 },
-                plugins: { legend: { display: false } }
+                plugins: {
+                    legend: { display: false },
+                    tooltip: {
+                        callbacks: { title: items => formatTick(seriesTs[items[0].dataIndex]) }
+                    }
+                }
             }
         });
     } else {
-        chart.data.labels = labels;
-        chart.data.datasets[0].data = vals;
+        // The column arrays are handed to Chart.js as is, without copying.
+        chart.data.labels = seriesTs;
+        chart.data.datasets[0].data = seriesProb;
         chart.update();
     }
+}
 
-    // Compute simple posture splits for the displayed window.
-    const total = vals.length;
-    const slouchCount = vals.filter(v => v >= threshold).length;
-    const slouchPct = total ? (slouchCount / total) * 100 : 0;
-    const goodPct = total ? 100 - slouchPct : 0;
+function formatDuration(seconds) {
+    const s = Math.round(seconds);
+    return s >= 60 ? `${Math.floor(s / 60)}m ${s % 60}s` : `${s}s`;
+}
 
+// Posture splits and streaks come from server-side rollups, so they do not
+// depend on how much of the series has been shipped to the browser.
+async function refreshSummary() {
+    const data = await fetchJSON(`/api/summary?minutes=${SERIES_MINUTES}`);
+    if (!data.ok) return;
     const slouchEl = document.getElementById("metricSlouch");
     const goodEl = document.getElementById("metricGood");
-    if (slouchEl) slouchEl.textContent = `Slouching: ${slouchPct.toFixed(1)}%`;
-    if (goodEl) goodEl.textContent = `Good posture: ${goodPct.toFixed(1)}%`;
+    const streakEl = document.getElementById("metricStreak");
+    if (slouchEl) slouchEl.textContent = `Slouching: ${data.slouch_pct.toFixed(1)}%`;
+    if (goodEl) goodEl.textContent = `Good posture: ${data.good_pct.toFixed(1)}%`;
+    if (streakEl) {
+        streakEl.textContent =
+            `Slouch streak: ${formatDuration(data.current_streak_s)} ` +
+            `(longest ${formatDuration(data.longest_streak_s)})`;
+    }
+}
+
+const EVENTS_SHOWN = 20;
+
+function eventRow(e) {
+    const tr = document.createElement("tr");
+    tr.innerHTML = `<td>${e.ts}</td><td>${e.type}</td><td>${e.prob.toFixed(2)}</td>`;
+    return tr;
 }
 
 async function refreshEvents() {
-    const data = await fetchJSON("/api/events?limit=20");
+    const data = await fetchJSON(`/api/events?limit=${EVENTS_SHOWN}`);
     const body = document.getElementById("eventsBody");
     body.innerHTML = "";
-    (data.events || []).forEach(e => {
-        const tr = document.createElement("tr");
-        tr.innerHTML = `<td>${e.ts}</td><td>${e.type}</td><td>${e.prob.toFixed(2)}</td>`;
-        body.appendChild(tr);
+    (data.events || []).forEach(e => body.appendChild(eventRow(e)));
+}
+
+function prependEvent(e) {
+    const body = document.getElementById("eventsBody");
+    if (body.rows.length === 1 && body.rows[0].cells.length === 1) {
+        body.innerHTML = "";
+    }
+    body.insertBefore(eventRow(e), body.firstChild);
+    while (body.rows.length > EVENTS_SHOWN) body.deleteRow(-1);
+}
+
+// Streamed samples are folded into the same 5s buckets /api/metrics returns.
+const SERIES_BUCKET_MS = 5000;
+let seriesRenderTimer = null;
+
+function addStreamedSamples(samples) {
+    samples.forEach(s => {
+        const ms = Date.parse(s.ts);
+        const ts = ms - (ms % SERIES_BUCKET_MS);
+        const i = seriesIndex(ts);
+        if (seriesTs[i] !== ts) {
+            seriesTs.splice(i, 0, ts);
+            seriesProb.splice(i, 0, 0);
+            seriesCount.splice(i, 0, 0);
+        }
+        const n = seriesCount[i];
+        seriesProb[i] = (seriesProb[i] * n + s.slouch_prob) / (n + 1);
+        seriesCount[i] = n + 1;
     });
+    mergeSeries({ ts: [], p: [], count: [] });
+    // Redraw at most once a second however fast samples arrive.
+    if (!seriesRenderTimer) {
+        seriesRenderTimer = setTimeout(() => {
+            seriesRenderTimer = null;
+            renderSeries();
+        }, 1000);
+    }
+}
+
+// One Server-Sent Events connection replaces the polling loops; polling is
+// only used when the browser or server cannot stream, or when the server
+// says it cannot push every sample (its first "config" frame). The series
+// is then polled only, since streamed samples would be counted twice.
+let pollTimers = [];
+let pollSeries = false;
+
+function startPolling() {
+    if (pollTimers.length) return;
+    pollTimers = [
+        setInterval(refreshLatest, 1500),
+        setInterval(refreshSeries, 5000),
+        setInterval(refreshEvents, 5000),
+        setInterval(refreshSummary, 5000)
+    ];
+}
+
+function stopPolling() {
+    pollTimers.forEach(clearInterval);
+    pollTimers = [];
+}
+
+function connectStream() {
+    if (!window.EventSource) return false;
+    const source = new EventSource(forUser("/api/stream"));
+    source.addEventListener("open", () => {
+        stopPolling();
+        pollSeries = false;
+        // Resync anything missed while disconnected, then rely on pushes.
+        resetSeries();
+        tick();
+    });
+    source.addEventListener("config", e => {
+        pollSeries = JSON.parse(e.data).poll;
+        if (pollSeries) startPolling();
+    });
+    source.addEventListener("latest", e => {
+        if (!SOURCE_ID) applyLatest(JSON.parse(e.data));
+    });
+    source.addEventListener("samples", e => {
+        const samples = forSource(JSON.parse(e.data));
+        if (!samples.length) return;
+        if (!pollSeries) addStreamedSamples(samples);
+        // The "latest" frame covers all sources; derive this source's own.
+        if (SOURCE_ID) applyLatest(samples.reduce((a, b) => (b.ts >= a.ts ? b : a)));
+    });
+    source.addEventListener("event", e => {
+        forSource([JSON.parse(e.data)]).forEach(prependEvent);
+    });
+    source.addEventListener("error", () => {
+        if (pollTimers.length) return;
+        // Streamed buckets may be partial; let polling refetch the window.
+        resetSeries();
+        startPolling();
+    });
+    return true;
 }
 
 async function tick() {
-    await Promise.all([refreshLatest(), refreshSeries(), refreshEvents()]);
+    await Promise.all([refreshLatest(), refreshSeries(), refreshEvents(), refreshSummary()]);
 }
 
+window.addEventListener("pagehide", flushSamplesOnUnload);
+
 window.addEventListener("load", () => {
-    tick();
-    setInterval(refreshLatest, 1500);
-    setInterval(refreshSeries, 5000);
-    setInterval(refreshEvents, 5000);
+    // Summaries are O(buckets) server-side, so they stay on a timer even
+    // while streaming.
+    setInterval(() => {
+        if (!pollTimers.length) refreshSummary();
+    }, 5000);
+    if (!connectStream()) {
+        tick();
+        startPolling();
+    }
 });
@@ -0,0 +1,29 @@
+"""Shared fixtures for the web app tests."""
+
+# pylint: disable=missing-function-docstring,redefined-outer-name
+import pytest
+
+import app as app_module
+from app import app as flask_app, db, telemetry
+
+# Tests refresh the history reports explicitly.
+app_module.history_job.interval = 0
+
+
+@pytest.fixture()
+def app():
+    yield flask_app
+    app_module.segment_writer.flush()
+    db.samples.delete_many({})
+    db.events.delete_many({})
+    db.segments.delete_many({})
+    db.history.clear()
+    app_module.latest_caches.clear()
+    app_module.detectors.clear()
+    app_module.segment_encoders.clear()
+    telemetry.reset()
+
+
+@pytest.fixture()
+def client(app):
+    return app.test_client()
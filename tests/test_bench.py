@@ -0,0 +1,51 @@
+"""Smoke tests for the benchmark scripts."""
+
+# pylint: disable=missing-function-docstring,unused-argument
+import json
+
+from app import db
+from benchmarks import bench_api, bench_startup
+
+
+def test_bench_api_writes_comparable_results(app, tmp_path):
+    out = tmp_path / "bench.json"
+    code = bench_api.main(
+        [
+            "--samples",
+            "2k",
+            "--requests",
+            "4",
+            "--concurrency",
+            "2",
+            "--endpoints",
+            "latest,metrics_bucket_30m,history_week_hourly,ingest_samples_100",
+            "--output",
+            str(out),
+        ]
+    )
+    assert db.samples.count_documents({}) >= 2000
+    assert code == 0
+    report = json.loads(out.read_text())
+    assert report["meta"]["samples"] == 2000
+    assert {r["endpoint"] for r in report["results"]} == {
+        "latest",
+        "metrics_bucket_30m",
+        "history_week_hourly",
+        "ingest_samples_100",
+    }
+    assert all(
+        r["errors"] == 0 and r["p99_ms"] >= r["p50_ms"] for r in report["results"]
+    )
+
+    slower = json.loads(out.read_text())
+    for r in slower["results"]:
+        r["p50_ms"] *= 2
+    _, regressed = bench_api.compare(slower, report, tolerance=0.2)
+    assert regressed
+    assert bench_api.parse_count("1.5M") == 1_500_000
+
+
+def test_ml_client_imports_without_opencv_or_numpy():
+    record = bench_startup.measure("machine_learning_client.client", runs=1)
+    assert record["heavy_modules"] == []
+    assert record["import_ms_median"] > 0
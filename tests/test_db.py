@@ -0,0 +1,328 @@
+"""Tests for the in-memory FakeCollection backend and schema setup."""
+
+# pylint: disable=missing-function-docstring
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo import ASCENDING, DESCENDING, DeleteMany, InsertOne, UpdateOne
+from pymongo.errors import CollectionInvalid
+
+from db.db import FakeCollection, PartitionedCollection, ensure_schema
+from db.cache import LRUMap
+from db.history import MemoryHistory, _History
+from db.stream import InsertTailer
+
+
+def _docs(now, seconds):
+    return [{"ts": now - timedelta(seconds=s), "v": s} for s in seconds]
+
+
+def test_out_of_order_inserts_stay_sorted():
+    now = datetime.utcnow()
+    col = FakeCollection()
+    col.insert_many(_docs(now, [5, 1, 3]))
+    col.insert_one(_docs(now, [4])[0])
+    col.insert_many(_docs(now, [6, 0]))
+    assert [d["v"] for d in col.find().sort("ts", ASCENDING)] == [6, 5, 4, 3, 1, 0]
+    assert col.find_one(sort=[("ts", DESCENDING)])["v"] == 0
+
+
+def test_range_query_limit_and_projection():
+    now = datetime.utcnow()
+    col = FakeCollection()
+    col.insert_many(_docs(now, range(10, 0, -1)))
+    query = {
+        "ts": {"$gt": now - timedelta(seconds=8), "$lte": now - timedelta(seconds=2)}
+    }
+    cur = col.find(query, {"v": 1, "_id": 0}).sort("ts", DESCENDING).limit(3)
+    assert list(cur) == [{"v": 2}, {"v": 3}, {"v": 4}]
+    assert col.count_documents(query) == 6
+
+
+def test_cursor_is_unaffected_by_concurrent_writes():
+    now = datetime.utcnow()
+    col = FakeCollection()
+    col.insert_many(_docs(now, [5, 4, 3, 2, 1]))
+    # Written between find() and iteration: the bounds are taken at iteration.
+    cur = col.find({"ts": {"$gte": now - timedelta(seconds=3)}})
+    col.insert_one(_docs(now, [4.5])[0])
+    col.insert_one(_docs(now, [2.5])[0])
+    assert [d["v"] for d in cur] == [3, 2.5, 2, 1]
+
+    # Written (and trimmed) while a descending scan is being consumed.
+    capped = FakeCollection(max_docs=4)
+    capped.insert_many(_docs(now, [4, 3, 2, 1]))
+    cur = iter(capped.find().sort("ts", DESCENDING))
+    seen = [next(cur)["v"]]
+    capped.insert_many(_docs(now, [0, -1]))
+    seen += [d["v"] for d in cur]
+    assert seen == [1, 2, 3, 4]
+    assert [d["v"] for d in capped.find()] == [2, 1, 0, -1]
+
+
+def test_retention_by_count_and_ttl_index():
+    now = datetime.utcnow()
+    col = FakeCollection(max_docs=3)
+    col.insert_many(_docs(now, [5, 4, 3, 2, 1]))
+    assert [d["v"] for d in col.find()] == [3, 2, 1]
+
+    col.create_index([("ts", ASCENDING)], expireAfterSeconds=2.5)
+    assert [d["v"] for d in col.find()] == [2, 1]
+    assert "ts_1" in col.indexes
+
+
+def test_partitioned_collection_scopes_queries_to_one_tenant():
+    now = datetime.utcnow()
+    col = PartitionedCollection("user")
+    col.create_index([("ts", ASCENDING)], expireAfterSeconds=3600)
+    for n in range(50):
+        col.insert_many([dict(d, user=f"u{n}") for d in _docs(now, [3, 2, 1])])
+    col.insert_one({"ts": now, "v": "anonymous"})
+
+    # Only the tenant's own partition is scanned, however many there are.
+    cur = col.find({"user": "u7", "ts": {"$gte": now - timedelta(seconds=2)}})
+    assert cur.collection is col.partitions["u7"]
+    assert [d["v"] for d in cur] == [2, 1]
+    assert col.find_one({"user": None})["v"] == "anonymous"
+    assert col.find_one({"user": "nobody"}) is None
+    assert col.partitions["u7"].ttl_seconds == 3600
+
+    # Queries without a tenant fan out, still in ts order.
+    assert col.count_documents({"v": 1}) == 50
+    assert [d["v"] for d in col.find({"user": {"$in": ["u1", "u2"]}})] == [
+        3,
+        3,
+        2,
+        2,
+        1,
+        1,
+    ]
+
+    assert col.delete_many({"user": "u7"}) == {"deleted_count": 3}
+    assert col.count_documents({}) == 148
+
+
+def test_bulk_write_applies_supported_models_and_names_them_otherwise():
+    now = datetime.utcnow()
+    col = PartitionedCollection("user")
+    col.bulk_write(
+        [InsertOne(dict(d, user="a")) for d in _docs(now, [3, 2, 1])]
+        + [DeleteMany({"user": "a", "v": {"$gte": 2}})]
+    )
+    assert [d["v"] for d in col.find({"user": "a"})] == [1]
+
+    with pytest.raises(TypeError, match="InsertOne, ReplaceOne, DeleteMany"):
+        FakeCollection().bulk_write([UpdateOne({"v": 1}, {"$set": {"v": 2}})])
+
+
+def test_insert_tail_relays_new_documents_of_streamed_tenants_once():
+    start = datetime.utcnow()
+    database = {"samples": FakeCollection(), "events": FakeCollection()}
+    relayed = []
+    users = []
+    covered = set()
+    tail = InsertTailer(
+        database,
+        ["samples", "events"],
+        lambda name, doc: relayed.append((name, doc["v"])),
+        scope=lambda: users,
+        skip=lambda name: name in covered,
+    )
+
+    def write(name, user, value, seconds):
+        stamp = start + timedelta(seconds=seconds)
+        database[name].insert_one(
+            {"ts": stamp, "user": user, "v": value, "ingested_at": stamp}
+        )
+
+    write("samples", "a", 0, 0)
+    assert tail.poll(start + timedelta(seconds=1)) == 0  # nobody streams yet
+    users.append("a")
+    write("samples", "a", 1, 2)
+    write("samples", "b", 2, 2)
+    write("events", "a", 3, 2)
+    assert tail.poll(start + timedelta(seconds=3)) == 2
+    # Committed late with an older stamp, inside the overlap: still relayed.
+    write("samples", "a", 4, 1.5)
+    assert tail.poll(start + timedelta(seconds=4)) == 1
+    covered.add("events")
+    write("events", "a", 5, 5)
+    assert tail.poll(start + timedelta(seconds=6)) == 0
+    assert not tail.covers("events")
+    assert relayed == [("samples", 1), ("events", 3), ("samples", 4)]
+
+
+def test_lru_map_drops_least_recently_used_unpinned_entries():
+    tenants = LRUMap(2, pinned=lambda value: value == "streaming")
+    tenants.setdefault("a", "streaming")
+    tenants.setdefault("b", "idle")
+    assert tenants.get("b") == "idle"
+    tenants.setdefault("c", "idle")
+    assert [key for key, _ in tenants.items()] == ["a", "c"]
+    # Everything older is pinned: the map grows rather than drop the new one.
+    tenants.setdefault("d", "streaming")
+    tenants.setdefault("e", "idle")
+    assert [key for key, _ in tenants.items()] == ["a", "d", "e"]
+    assert tenants.setdefault("a", "other") == "streaming"
+
+
+def test_history_backend_missing_a_hook_fails_when_built():
+    # pylint: disable=abstract-method,abstract-class-instantiated
+    class Partial(_History):
+        """Has the state hook only."""
+
+        def _peek(self):
+            return {}
+
+    with pytest.raises(TypeError, match="_apply"):
+        Partial()
+
+
+def test_history_refresh_only_folds_new_samples():
+    start = datetime(2025, 1, 6, 9, 59, 50)
+    samples, events = PartitionedCollection("user"), PartitionedCollection("user")
+    labels = ["good"] * 5 + ["slouch"] * 10 + ["good"] * 5
+    samples.insert_many(
+        [
+            {
+                "ts": start + timedelta(seconds=2 * i),
+                "label": label,
+                "user": "a",
+                "ingested_at": start + timedelta(seconds=2 * i),
+            }
+            for i, label in enumerate(labels)
+        ]
+    )
+    at = start + timedelta(seconds=20)
+    events.insert_one(
+        {"ts": at, "type": "enter_slouch", "user": "a", "ingested_at": at}
+    )
+    history = MemoryHistory()
+
+    # The first pass stops mid-streak; the second picks up after it.
+    assert history.refresh(samples, events, start + timedelta(seconds=20), 0.6) == 11
+    assert history.refresh(samples, events, start + timedelta(seconds=20), 0.6) == 0
+    assert history.refresh(samples, events, start + timedelta(minutes=5), 0.6) == 9
+
+    hours = history.buckets("a", "hour", start, start + timedelta(hours=1))
+    assert [b["ts"].hour for b in hours] == [9, 10]
+    assert sum(b["samples"] for b in hours) == 20
+    assert sum(b["slouch_seconds"] for b in hours) == 20
+    assert sum(b["good_seconds"] for b in hours) == 18
+    assert max(b["longest_streak_s"] for b in hours) == 18
+    (day,) = history.buckets("a", "day", start, start)
+    assert (day["samples"], day["slouch_samples"]) == (20, 10)
+    assert day["events"] == day["slouch_events"] == 1
+    assert history.buckets(None, "day", start, start) == []
+
+
+def test_history_refresh_counts_late_writes():
+    start = datetime(2025, 1, 6, 10, 0, 0)
+    samples, events = PartitionedCollection("user"), PartitionedCollection("user")
+    samples.insert_many(
+        [
+            {"ts": start + timedelta(seconds=2 * i), "label": "good", "user": "a"}
+            for i in range(5)
+        ]
+    )
+    history = MemoryHistory()
+    assert history.refresh(samples, events, start + timedelta(minutes=1), 0.6) == 5
+
+    # Replayed from a spool long after its ts, between the 2nd and 3rd sample.
+    stamp = start + timedelta(minutes=3)
+    late = {"ts": start + timedelta(seconds=3), "label": "slouch", "user": "a"}
+    samples.insert_one({**late, "ingested_at": stamp})
+    events.insert_one(
+        {"ts": late["ts"], "type": "enter_slouch", "user": "a", "ingested_at": stamp}
+    )
+    assert history.refresh(samples, events, start + timedelta(minutes=4), 0.6) == 1
+    # Read again within the overlap, but not counted twice.
+    assert history.refresh(samples, events, start + timedelta(minutes=5), 0.6) == 0
+
+    (hour,) = history.buckets("a", "hour", start, start + timedelta(hours=1))
+    assert (hour["samples"], hour["slouch_samples"]) == (6, 1)
+    # The late sample takes one of the following sample's two seconds.
+    assert hour["slouch_seconds"] == 1
+    assert hour["good_seconds"] == 7
+    assert hour["events"] == hour["slouch_events"] == 1
+    assert history.watermark() == start + timedelta(minutes=5)
+
+
+class _SchemaCollection:
+    """Records index operations like a pymongo Collection."""
+
+    def __init__(self, database, name):
+        self.database, self.name = database, name
+        self.indexes = {}
+
+    def list_indexes(self):
+        return [
+            {"name": name, "key": dict(keys), **opts}
+            for name, (keys, opts) in self.indexes.items()
+        ]
+
+    def create_index(self, keys, **opts):
+        name = "_".join(f"{k}_{d}" for k, d in keys)
+        self.indexes[name] = (keys, opts)
+        return name
+
+    def drop_index(self, name):
+        del self.indexes[name]
+
+
+class _SchemaDB:
+    """Records collection creation and collMod like a pymongo Database."""
+
+    def __init__(self, existing=None):
+        self.created = dict(existing or {})
+        self.commands = []
+        self.samples = _SchemaCollection(self, "samples")
+        self.events = _SchemaCollection(self, "events")
+        self.samples_rollup = _SchemaCollection(self, "samples_rollup")
+        self.segments = _SchemaCollection(self, "segments")
+        self.history = _SchemaCollection(self, "history")
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def create_collection(self, name, **options):
+        if name in self.created:
+            raise CollectionInvalid(f"collection {name} already exists")
+        self.created[name] = options
+
+    def list_collections(self, filter=None):  # pylint: disable=redefined-builtin
+        name = filter["name"]
+        kind = "timeseries" if "timeseries" in self.created[name] else "collection"
+        return iter([{"name": name, "type": kind, "options": self.created[name]}])
+
+    def command(self, *args, **kwargs):
+        self.commands.append((args, kwargs))
+
+
+def test_ensure_schema_creates_timeseries_samples_and_ttls():
+    database = _SchemaDB()
+    assert ensure_schema(database, samples_ttl=3600, events_ttl=7200, rollup_ttl=0)
+    options = database.created["samples"]
+    assert options["timeseries"]["timeField"] == "ts"
+    assert options["timeseries"]["metaField"] == "user"
+    assert options["expireAfterSeconds"] == 3600
+    assert database.events.indexes["ts_-1"][1] == {"expireAfterSeconds": 7200}
+    assert database.samples_rollup.indexes["ts_-1"][1] == {}
+    assert database.segments.indexes["ts_-1"][1] == {"expireAfterSeconds": 3600}
+    for collection in (database.samples, database.events, database.segments):
+        assert "user_1_ts_-1" in collection.indexes
+        assert "user_1_source_id_1_ts_-1" in collection.indexes
+        assert "ingested_at_1" in collection.indexes
+    assert database.samples_rollup.indexes["user_1_ts_1"][1] == {"unique": True}
+    assert "user_1_grain_1_ts_1" in database.history.indexes
+
+    # Re-running only adjusts retention on what already exists.
+    assert ensure_schema(database, samples_ttl=60, events_ttl=120, rollup_ttl=600)
+    assert (("collMod", "samples"), {"expireAfterSeconds": 60}) in database.commands
+    assert database.samples_rollup.indexes["ts_-1"][1] == {"expireAfterSeconds": 600}
+
+
+def test_ensure_schema_keeps_plain_samples_collection_with_ttl_index():
+    database = _SchemaDB(existing={"samples": {}})
+    assert not ensure_schema(database, samples_ttl=3600)
+    assert database.samples.indexes["ts_-1"][1] == {"expireAfterSeconds": 3600}
@@ -2,27 +2,18 @@
 
 # pylint: disable=missing-function-docstring,redefined-outer-name
 import json
+import threading
 from datetime import datetime, timedelta
 import pytest
 
-from app import app as flask_app, db
-
-
-@pytest.fixture()
-def app():
-    yield flask_app
-    db.samples.delete_many({})
-    db.events.delete_many({})
-
-
-@pytest.fixture()
-def client(app):
-    return app.test_client()
+import app as app_module
+from app import db
 
 
 def test_index_ok(client):
     res = client.get("/")
     assert res.status_code == 200
+    assert b"window.INFERENCE_FPS = parseFloat(" in res.data
 
 
 def test_latest_none(client):
@@ -60,3 +51,603 @@ def test_metrics_series(client):
     data = res.get_json()
     assert data["ok"] is True
     assert len(data["series"]) >= 2
+
+
+def test_ingest_samples_batch(client):
+    now = datetime.utcnow()
+    payload = {
+        "samples": [
+            {"ts": (now - timedelta(seconds=2)).isoformat() + "Z", "slouch_prob": 0.2},
+            {"ts": (now - datetime(1970, 1, 1)).total_seconds() * 1000 - 1000},
+            {"slouch_prob": 0.9},
+        ]
+    }
+    res = client.post(
+        "/api/dev/ingest-samples",
+        data=json.dumps(payload),
+        content_type="application/json",
+    )
+    data = res.get_json()
+    assert res.status_code == 200
+    assert data["inserted"] == 3
+    docs = list(db.samples.find({"ts": {"$gte": now - timedelta(minutes=1)}}))
+    assert sorted(d["label"] for d in docs) == ["good", "good", "slouch"]
+
+    res2 = client.get("/api/latest")
+    assert res2.get_json()["latest"]["is_slouch"] is True
+
+
+def test_ingest_samples_rejects_bad_payload(client):
+    res = client.post(
+        "/api/dev/ingest-samples",
+        data=json.dumps({"samples": "nope"}),
+        content_type="application/json",
+    )
+    assert res.status_code == 400
+
+
+def test_metrics_bucketed(client):
+    now = datetime.utcnow().replace(second=30, microsecond=0)
+    db.samples.insert_many(
+        [
+            {"ts": now - timedelta(minutes=2, seconds=5), "slouch_prob": 0.2},
+            {"ts": now - timedelta(minutes=2, seconds=4), "slouch_prob": 0.8},
+            {"ts": now - timedelta(minutes=1), "slouch_prob": 0.4},
+        ]
+    )
+    res = client.get("/api/metrics?minutes=5&bucket=1m")
+    data = res.get_json()
+    assert data["bucket_ms"] == 60_000
+    assert [b["count"] for b in data["series"]] == [2, 1]
+    first = data["series"][0]
+    assert first["slouch_prob"] == pytest.approx(0.5)
+    assert first["max"] == pytest.approx(0.8)
+    assert first["slouch_frac"] == pytest.approx(0.5)
+
+
+def test_metrics_max_points_bounds_payload(client):
+    now = datetime.utcnow()
+    db.samples.insert_many(
+        [
+            {"ts": now - timedelta(seconds=i), "slouch_prob": (i % 10) / 10}
+            for i in range(500, 0, -1)
+        ]
+    )
+    res = client.get("/api/metrics?minutes=30&max_points=50")
+    series = res.get_json()["series"]
+    assert len(series) == 50
+    assert series == sorted(series, key=lambda p: p["ts"])
+
+    for max_points in (1, 2):
+        res = client.get(f"/api/metrics?minutes=30&max_points={max_points}")
+        assert len(res.get_json()["series"]) == max_points
+
+
+def test_metrics_after_cursor_resends_from_late_writes(client, monkeypatch):
+    monkeypatch.setattr(app_module, "SERIES_CURSOR_OVERLAP", 0)
+    now = datetime.utcnow()
+    stamp = now - timedelta(minutes=1)
+    db.samples.insert_many(
+        [
+            {
+                "ts": now - timedelta(seconds=30),
+                "slouch_prob": 0.1,
+                "ingested_at": stamp,
+            },
+            {
+                "ts": now - timedelta(seconds=20),
+                "slouch_prob": 0.2,
+                "ingested_at": stamp,
+            },
+        ]
+    )
+    first = client.get("/api/metrics?minutes=5").get_json()
+    assert len(first["series"]) == 2
+
+    empty = client.get(f"/api/metrics?minutes=5&after={first['cursor']}").get_json()
+    assert empty["series"] == []
+    assert empty["cursor"] == first["cursor"]
+
+    # Written late (a batch or a replayed spool): older than the cursor's
+    # samples, but stamped after it.
+    db.samples.insert_one(
+        {"ts": now - timedelta(seconds=40), "slouch_prob": 0.9, "ingested_at": now}
+    )
+    new = client.get(f"/api/metrics?minutes=5&after={first['cursor']}").get_json()
+    assert [p["slouch_prob"] for p in new["series"]] == [0.9, 0.1, 0.2]
+    assert new["cursor"] != first["cursor"]
+
+    db.samples.insert_one(
+        {
+            "ts": now - timedelta(seconds=200),
+            "slouch_prob": 0.5,
+            "ingested_at": now + timedelta(seconds=1),
+        }
+    )
+    url = f"/api/metrics?minutes=5&bucket=5m&after={new['cursor']}"
+    buckets = client.get(url).get_json()["series"]
+    assert sum(b["count"] for b in buckets) == 4
+
+
+def test_ingest_publishes_to_stream_subscribers(client):
+    sub = app_module.broadcaster.subscribe()
+    try:
+        client.post(
+            "/api/dev/ingest-samples",
+            data=json.dumps([{"slouch_prob": 0.1}, {"slouch_prob": 0.9}]),
+            content_type="application/json",
+        )
+        client.post(
+            "/api/dev/ingest-event",
+            data=json.dumps({"type": "enter_slouch", "prob": 0.9}),
+            content_type="application/json",
+        )
+        frames = [sub.get_nowait() for _ in range(3)]
+    finally:
+        app_module.broadcaster.unsubscribe(sub)
+
+    assert frames[0].startswith("event: samples\n")
+    samples = json.loads(frames[0].split("data: ", 1)[1])
+    assert [s["is_slouch"] for s in samples] == [False, True]
+    assert frames[1].startswith("event: latest\n")
+    assert frames[2].startswith("event: event\n")
+
+
+def test_stream_endpoint_subscribes_and_cleans_up(client):
+    res = client.get("/api/stream")
+    assert res.mimetype == "text/event-stream"
+    assert next(res.response).startswith(b"retry:")
+    assert next(res.response) == b'event: config\ndata: {"poll": false}\n\n'
+    assert app_module.broadcaster.subscriber_count == 1
+    res.close()
+    assert app_module.broadcaster.subscriber_count == 0
+
+
+def test_stream_refuses_past_the_subscriber_cap(client, monkeypatch):
+    monkeypatch.setattr(app_module, "stream_slots", threading.BoundedSemaphore(1))
+    first = client.get("/api/stream")
+    assert first.status_code == 200
+    assert client.get("/api/stream").status_code == 503
+    first.close()
+    again = client.get("/api/stream")
+    assert again.status_code == 200
+    again.close()
+
+
+def test_summary_from_minute_buckets(client):
+    now = datetime.utcnow().replace(microsecond=0)
+    probs = [0.1, 0.9, 0.9, 0.9, 0.2, 0.8, 0.8]
+    samples = [
+        {"ts": (now - timedelta(seconds=len(probs) - i)).isoformat(), "slouch_prob": p}
+        for i, p in enumerate(probs)
+    ]
+    client.post(
+        "/api/dev/ingest-samples",
+        data=json.dumps(samples),
+        content_type="application/json",
+    )
+    data = client.get("/api/summary?minutes=5").get_json()
+    assert data["ok"] is True
+    assert data["count"] == 7
+    assert data["slouch_pct"] == pytest.approx(500 / 7)
+    assert data["current_streak_s"] == pytest.approx(1.0)
+    assert data["longest_streak_s"] == pytest.approx(2.0)
+
+
+def test_summary_counts_every_writer_and_expires_streaks(client):
+    now = datetime.utcnow().replace(microsecond=0)
+    # Written straight to MongoDB, as the ML client does.
+    db.samples.insert_many(
+        [
+            {
+                "ts": now - timedelta(seconds=90 - i),
+                "slouch_prob": 0.9,
+                "label": "slouch",
+                "source_id": "desk",
+                "user": "alice",
+                "ingested_at": now - timedelta(seconds=90 - i),
+            }
+            for i in range(20)
+        ]
+    )
+    url = "/api/summary?user=alice&minutes=5"
+    before = client.get(url).get_json()
+    assert before["count"] == 20 and before["slouch_pct"] == 100.0
+    assert before["longest_streak_s"] == pytest.approx(19.0)
+    # The last sample is 71 s old: the source stopped, so no current streak.
+    assert before["current_streak_s"] == 0.0
+
+    # Folded into minute buckets: same figures, nothing counted twice.
+    assert app_module.refresh_history(now) == 20
+    after = client.get(url).get_json()
+    assert {k: after[k] for k in ("count", "slouch_pct", "longest_streak_s")} == {
+        k: before[k] for k in ("count", "slouch_pct", "longest_streak_s")
+    }
+    assert client.get("/api/summary?minutes=5").get_json()["count"] == 0
+
+
+def test_latest_etag_not_modified(client):
+    client.post(
+        "/api/dev/ingest-sample",
+        data=json.dumps({"slouch_prob": 0.3}),
+        content_type="application/json",
+    )
+    first = client.get("/api/latest")
+    etag = first.headers["ETag"]
+    assert first.get_json()["latest"]["slouch_prob"] == pytest.approx(0.3)
+
+    again = client.get("/api/latest", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.data == b""
+
+    client.post(
+        "/api/dev/ingest-sample",
+        data=json.dumps({"slouch_prob": 0.9}),
+        content_type="application/json",
+    )
+    changed = client.get("/api/latest", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.get_json()["latest"]["slouch_prob"] == pytest.approx(0.9)
+
+
+def test_source_filtering(client):
+    now = datetime.utcnow()
+    client.post(
+        "/api/dev/ingest-samples",
+        data=json.dumps(
+            {
+                "source_id": "desk-1",
+                "samples": [
+                    {
+                        "ts": (now - timedelta(seconds=3)).isoformat(),
+                        "slouch_prob": 0.9,
+                    },
+                    {
+                        "ts": (now - timedelta(seconds=1)).isoformat(),
+                        "slouch_prob": 0.1,
+                        "source_id": "desk-2",
+                    },
+                ],
+            }
+        ),
+        content_type="application/json",
+    )
+    client.post(
+        "/api/dev/ingest-event",
+        data=json.dumps({"type": "enter_slouch", "prob": 0.9, "source_id": "desk-1"}),
+        content_type="application/json",
+    )
+
+    latest = client.get("/api/latest").get_json()["latest"]
+    assert latest["source_id"] == "desk-2"
+    desk1 = client.get("/api/latest?source=desk-1").get_json()["latest"]
+    assert desk1["source_id"] == "desk-1" and desk1["is_slouch"] is True
+
+    series = client.get("/api/metrics?minutes=5&source=desk-2").get_json()["series"]
+    assert [p["slouch_prob"] for p in series] == [0.1]
+    buckets = client.get("/api/metrics?minutes=5&bucket=1m&source=desk-1").get_json()
+    assert sum(b["count"] for b in buckets["series"]) == 1
+
+    desk1_events = client.get("/api/events?source=desk-1").get_json()["events"]
+    assert [e["type"] for e in desk1_events] == ["enter_slouch", "enter_slouch"]
+    assert {e["source_id"] for e in desk1_events} == {"desk-1"}
+    desk2_events = client.get("/api/events?source=desk-2").get_json()["events"]
+    assert [e["type"] for e in desk2_events] == ["exit_slouch"]
+
+
+def test_tenants_are_isolated(client):
+    for user, probs in (("alice", [0.9, 0.9]), ("bob", [0.1])):
+        client.post(
+            "/api/dev/ingest-samples",
+            data=json.dumps([{"slouch_prob": p} for p in probs]),
+            content_type="application/json",
+            headers={"X-Posture-User": user},
+        )
+    assert {d["user"] for d in db.samples.find({})} == {"alice", "bob"}
+    bob_hub = app_module.broadcasters.setdefault("bob", db.Broadcaster())
+    bob_sub = bob_hub.subscribe()
+    try:
+        client.post(
+            "/api/dev/ingest-event?user=alice",
+            data=json.dumps({"type": "enter_slouch", "prob": 0.9}),
+            content_type="application/json",
+        )
+        assert bob_sub.empty()
+    finally:
+        bob_hub.unsubscribe(bob_sub)
+
+    alice = client.get("/api/latest", headers={"X-Posture-User": "alice"})
+    assert alice.get_json()["latest"]["is_slouch"] is True
+    bob = client.get("/api/latest?user=bob").get_json()["latest"]
+    assert bob["slouch_prob"] == pytest.approx(0.1)
+    assert client.get("/api/latest").get_json()["latest"] is None
+
+    series = client.get("/api/metrics?minutes=5&user=alice").get_json()["series"]
+    assert [p["slouch_prob"] for p in series] == [0.9, 0.9]
+    assert client.get("/api/summary?user=bob").get_json()["count"] == 1
+    assert client.get("/api/summary").get_json()["count"] == 0
+    alice_events = client.get("/api/events?user=alice").get_json()["events"]
+    assert [e["type"] for e in alice_events] == ["enter_slouch", "enter_slouch"]
+    bob_events = client.get("/api/events?user=bob").get_json()["events"]
+    assert [e["type"] for e in bob_events] == ["exit_slouch"]
+
+
+def test_history_reports_from_materialized_buckets(client):
+    day = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = day - timedelta(days=1, minutes=1)
+    samples = [
+        {"ts": (start + timedelta(seconds=i)).isoformat(), "slouch_prob": p}
+        for i, p in enumerate([0.1, 0.9, 0.9, 0.9, 0.1])
+    ]
+    client.post(
+        "/api/dev/ingest-samples?user=alice",
+        data=json.dumps(samples),
+        content_type="application/json",
+    )
+    # Past the lag behind real time that refreshes keep.
+    lag = timedelta(seconds=app_module.HISTORY_LAG_SECONDS + 1)
+    assert app_module.refresh_history(datetime.utcnow() + lag) == 5
+    url = f"/api/history?user=alice&from={(start - timedelta(days=1)).isoformat()}"
+
+    hours = client.get(url).get_json()
+    assert hours["granularity"] == "hour"
+    assert hours["watermark"] is not None
+    (bucket,) = hours["buckets"]
+    assert bucket["ts"] == start.replace(minute=0).isoformat() + "Z"
+    assert bucket["samples"] == 5 and bucket["slouch_samples"] == 3
+    assert bucket["slouch_seconds"] == pytest.approx(3.0)
+    assert bucket["good_seconds"] == pytest.approx(1.0)
+    assert bucket["longest_streak_s"] == pytest.approx(2.0)
+    # Three slouching seconds are debounced: only the initial exit_slouch.
+    assert bucket["events"] == 1 and bucket["slouch_events"] == 0
+
+    # Newer samples are folded incrementally, here into today's bucket.
+    client.post(
+        "/api/dev/ingest-samples?user=alice",
+        data=json.dumps([{"slouch_prob": 0.9}]),
+        content_type="application/json",
+    )
+    assert app_module.refresh_history(datetime.utcnow() + 2 * lag) == 1
+    days = client.get(f"{url}&granularity=day").get_json()
+    assert [b["samples"] for b in days["buckets"]] == [5, 1]
+    assert days["totals"]["samples"] == 6
+    assert days["totals"]["slouch_pct"] == pytest.approx(75.0)
+    assert client.get("/api/history").get_json()["buckets"] == []
+    assert client.get("/api/history?granularity=week").status_code == 400
+    assert client.get("/api/history?from=yesterday").status_code == 400
+
+
+def test_ingest_emits_debounced_events(client):
+    start = datetime.utcnow() - timedelta(seconds=60)
+    noisy = [0.58, 0.62, 0.59, 0.63, 0.57, 0.61, 0.6, 0.62]
+    sustained = [0.9] * 10
+    samples = [
+        {"ts": (start + timedelta(seconds=i)).isoformat(), "slouch_prob": p}
+        for i, p in enumerate([0.2] + noisy + sustained)
+    ]
+    client.post(
+        "/api/dev/ingest-samples",
+        data=json.dumps(samples),
+        content_type="application/json",
+    )
+    events = client.get("/api/events").get_json()["events"]
+    assert [e["type"] for e in events] == ["enter_slouch", "exit_slouch"]
+
+
+def test_metrics_columnar_matches_rows(client):
+    now = datetime.utcnow()
+    db.samples.insert_many(
+        [
+            {
+                "ts": now - timedelta(seconds=i),
+                "slouch_prob": (i % 10) / 10,
+                "ingested_at": now,
+            }
+            for i in range(300, 0, -1)
+        ]
+    )
+    for query in ("minutes=30", "minutes=30&bucket=10s", "minutes=30&max_points=40"):
+        rows = client.get(f"/api/metrics?{query}").get_json()
+        cols = client.get(f"/api/metrics?{query}&format=columnar").get_json()
+        assert cols["format"] == "columnar" and "series" not in cols
+        assert cols["cursor"] == rows["cursor"]
+        assert cols["p"] == [r["slouch_prob"] for r in rows["series"]]
+        assert [
+            db.from_epoch_ms(t).replace(microsecond=0).isoformat() + "Z"
+            for t in cols["ts"]
+        ] == [r["ts"] for r in rows["series"]]
+        if "bucket" in query:
+            assert cols["count"] == [r["count"] for r in rows["series"]]
+
+
+def test_health_and_ready(client):
+    assert client.get("/api/health").get_json() == {"ok": True}
+    res = client.get("/api/ready")
+    assert res.status_code == 200
+    assert res.get_json() == {"ok": True, "backend": "memory"}
+
+
+def test_ready_reports_unreachable_database(client, monkeypatch):
+    monkeypatch.setattr(db, "ensure_ready", lambda: False)
+    monkeypatch.setattr(db, "use_fake", False)
+    res = client.get("/api/ready")
+    assert res.status_code == 503
+    assert res.get_json() == {"ok": False, "backend": "mongodb"}
+
+
+def test_unreachable_database_is_retried_with_backoff(client, monkeypatch):
+    attempts = []
+    monkeypatch.setattr(db, "ensure_ready", lambda: attempts.append(1) and False)
+    monkeypatch.setattr(db, "use_fake", False)
+    monkeypatch.setitem(db.schema, "migrated", False)
+    monkeypatch.setattr(app_module, "connect_retry", {"at": 0.0, "delay": 1.0})
+
+    # Liveness never waits on MongoDB.
+    assert client.get("/api/health").status_code == 200
+    assert not attempts
+    # A failed attempt is not repeated by the next requests until it backs off.
+    client.get("/")
+    client.get("/")
+    assert len(attempts) == 1
+    assert app_module.connect_retry["delay"] == 2.0
+
+
+def test_prometheus_metrics_endpoint(client):
+    client.post(
+        "/api/dev/ingest-samples",
+        data=json.dumps({"source_id": "desk", "samples": [{"slouch_prob": 0.2}] * 3}),
+        content_type="application/json",
+    )
+    client.get("/api/latest")
+    res = client.get("/metrics")
+    assert res.status_code == 200
+    assert res.content_type.startswith("text/plain; version=0.0.4")
+    text = res.get_data(as_text=True)
+    assert 'posture_samples_ingested_total{source=""} 3' in text
+    assert (
+        'posture_http_request_seconds_count{route="/api/latest",'
+        'method="GET",status="200"} 1'
+    ) in text
+
+
+def test_segment_compression_serves_metrics_and_latest(client, monkeypatch):
+    monkeypatch.setattr(app_module, "COMPRESS_SAMPLES", True)
+    start = datetime.utcnow() - timedelta(seconds=100)
+    probs = [0.2 + 0.01 * (i % 3) for i in range(60)] + [0.9] * 40
+    client.post(
+        "/api/dev/ingest-samples",
+        data=json.dumps(
+            {
+                "source_id": "desk",
+                "samples": [
+                    {"ts": (start + timedelta(seconds=i)).isoformat(), "slouch_prob": p}
+                    for i, p in enumerate(probs)
+                ],
+            }
+        ),
+        content_type="application/json",
+    )
+    # 30s segments: 60 good samples -> 2, 40 slouch samples -> 2.
+    assert db.samples.count_documents({}) == 0
+    segs = list(db.segments.find({}))
+    assert [s["count"] for s in segs] == [31, 29, 31, 9]
+    assert sum(s["count"] for s in segs) == 100
+
+    latest = client.get("/api/latest?source=desk").get_json()["latest"]
+    assert latest["slouch_prob"] == pytest.approx(0.9)
+    assert latest["is_slouch"] is True
+
+    buckets = client.get("/api/metrics?minutes=5&bucket=5m").get_json()["series"]
+    assert sum(b["count"] for b in buckets) == 100
+    assert sum(b["slouch_frac"] * b["count"] for b in buckets) == pytest.approx(40)
+
+    raw = client.get("/api/metrics?minutes=5").get_json()
+    assert len(raw["series"]) == 8
+    assert raw["series"][-1]["slouch_prob"] == pytest.approx(0.9)
+
+    # The open segment is extended in place, not appended to.
+    client.post(
+        "/api/dev/ingest-samples",
+        data=json.dumps(
+            {
+                "source_id": "desk",
+                "samples": [
+                    {
+                        "ts": (start + timedelta(seconds=100)).isoformat(),
+                        "slouch_prob": 0.91,
+                    }
+                ],
+            }
+        ),
+        content_type="application/json",
+    )
+    # A single sample is held until the writer flushes.
+    assert [s["count"] for s in db.segments.find({})] == [31, 29, 31, 9]
+    app_module.segment_writer.flush()
+    assert [s["count"] for s in db.segments.find({})] == [31, 29, 31, 10]
+    # Open segments are re-sent until they close, extension included.
+    newer = client.get(f"/api/metrics?minutes=5&after={raw['cursor']}").get_json()
+    assert newer["series"][-1]["slouch_prob"] == pytest.approx(0.9009, abs=1e-3)
+    assert newer["series"][-1]["ts"] > raw["series"][-1]["ts"]
+
+
+def _export_samples(start, n, user=None):
+    docs = [
+        {
+            "ts": start + timedelta(seconds=i),
+            "source_id": "desk",
+            "slouch_prob": i / n,
+            "label": "slouch" if i / n >= 0.6 else "good",
+        }
+        for i in range(n)
+    ]
+    for doc in docs:
+        if user is not None:
+            doc["user"] = user
+    db.samples.insert_many(docs)
+
+
+def test_export_streams_ndjson_and_csv(client, monkeypatch):
+    monkeypatch.setattr(app_module, "EXPORT_CHUNK_ROWS", 10)
+    start = datetime(2025, 1, 6, 9)
+    _export_samples(start, 25)
+    _export_samples(start, 5, user="bob")
+
+    res = client.get("/api/export?from=2025-01-06T09:00:00&to=2025-01-06T10:00:00")
+    assert res.status_code == 200
+    assert res.is_streamed
+    assert res.mimetype == "application/x-ndjson"
+    assert "attachment" in res.headers["Content-Disposition"]
+    chunks = list(res.response)
+    assert len(chunks) == 3
+    lines = [json.loads(line) for line in b"".join(chunks).splitlines()]
+    assert len(lines) == 25
+    assert lines[0] == {
+        "ts": "2025-01-06T09:00:00.000Z",
+        "source_id": "desk",
+        "slouch_prob": 0.0,
+        "label": "good",
+    }
+
+    # ?to= is exclusive and the other tenant only sees its own rows.
+    res = client.get(
+        "/api/export?format=csv&from=2025-01-06T09:00:00&to=2025-01-06T09:00:03",
+        headers={"X-Posture-User": "bob"},
+    )
+    assert res.mimetype == "text/csv"
+    assert res.get_data(as_text=True).splitlines() == [
+        "ts,source_id,slouch_prob,label",
+        "2025-01-06T09:00:00.000Z,desk,0.0,good",
+        "2025-01-06T09:00:01.000Z,desk,0.2,good",
+        "2025-01-06T09:00:02.000Z,desk,0.4,good",
+    ]
+
+
+def test_export_columnar_formats_write_row_groups(client, monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setattr(app_module, "EXPORT_ROW_GROUP", 10)
+    start = datetime(2025, 1, 6, 9)
+    _export_samples(start, 25)
+
+    res = client.get("/api/export?format=parquet&from=2025-01-06T09:00:00")
+    assert res.status_code == 200
+    parquet = pq.ParquetFile(pa.BufferReader(res.get_data()))
+    assert parquet.metadata.num_row_groups == 3
+    table = parquet.read()
+    assert table.num_rows == 25
+    assert table.column("slouch_prob").to_pylist()[:2] == [0.0, 0.04]
+
+    res = client.get("/api/export?format=arrow&from=2025-01-06T09:00:00")
+    table = pa.ipc.open_stream(res.get_data()).read_all()
+    assert table.num_rows == 25
+    assert str(table.schema.field("ts").type) == "timestamp[ms, tz=UTC]"
+
+
+def test_export_rejects_bad_arguments(client, monkeypatch):
+    assert client.get("/api/export?kind=rollups").status_code == 400
+    assert client.get("/api/export?format=xlsx").status_code == 400
+    assert client.get("/api/export?from=yesterday").status_code == 400
+    monkeypatch.setattr(app_module, "COMPRESS_SAMPLES", True)
+    assert client.get("/api/export").status_code == 400
+    assert client.get("/api/export?kind=segments").status_code == 200